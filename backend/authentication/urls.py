@@ -1,11 +1,10 @@
-from knox import views as knox_views
-from .views import LoginApiView, ResetPasswordView, PasswordResetConfirmView
+from .views import LoginApiView, LogoutApiView, LogoutAllApiView, ResetPasswordView, PasswordResetConfirmView
 from django.urls import path
 
 urlpatterns = [
      path('login/', LoginApiView.as_view(), name='knox_login'),
-     path('logout/', knox_views.LogoutView.as_view(), name='knox_logout'),
-     path('logoutall/', knox_views.LogoutAllView.as_view(), name='knox_logoutall'),
+     path('logout/', LogoutApiView.as_view(), name='knox_logout'),
+     path('logoutall/', LogoutAllApiView.as_view(), name='knox_logoutall'),
      path('reset-password/', ResetPasswordView.as_view(), name='reset_password'),
      path('reset-password-confirm/', PasswordResetConfirmView.as_view(), name='reset_password_confirm'),
 ]
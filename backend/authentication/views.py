@@ -15,9 +15,25 @@ from knox import views as kv
 
 from .serializers import LoginSerializer, ResetPasswordSerializer, ResetPasswordConfirmSerializer
 from .models import FailedLoginAttempt
+from users.activity import client_ip, record_activity
 from users.models import User
 
 
+def record_session_activity(request, user, action_type, description, response):
+    record_activity(
+        user=user,
+        action_type=action_type,
+        description=f"{description} - {user.username}",
+        ip_address=client_ip(request),
+        user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        data={
+            'path': request.path,
+            'status_code': response.status_code,
+            'status_type': 'success' if response.status_code < 400 else 'error',
+        }
+    )
+
+
 class LoginApiView(kv.LoginView):
     permission_classes = [permissions.AllowAny]
     serializer_class = LoginSerializer
@@ -79,7 +95,24 @@ class LoginApiView(kv.LoginView):
         user = serializer.validated_data['user']
         login(request, user)
         response = super().post(request, format=None)
-        return Response(response.data, status=status.HTTP_200_OK)
+        response = Response(response.data, status=status.HTTP_200_OK)
+        record_session_activity(request, user, 'LOGIN', "Inicio de sesión con Knox", response)
+        return response
+
+
+class LogoutApiView(kv.LogoutView):
+    def post(self, request, format=None):
+        response = super().post(request, format=format)
+        record_session_activity(request, request.user, 'LOGOUT', "Cierre de sesión con Knox", response)
+        return response
+
+
+class LogoutAllApiView(kv.LogoutAllView):
+    def post(self, request, format=None):
+        response = super().post(request, format=format)
+        record_session_activity(
+            request, request.user, 'LOGOUT', "Cierre de todas las sesiones con Knox", response)
+        return response
 
 
 class ResetPasswordView(APIView):
@@ -0,0 +1,171 @@
+"""
+Caché de respuestas para los endpoints de dashboard y métricas.
+
+Cada dominio (sales, inventory, users) tiene un contador de versión en el
+caché de Django que se incrementa cuando cambian sus modelos: señales
+post_save/post_delete y, en los caminos que escriben con pymongo o
+bulk_create, llamadas explícitas a bump_version. La versión forma parte de
+la clave, así que una escritura invalida de inmediato las respuestas del
+dominio; el TTL sólo acota la antigüedad si se pierde una invalidación.
+
+Los misses simultáneos de una misma clave se coalescen: un hilo por proceso
+(y, con un caché compartido entre procesos, un solo proceso) recalcula
+mientras los demás esperan el resultado.
+"""
+import functools
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+KEY_PREFIX = 'response-cache'
+
+# Claves que algún hilo del proceso está calculando -> Event de fin
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _version_key(domain):
+    return f'{KEY_PREFIX}:version:{domain}'
+
+
+def _initial_version():
+    # Basada en el reloj para no reutilizar una versión anterior si el
+    # contador fue desalojado del caché.
+    return int(time.time() * 1000)
+
+
+def get_version(domain):
+    key = _version_key(domain)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(*domains):
+    """Invalida todas las respuestas cacheadas de los dominios indicados."""
+    for domain in domains:
+        key = _version_key(domain)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_version(), timeout=None)
+
+
+def _response_key(view, method, request, domains):
+    versions = ','.join(str(get_version(domain)) for domain in domains)
+    query = hashlib.md5(
+        request.query_params.urlencode().encode(), usedforsecurity=False
+    ).hexdigest()
+    return (f'{KEY_PREFIX}:{type(view).__name__}.{method.__name__}'
+            f':{versions}:{query}')
+
+
+def _wait_in_process(key, wait):
+    """
+    Registra al hilo como el que calcula `key` en este proceso (devuelve el
+    Event a señalizar al terminar) o espera a que termine el que ya lo hace
+    (devuelve None). El lock sólo se toma para consultar el registro.
+    """
+    with _inflight_lock:
+        done = _inflight.get(key)
+        if done is None:
+            done = _inflight[key] = threading.Event()
+            return done
+    done.wait(wait)
+    return None
+
+
+def _acquire(lock_key, token, wait, key):
+    """
+    Toma el lock entre procesos; devuelve (adquirido, datos cacheados si
+    otro proceso los dejó mientras se esperaba).
+    """
+    deadline = time.monotonic() + wait
+    while not cache.add(lock_key, token, timeout=wait):
+        if time.monotonic() >= deadline:
+            return False, None
+        time.sleep(0.05)
+        data = cache.get(key)
+        if data is not None:
+            return False, data
+    return True, None
+
+
+def _release(lock_key, token):
+    # El lock pudo expirar y tomarlo otro proceso: sólo se borra el propio.
+    # El caché de Django no tiene un borrado condicional atómico, así que
+    # queda una ventana mínima entre la lectura y el borrado.
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def _compute(key, compute, wait):
+    # Entre procesos: sólo quien toma el lock recalcula, el resto espera
+    lock_key = f'{key}:lock'
+    token = uuid.uuid4().hex
+    acquired, data = _acquire(lock_key, token, wait, key)
+    if data is not None:
+        return Response(data)
+    try:
+        response = compute()
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data,
+                      timeout=getattr(settings, 'RESPONSE_CACHE_TTL', 60))
+        return response
+    finally:
+        if acquired:
+            _release(lock_key, token)
+
+
+def _single_flight(key, compute):
+    """
+    Devuelve la respuesta cacheada o la calcula una sola vez con `compute`;
+    sólo se guardan las respuestas 200. Ningún lock queda tomado mientras
+    se calcula: los demás hilos del proceso esperan el Event del que
+    calcula y los otros procesos, el lock del caché.
+    """
+    wait = getattr(settings, 'RESPONSE_CACHE_WAIT', 5)
+    done = _wait_in_process(key, wait)
+    if done is None:
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        # El que calculaba tardó más de la espera o no obtuvo un 200
+        return _compute(key, compute, wait)
+
+    try:
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        return _compute(key, compute, wait)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        done.set()
+
+
+def cached_response(*domains):
+    """
+    Decorador para métodos de vista (APIView o ViewSet). Cachea los datos de
+    las respuestas 200 por vista, método y query params, bajo la versión
+    actual de los dominios de los que depende.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            key = _response_key(view, method, request, domains)
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+            return _single_flight(
+                key, lambda: method(view, request, *args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,91 @@
+"""
+Cliente MongoDB compartido por todo el proceso.
+
+El ORM abre y cierra su propia conexión por request (CONN_MAX_AGE=0), por lo
+que las operaciones que usan pymongo directamente (contadores, bulk_write,
+agregaciones) deben pasar por aquí para reutilizar un único pool de
+conexiones construido a partir de settings.DATABASES.
+"""
+import threading
+
+from django.db import connections
+from django_mongodb_backend.utils import OperationDebugWrapper  # type: ignore
+from pymongo import MongoClient  # type: ignore
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client(alias='default'):
+    """Devuelve el MongoClient del proceso, creándolo la primera vez."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                connection = connections[alias]
+                _client = MongoClient(
+                    **connection.get_connection_params(),
+                    driver=connection._driver_info(),
+                )
+    return _client
+
+
+def get_database(alias='default'):
+    # Se lee NAME en cada llamada para respetar la base de datos de tests.
+    return get_client(alias)[connections[alias].settings_dict['NAME']]
+
+
+def get_collection(name, alias='default'):
+    """
+    Colección del pool compartido. Con DEBUG (o dentro de assertNumQueries)
+    las operaciones quedan registradas en connection.queries igual que las
+    del ORM.
+    """
+    collection = get_database(alias)[name]
+    connection = connections[alias]
+    if connection.queries_logged:
+        return CollectionDebugWrapper(connection, collection)
+    return collection
+
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+class CollectionDebugWrapper(OperationDebugWrapper):
+    """
+    OperationDebugWrapper sólo registra los métodos que usa el ORM; aquí se
+    agregan los que usamos directamente sobre las colecciones.
+    """
+    wrapped_methods = {
+        'aggregate',
+        'bulk_write',
+        'count_documents',
+        'delete_many',
+        'delete_one',
+        'estimated_document_count',
+        'find',
+        'find_one',
+        'find_one_and_update',
+        'insert_many',
+        'insert_one',
+        'update_many',
+        'update_one',
+    }
+
+
+def _logged(method):
+    def wrapper(self, *args, **kwargs):
+        func = getattr(self.wrapped, method)
+        duration, retval = self.profile_call(func, args, kwargs)
+        self.log(method, duration, args, kwargs)
+        return retval
+    return wrapper
+
+
+for _method in CollectionDebugWrapper.wrapped_methods:
+    setattr(CollectionDebugWrapper, _method, _logged(_method))
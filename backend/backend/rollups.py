@@ -0,0 +1,102 @@
+"""
+Piezas comunes de los rollups diarios (ventas y actividad de usuarios).
+
+Un rollup guarda una fila por día y clave con totales que se mantienen con
+$inc; `RollupWriter` los recalcula desde los datos de origen sin vaciarlos
+antes. El día es la fecha local (settings.TIME_ZONE), guardada como
+medianoche igual que cualquier DateField.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo import DeleteOne, ReplaceOne, UpdateOne  # type: ignore
+
+from backend.mongo import get_collection
+
+
+def rollup_day(value):
+    """Fecha local de un datetime (o date) como medianoche sin zona horaria."""
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return datetime(value.year, value.month, value.day)
+
+
+def day_expression(field):
+    """Expresión de agregación con el día local de `field`, como medianoche."""
+    tz = settings.TIME_ZONE
+    return {'$dateFromParts': {
+        'year': {'$year': {'date': field, 'timezone': tz}},
+        'month': {'$month': {'date': field, 'timezone': tz}},
+        'day': {'$dayOfMonth': {'date': field, 'timezone': tz}},
+    }}
+
+
+class RollupWriter:
+    """
+    Escribe filas recalculadas de un rollup sin vaciarlo antes, para que los
+    $inc que llegan mientras tanto (ventas, lotes de actividad) no se pierdan
+    ni se cuenten dos veces fuera de la fila que se está reemplazando.
+
+    No se usa $merge: exige un índice único no parcial sobre las claves y
+    los de unique_together que crea el backend son parciales.
+    """
+    batch_size = 1000
+
+    def __init__(self, table, keys, totals):
+        self.collection = get_collection(table)
+        self.keys = keys
+        self.totals = totals
+        self.seen = set()
+        self.operations = []
+
+    def _key(self, row):
+        return {key: row[key] for key in self.keys}
+
+    def _write(self, operation):
+        self.operations.append(operation)
+        if len(self.operations) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # Ordenado: un $inc de add() debe aplicarse después del reemplazo.
+        if self.operations:
+            self.collection.bulk_write(self.operations)
+            self.operations = []
+
+    def replace(self, row):
+        """Deja la fila de la clave con los totales recalculados."""
+        key = self._key(row)
+        self.seen.add(tuple(key.values()))
+        self._write(ReplaceOne(
+            key, {**key, **{total: row[total] for total in self.totals}}, upsert=True))
+
+    def add(self, row):
+        """Suma los totales a la fila de la clave si ya se recalculó en esta pasada."""
+        key = self._key(row)
+        if tuple(key.values()) not in self.seen:
+            self.replace(row)
+            return
+        self._write(UpdateOne(
+            key, {'$inc': {total: row[total] for total in self.totals}}, upsert=True))
+
+    def delete_stale(self, match):
+        """
+        Borra las filas del rango que no se recalcularon (ya no tienen
+        movimientos). Cada borrado compara los totales leídos, así una fila
+        que recibió un $inc entretanto se conserva.
+        """
+        self.flush()
+        projection = {field: 1 for field in (*self.keys, *self.totals)}
+        for row in self.collection.find(match, projection):
+            if tuple(row[key] for key in self.keys) in self.seen:
+                continue
+            self._write(DeleteOne(row))
+        self.flush()
+        return self.collection.count_documents(match)
+
+
+def grouped_rows(cursor):
+    """Aplana {'_id': {...claves}, ...totales} de un $group."""
+    for row in cursor:
+        yield {**row.pop('_id'), **row}
@@ -0,0 +1,181 @@
+"""
+Búsqueda por tokens para los listados con más consultas (productos,
+clientes y proveedores).
+
+Cada documento guarda en `search_tokens` los prefijos (edge n-grams) de las
+palabras de sus campos de búsqueda, normalizadas sin tildes ni mayúsculas,
+más la palabra completa marcada con '='. El arreglo tiene un índice
+multikey, así que una búsqueda es un {'$all': [...]} sobre el índice en
+lugar de un $regex por campo, y funciona con cualquier mongod (no requiere
+Atlas Search ni índices de texto).
+
+Como los tokens son prefijos, cada término calza con el comienzo de una
+palabra ("cuad" encuentra "Cuaderno", "derno" no); a diferencia del
+SearchFilter con icontains, no se buscan subcadenas dentro de una palabra.
+
+La relevancia es la cantidad de términos que coinciden con una palabra
+completa; los empates se ordenan por _id.
+"""
+import re
+import unicodedata
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import models
+from django.db.models import Case, IntegerField, Value, When
+from django_mongodb_backend.fields import ArrayField  # type: ignore
+from rest_framework.filters import SearchFilter
+
+from backend.mongo import get_collection
+
+MIN_GRAM = 2
+MAX_GRAM = 20
+WORD_MARK = '='
+
+_separators = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(value):
+    """Texto sin tildes, en minúsculas y sin mayúsculas especiales."""
+    decomposed = unicodedata.normalize('NFKD', str(value))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def words(value):
+    return [word for word in _separators.split(normalize(value)) if word]
+
+
+def search_tokens(*values):
+    """
+    Tokens de búsqueda de los valores: prefijos de MIN_GRAM a MAX_GRAM
+    caracteres de cada palabra y la palabra completa marcada. Los valores
+    con dígitos se indexan también sin separadores, para buscar RUT o
+    teléfonos con o sin puntos y guiones.
+    """
+    tokens = set()
+    for value in values:
+        if value in (None, ''):
+            continue
+        value_words = words(value)
+        compact = ''.join(value_words)
+        if len(value_words) > 1 and any(c.isdigit() for c in compact):
+            value_words.append(compact)
+        for word in value_words:
+            word = word[:MAX_GRAM]
+            tokens.add(WORD_MARK + word)
+            tokens.update(word[:size] for size in range(MIN_GRAM, len(word) + 1))
+    return sorted(tokens)
+
+
+def query_terms(text):
+    """
+    Términos de una búsqueda, recortados igual que los tokens. Las palabras
+    de menos de MIN_GRAM caracteres no tienen token y se ignoran.
+    """
+    return list(dict.fromkeys(
+        word[:MAX_GRAM] for word in words(text) if len(word) >= MIN_GRAM))
+
+
+class SearchIndexedModel(models.Model):
+    """
+    Modelo con `search_tokens`. Las subclases definen `search_index_fields`
+    y agregan un models.Index sobre search_tokens en su Meta.
+    """
+    search_index_fields = ()
+
+    search_tokens = ArrayField(
+        models.CharField(max_length=MAX_GRAM + 1),
+        default=list, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def update_search_tokens(self):
+        self.search_tokens = search_tokens(
+            *(getattr(self, name) for name in self.search_index_fields))
+
+    def save(self, *args, **kwargs):
+        self.update_search_tokens()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & set(self.search_index_fields):
+            kwargs['update_fields'] = {*update_fields, 'search_tokens'}
+        super().save(*args, **kwargs)
+
+
+def searchable_models():
+    return [model for model in apps.get_models() if issubclass(model, SearchIndexedModel)]
+
+
+def _filter_stages(queryset):
+    """
+    Etapas ($lookup de relaciones y $match) con las que el backend aplica
+    los filtros del queryset, para agregarlas a un pipeline propio.
+    """
+    if not queryset.query.where:
+        return []
+    compiler = queryset.query.get_compiler(using=queryset.db)
+    compiler.pre_sql_setup()
+    query = compiler.build_query()
+    stages = list(query.lookup_pipeline or [])
+    for subquery in query.subqueries or ():
+        stages.extend(subquery.get_pipeline())
+    if query.match_mql:
+        stages.append({'$match': query.match_mql})
+    return stages
+
+
+def matching_ids(queryset, text, limit=None):
+    """
+    Ids de los documentos del queryset (con sus filtros) que contienen todos
+    los términos, del más al menos relevante. Devuelve None si la búsqueda
+    no tiene términos.
+    """
+    terms = query_terms(text)
+    if not terms:
+        return None
+    try:
+        filters = _filter_stages(queryset)
+    except EmptyResultSet:
+        return []
+    limit = limit or getattr(settings, 'SEARCH_MAX_RESULTS', 1000)
+    pipeline = [
+        # Primero los tokens, que usan el índice; luego los demás filtros
+        {'$match': {'search_tokens': {'$all': terms}}},
+        *filters,
+        {'$project': {'score': {'$size': {'$setIntersection': [
+            '$search_tokens', [WORD_MARK + term for term in terms]]}}}},
+        {'$sort': {'score': -1, '_id': 1}},
+        {'$limit': limit},
+    ]
+    collection = get_collection(queryset.model._meta.db_table)
+    return [row['_id'] for row in collection.aggregate(pipeline)]
+
+
+class TokenSearchFilter(SearchFilter):
+    """
+    SearchFilter sobre search_tokens para los modelos SearchIndexedModel
+    (los demás usan el SearchFilter normal). Sin ?ordering, los resultados
+    quedan ordenados por relevancia; debe ir después de OrderingFilter y de
+    DjangoFilterBackend, cuyos filtros se aplican antes de tomar a lo más
+    SEARCH_MAX_RESULTS coincidencias.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if not issubclass(queryset.model, SearchIndexedModel):
+            return super().filter_queryset(request, queryset, view)
+
+        text = request.query_params.get(self.search_param, '')
+        ids = matching_ids(queryset, text)
+        if ids is None:
+            return queryset
+
+        if not ids:
+            return queryset.none()
+        queryset = queryset.filter(pk__in=ids)
+        if request.query_params.get('ordering'):
+            return queryset
+        return queryset.order_by(Case(
+            *(When(pk=pk, then=Value(rank)) for rank, pk in enumerate(ids)),
+            output_field=IntegerField(),
+        ))
@@ -61,7 +61,6 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'users.middleware.UserActivityMiddleware',
-    'authentication.middleware.KnoxActivityMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -189,4 +188,78 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 
-PASSWORD_RESET_TIMEOUT = 60 * 15
\ No newline at end of file
+PASSWORD_RESET_TIMEOUT = 60 * 15
+
+# Folios de ventas
+# Tamaño del bloque de folios que reserva cada proceso (1 = correlativo estricto).
+FOLIO_BLOCK_SIZE = config('FOLIO_BLOCK_SIZE', default=1, cast=int)
+
+# Máximo de ventas por lote en /api/sales/sales/bulk/
+SALES_BULK_MAX_ITEMS = config('SALES_BULK_MAX_ITEMS', default=500, cast=int)
+
+# Lectura de dashboard y reportes desde los rollups diarios de ventas.
+# Activar después de poblarlos con `manage.py rebuild_sales_rollups`.
+SALES_ROLLUPS_READ = config('SALES_ROLLUPS_READ', default=False, cast=bool)
+
+# Caché de respuestas de dashboard y métricas (backend/cache.py).
+# Con varios procesos usar un caché compartido (Redis o Memcached) para que
+# las invalidaciones y la coalescencia de misses alcancen a todos.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+# Antigüedad máxima de una respuesta cacheada, en segundos.
+RESPONSE_CACHE_TTL = config('RESPONSE_CACHE_TTL', default=60, cast=int)
+# Tiempo máximo que un miss espera a que otro proceso termine de calcular.
+RESPONSE_CACHE_WAIT = config('RESPONSE_CACHE_WAIT', default=5, cast=int)
+
+# Segundos que se reutiliza el total de un listado filtrado (users/pagination.py)
+PAGINATION_COUNT_TTL = config('PAGINATION_COUNT_TTL', default=30, cast=int)
+
+# Importación de planillas Excel (inventory/importers.py)
+IMPORT_CHUNK_SIZE = config('IMPORT_CHUNK_SIZE', default=1000, cast=int)
+IMPORT_MAX_ERRORS = config('IMPORT_MAX_ERRORS', default=500, cast=int)
+
+# Importaciones en segundo plano (inventory/jobs.py, run_import_worker)
+IMPORT_JOB_POLL_INTERVAL = config('IMPORT_JOB_POLL_INTERVAL', default=2, cast=float)
+IMPORT_JOB_STALE_AFTER = config('IMPORT_JOB_STALE_AFTER', default=600, cast=int)
+
+# Clave natural de la carga masiva con ?mode=upsert, por modelo
+IMPORT_UPSERT_KEYS = {
+    'product': ['normalized_name', 'supplier'],
+    'supply': ['normalized_name', 'category'],
+}
+
+# Búsqueda por tokens (backend/search.py): máximo de coincidencias consideradas
+SEARCH_MAX_RESULTS = config('SEARCH_MAX_RESULTS', default=1000, cast=int)
+
+# Registro de actividad de usuarios (users/activity.py). Los eventos se
+# insertan por lotes desde un hilo; OVERFLOW: 'block', 'drop_view' o 'spill'.
+ACTIVITY_SINK = {
+    'ASYNC': config('ACTIVITY_SINK_ASYNC', default=True, cast=bool),
+    'MAX_QUEUE': config('ACTIVITY_SINK_MAX_QUEUE', default=10000, cast=int),
+    'BATCH_SIZE': config('ACTIVITY_SINK_BATCH_SIZE', default=500, cast=int),
+    'FLUSH_INTERVAL': config('ACTIVITY_SINK_FLUSH_INTERVAL', default=1.0, cast=float),
+    'OVERFLOW': config('ACTIVITY_SINK_OVERFLOW', default='block'),
+    'BLOCK_TIMEOUT': config('ACTIVITY_SINK_BLOCK_TIMEOUT', default=2.0, cast=float),
+    'SPILL_FILE': config('ACTIVITY_SINK_SPILL_FILE', default=str(BASE_DIR / 'user_activity.spill')),
+}
+
+# Qué peticiones registra UserActivityMiddleware / @log_activity
+# (users/activity.py). Se aplica la primera regla que calza; 'policy' es
+# 'always', 'sample' (con 'rate' en %), 'aggregate' (un contador por
+# usuario, ruta y minuto) o 'never'. Sin regla que calce se usa 'always',
+# así que por defecto cada petición deja su fila (VIEW incluido). Ej.:
+#   {'path': r'^/api/sales/dashboard/', 'methods': ['GET'], 'policy': 'sample', 'rate': 5}
+# Para contar las lecturas sin guardar una fila VIEW por petición:
+#   {'methods': ['GET', 'HEAD', 'OPTIONS'], 'policy': 'aggregate'}
+ACTIVITY_LOG_POLICIES = []
+
+# Tamaño máximo (bytes, en JSON) de data.request_data en UserActivity; lo
+# que lo supera se guarda como {'truncated': True, 'size': ..., 'preview': ...}
+ACTIVITY_REQUEST_DATA_MAX_BYTES = config('ACTIVITY_REQUEST_DATA_MAX_BYTES', default=2048, cast=int)
+# Días de actividad en la colección principal; `manage.py archive_activity`
+# mueve lo anterior a colecciones mensuales.
+ACTIVITY_RETENTION_DAYS = config('ACTIVITY_RETENTION_DAYS', default=90, cast=int)
@@ -0,0 +1,25 @@
+"""Utilidades compartidas por los tests de las apps."""
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+
+class ConstantQueriesMixin:
+    """
+    Verifica que el número de consultas de un listado no crezca con la
+    cantidad de elementos: un campo anidado nuevo sin prefetch lo rompe.
+    Requiere un self.client autenticado.
+    """
+
+    def _queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {'page_size': 100})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url, create):
+        create()
+        single = self._queries(url)
+        for _ in range(4):
+            create()
+        self.assertEqual(self._queries(url), single)
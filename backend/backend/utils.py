@@ -5,4 +5,8 @@ class MongoJSONEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, ObjectId):
             return str(obj)
-        return super().default(obj)
\ No newline at end of file
+        return super().default(obj)
+
+def normalize_name(value):
+    """Nombre para comparar sin distinguir mayúsculas ni espacios repetidos."""
+    return ' '.join(str(value).split()).casefold()
@@ -0,0 +1,96 @@
+"""
+Métricas del dashboard de inventario.
+
+Los conteos y el listado de stock bajo de productos salen de un solo $facet
+sobre la colección de productos; los conteos de insumos y mermas y las
+mermas recientes se leen en paralelo, sólo con los campos necesarios, en
+un pool de hilos compartido por todos los requests.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone as dt_timezone
+
+from django.utils import timezone
+
+from backend.mongo import get_collection
+from .models import Product, Shrinkage, StockStatus, Supply
+
+# Stock bajo o agotado, según el stock_status indexado
+LOW_STOCK = [StockStatus.LOW.value, StockStatus.OUT.value]
+
+# Las lecturas de insumos y mermas corren aquí mientras el request hace el
+# $facet de productos; se crea una vez por proceso, no por request.
+_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix='inventory-metrics')
+
+
+def _count(collection, match):
+    # Sin filtro alcanza con el conteo de la metadata de la colección
+    if not match:
+        return collection.estimated_document_count()
+    return collection.count_documents(match)
+
+
+def _product_stats(collection, match, low_stock_limit):
+    low_stock = {'$match': {'stock_status': {'$in': LOW_STOCK}}}
+    pipeline = [
+        {'$match': match},
+        {'$facet': {
+            'total': [{'$count': 'value'}],
+            'low_stock_count': [low_stock, {'$count': 'value'}],
+            'low_stock': [
+                low_stock,
+                {'$limit': low_stock_limit},
+                {'$project': {'_id': 0, 'product': '$name', 'stock': 1}},
+            ],
+        }},
+    ]
+    return next(collection.aggregate(pipeline), {})
+
+
+def _recent_shrinkages(collection, match, limit):
+    cursor = collection.find(
+        match,
+        {'_id': 0, 'product': 1, 'quantity': 1, 'observation': 1, 'created_at': 1},
+    ).sort('_id', -1).limit(limit)
+    return list(cursor)
+
+
+def _isoformat(value):
+    if value is None:
+        return None
+    if timezone.is_naive(value):
+        # pymongo devuelve las fechas en UTC sin zona horaria
+        value = value.replace(tzinfo=dt_timezone.utc)
+    return value.isoformat()
+
+
+def _first(facet):
+    return facet[0]['value'] if facet else 0
+
+
+def inventory_metrics(category=None, low_stock_limit=10, recent_limit=5):
+    """Métricas del dashboard, opcionalmente acotadas a una categoría."""
+    match = {'category': category} if category else {}
+    products = get_collection(Product._meta.db_table)
+    supplies = get_collection(Supply._meta.db_table)
+    shrinkages = get_collection(Shrinkage._meta.db_table)
+
+    amount_supplies = _executor.submit(_count, supplies, match)
+    amount_shrinkages = _executor.submit(_count, shrinkages, match)
+    recent = _executor.submit(_recent_shrinkages, shrinkages, match, recent_limit)
+    stats = _product_stats(products, match, low_stock_limit)
+
+    return {
+        "amount_products": _first(stats.get('total')),
+        "amount_supplies": amount_supplies.result(),
+        "amount_shrinkages": amount_shrinkages.result(),
+        "low_stock_products_count": _first(stats.get('low_stock_count')),
+        "recent_shrinkages": [
+            {
+                "product_name": row.get('product'),
+                "quantity": row.get('quantity'),
+                "reason": row.get('observation'),
+                "created_at": _isoformat(row.get('created_at')),
+            } for row in recent.result()
+        ],
+        "low_stock_chart_data": stats.get('low_stock', []),
+    }
@@ -1,17 +1,12 @@
 import django_filters
-from .models import Product
-from django.db import models
+from .models import Product, StockStatus
 
 
 class ProductFilter(django_filters.FilterSet):
 
     status_stock = django_filters.ChoiceFilter(
-        method='filter_status_stock',
-        choices=[
-            ('normal', 'Stock Normal'),
-            ('low', 'Stock Bajo'),
-            ('out', 'Sin Stock'),
-        ]
+        field_name='stock_status',
+        choices=StockStatus.choices
     )
 
     class Meta:
@@ -19,22 +14,3 @@ class ProductFilter(django_filters.FilterSet):
         fields = {
             'category': ['exact'],
         }
-
-    def filter_status_stock(self, queryset, name, value):
-        """Filtrar productos por estado de stock combinado"""
-        if value == 'normal':
-            # Stock normal: stock >= min_stock y stock > 0
-            return queryset.filter(
-                stock__gte=models.F('min_stock'),
-                stock__gt=0
-            )
-        elif value == 'low':
-            # Stock bajo: stock < min_stock pero stock > 0
-            return queryset.filter(
-                stock__lt=models.F('min_stock'),
-                stock__gt=0
-            )
-        elif value == 'out':
-            # Sin stock: stock = 0
-            return queryset.filter(stock=0)
-        return queryset
@@ -0,0 +1,412 @@
+"""
+Importación de planillas Excel en streaming.
+
+La planilla se abre en modo read-only y se recorre como generador en bloques
+de IMPORT_CHUNK_SIZE filas: cada bloque se valida con el serializer del
+modelo y se inserta con un bulk_create, por lo que la memoria usada no
+depende del tamaño del archivo.
+
+En modo estricto (el de los endpoints) se mantiene el todo o nada: una
+primera pasada sólo valida y junta errores, y la segunda inserta recién si
+no hubo ninguno. En modo parcial cada bloque válido se inserta de inmediato
+y las filas con errores se informan al final.
+
+Con mode='upsert' cada bloque se escribe con un bulk_write no ordenado de
+UpdateOne(upsert=True) sobre la clave natural del modelo (upsert_key o
+settings.IMPORT_UPSERT_KEYS), así que volver a subir una planilla actualiza
+el catálogo en lugar de duplicarlo.
+"""
+from itertools import islice
+
+import openpyxl
+from django.conf import settings
+from django.db import IntegrityError, connections
+from pymongo import UpdateOne  # type: ignore
+from rest_framework.exceptions import ValidationError
+
+from backend.cache import bump_version
+from backend.mongo import get_collection
+from backend.search import SearchIndexedModel
+from backend.utils import normalize_name
+from suppliers.models import Supplier
+from .serializers import ProductSerializer, ShrinkageSerializer, SupplySerializer
+from .models import stock_status_for
+from .stock import record_initial_stock, refresh_stock_status
+
+
+# Campos calculados desde los de la planilla, que en upsert se reescriben
+DERIVED_FIELDS = ('normalized_name', 'search_tokens')
+
+
+class InvalidWorkbook(Exception):
+    pass
+
+
+class RowError(Exception):
+    pass
+
+
+class ImportResult:
+    def __init__(self, max_errors):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.rows = 0
+        self.errors = []
+        self.error_count = 0
+        self.max_errors = max_errors
+
+    @property
+    def imported(self):
+        """Filas escritas o ya al día (en upsert, sin cambios)."""
+        return self.created + self.updated + self.unchanged
+
+    def add_error(self, number, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(f"Fila {number}: {message}")
+
+    @property
+    def error_messages(self):
+        omitted = self.error_count - len(self.errors)
+        if omitted > 0:
+            return self.errors + [f"... y {omitted} errores más."]
+        return self.errors
+
+
+def _is_empty(row):
+    return not row or all(cell is None or str(cell).strip() == '' for cell in row)
+
+
+def _serializer_messages(errors):
+    if not isinstance(errors, dict):
+        errors = {'non_field_errors': errors}
+    for field, messages in errors.items():
+        if not isinstance(messages, list):
+            messages = [messages]
+        for message in messages:
+            if field == 'non_field_errors':
+                yield str(message)
+            else:
+                yield f"{field}: {message}"
+
+
+class ExcelImporter:
+    """
+    Base de los importadores. Cada subclase define el serializer y
+    `parse_row`, que convierte una fila en datos para el serializer o lanza
+    RowError con el mensaje a informar.
+    """
+    serializer_class = None
+    modes = ('insert',)
+    # Campos de la clave natural para mode='upsert'
+    upsert_key = ()
+    # Campos de la planilla que en upsert sólo se escriben al insertar
+    upsert_insert_only = ()
+
+    def __init__(self, chunk_size=None, mode='insert'):
+        if mode not in self.modes:
+            raise ValueError(f"Modo no soportado: {mode}")
+        self.mode = mode
+        self.chunk_size = chunk_size or getattr(settings, 'IMPORT_CHUNK_SIZE', 1000)
+        self.max_errors = getattr(settings, 'IMPORT_MAX_ERRORS', 500)
+        self.total_rows = None
+
+    @property
+    def model(self):
+        return self.serializer_class.Meta.model
+
+    def parse_row(self, row):
+        raise NotImplementedError
+
+    def prepare_chunk(self, rows):
+        """Se llama con las filas de cada bloque antes de `parse_row`."""
+
+    def get_upsert_key(self):
+        keys = getattr(settings, 'IMPORT_UPSERT_KEYS', {})
+        return tuple(keys.get(self.model._meta.model_name, self.upsert_key))
+
+    def build_instance(self, validated_data):
+        instance = self.model(**validated_data)
+        # bulk_create y bulk_write no pasan por save()
+        if hasattr(instance, 'normalized_name'):
+            instance.normalized_name = normalize_name(instance.name)
+        if hasattr(instance, 'stock_status'):
+            instance.stock_status = stock_status_for(instance.stock, instance.min_stock)
+        if isinstance(instance, SearchIndexedModel):
+            instance.update_search_tokens()
+        return instance
+
+    def iter_rows(self, excel_file):
+        """Genera (número de fila, fila) sin cargar la planilla completa."""
+        excel_file.seek(0)
+        try:
+            workbook = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+        except Exception as exc:
+            raise InvalidWorkbook("Archivo inválido o corrupto.") from exc
+        try:
+            sheet = workbook.active
+            # Según la dimensión declarada en el archivo; puede no venir
+            self.total_rows = max(sheet.max_row - 1, 0) if sheet.max_row else None
+            rows = sheet.iter_rows(min_row=2, values_only=True)
+            for number, row in enumerate(rows, start=2):
+                if not _is_empty(row):
+                    yield number, row
+        finally:
+            workbook.close()
+
+    def iter_chunks(self, excel_file, result):
+        """Bloques de filas ya validadas: listas de (número, datos validados)."""
+        rows = self.iter_rows(excel_file)
+        validator = self.serializer_class()
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return
+
+            self.prepare_chunk([row for _, row in chunk])
+            valid = []
+            for number, row in chunk:
+                result.rows += 1
+                try:
+                    valid.append((number, validator.run_validation(self.parse_row(row))))
+                except RowError as exc:
+                    result.add_error(number, str(exc))
+                except ValidationError as exc:
+                    for message in _serializer_messages(exc.detail):
+                        result.add_error(number, message)
+            yield valid
+
+    def on_created(self, instances):
+        """Se llama con los registros insertados (ya con pk) de cada bloque."""
+
+    def insert(self, chunk):
+        instances = [self.build_instance(data) for _, data in chunk]
+        if instances:
+            self.model.objects.bulk_create(instances)
+            self.on_created(instances)
+        return len(instances)
+
+    def upsert(self, chunk, result):
+        """Un bulk_write no ordenado de UpdateOne(upsert=True) por bloque."""
+        if not chunk:
+            return
+        connection = connections[self.model.objects.db]
+        fields = [field for field in self.model._meta.concrete_fields if not field.primary_key]
+        key = [self.model._meta.get_field(name).column for name in self.get_upsert_key()]
+
+        operations, instances, keys = [], [], []
+        for _, data in chunk:
+            instance = self.build_instance(data)
+            instances.append(instance)
+            values = {
+                field.column: field.get_db_prep_save(getattr(instance, field.attname), connection)
+                for field in fields
+            }
+            # Sólo se pisan los campos de la planilla; el resto queda con su
+            # valor por defecto al insertar y no se toca al actualizar.
+            updated = {field.column for field in fields
+                       if (field.name in data or field.name in DERIVED_FIELDS)
+                       and field.name not in self.upsert_insert_only}
+            keys.append({column: values[column] for column in key})
+            operations.append(UpdateOne(
+                keys[-1],
+                {
+                    '$set': {column: values[column] for column in updated},
+                    '$setOnInsert': {column: value for column, value in values.items()
+                                     if column not in updated and column not in key},
+                },
+                upsert=True,
+            ))
+
+        collection = get_collection(self.model._meta.db_table)
+        written = collection.bulk_write(operations, ordered=False)
+        if written.matched_count and hasattr(self.model, 'stock_status'):
+            # stock_status de los existentes, según el stock ya guardado
+            refresh_stock_status(self.model, {'$or': keys})
+        result.created += written.upserted_count
+        result.updated += written.modified_count
+        result.unchanged += written.matched_count - written.modified_count
+
+        created = []
+        for index, pk in written.upserted_ids.items():
+            instances[index].pk = pk
+            created.append(instances[index])
+        if created:
+            self.on_created(created)
+
+    def write(self, chunk, result):
+        if self.mode == 'upsert':
+            self.upsert(chunk, result)
+        else:
+            result.created += self.insert(chunk)
+
+    def run(self, excel_file, strict=True, progress=None):
+        """
+        Importa la planilla y devuelve un ImportResult. `progress`, si se
+        indica, se llama tras cada bloque con la fase ('validation' o
+        'import') y el resultado parcial.
+        """
+        result = ImportResult(self.max_errors)
+        if strict:
+            # Primera pasada: sólo validación
+            for _ in self.iter_chunks(excel_file, result):
+                if progress:
+                    progress('validation', result)
+            if result.error_count:
+                return result
+            result = ImportResult(self.max_errors)
+
+        try:
+            for chunk in self.iter_chunks(excel_file, result):
+                self.write(chunk, result)
+                if progress:
+                    progress('import', result)
+        finally:
+            if result.created or result.updated:
+                # bulk_create y bulk_write no disparan señales
+                bump_version('inventory')
+        return result
+
+
+class ProductImporter(ExcelImporter):
+    """
+    Los proveedores se resuelven con un mapa nombre normalizado -> id que
+    se carga una sola vez; los que faltan en cada bloque se crean con un
+    único bulk_create.
+    """
+    serializer_class = ProductSerializer
+    modes = ('insert', 'upsert')
+    upsert_key = ('normalized_name', 'supplier')
+    # El stock de un producto existente sólo cambia por movimientos
+    upsert_insert_only = ('stock',)
+    default_supplier = "Sin proveedor"
+
+    def __init__(self, chunk_size=None, mode='insert'):
+        super().__init__(chunk_size, mode)
+        self.suppliers = None
+
+    @staticmethod
+    def supplier_name(value):
+        # Usar "Sin proveedor" si está vacío
+        return str(value).strip() if value else ProductImporter.default_supplier
+
+    def load_suppliers(self):
+        self.suppliers = {}
+        for supplier in Supplier.objects.only('id', 'name').order_by('pk'):
+            self.suppliers.setdefault(normalize_name(supplier.name), supplier.id)
+
+    def prepare_chunk(self, rows):
+        if self.suppliers is None:
+            self.load_suppliers()
+
+        missing = {}
+        for row in rows:
+            if len(row) < 7:
+                continue
+            name = self.supplier_name(row[6])
+            missing.setdefault(normalize_name(name), name)
+        for key in list(missing):
+            if key in self.suppliers:
+                del missing[key]
+        if not missing:
+            return
+
+        new = [Supplier(name=name, normalized_name=key) for key, name in missing.items()]
+        for supplier in new:
+            supplier.update_search_tokens()
+        try:
+            Supplier.objects.bulk_create(new)
+            for supplier in new:
+                self.suppliers[supplier.normalized_name] = supplier.id
+        except IntegrityError:
+            # Otro proceso creó alguno de estos proveedores entretanto
+            self.load_suppliers()
+            still_missing = [supplier for supplier in new
+                             if supplier.normalized_name not in self.suppliers]
+            for supplier in still_missing:
+                supplier.pk = None
+                supplier.save()
+                self.suppliers[supplier.normalized_name] = supplier.id
+
+    def parse_row(self, row):
+        if len(row) < 7:
+            raise RowError("Datos incompletos.")
+
+        name, price_clp, iva, stock, min_stock, category, supplier_name = row[:7]
+
+        if not all([name, price_clp, iva, stock, min_stock, category]):
+            raise RowError("Uno o más campos requeridos están vacíos.")
+
+        # Convertir IVA
+        iva = str(iva).strip().upper() in ["VERDADERO", "TRUE", "1"]
+
+        supplier_id = self.suppliers[normalize_name(self.supplier_name(supplier_name))]
+
+        return {
+            "name": name,
+            "price_clp": price_clp,
+            "iva": iva,
+            "stock": stock,
+            "min_stock": min_stock,
+            "category": category,
+            "supplier": str(supplier_id),
+        }
+
+    def on_created(self, instances):
+        record_initial_stock(instances)
+
+    def build_instance(self, validated_data):
+        supplier = (validated_data.get('supplier') or '').strip()
+        validated_data['supplier'] = supplier or self.default_supplier
+        return super().build_instance(validated_data)
+
+
+class SupplyImporter(ExcelImporter):
+    serializer_class = SupplySerializer
+    modes = ('insert', 'upsert')
+    upsert_key = ('normalized_name', 'category')
+
+    def parse_row(self, row):
+        if len(row) < 4:
+            raise RowError("Datos incompletos.")
+
+        name, category, stock, min_stock = row[:4]
+
+        if not all([name, category, stock, min_stock]):
+            raise RowError("Uno o más campos requeridos están vacíos.")
+
+        return {
+            "name": name,
+            "category": category,
+            "stock": stock,
+            "min_stock": min_stock,
+        }
+
+
+class ShrinkageImporter(ExcelImporter):
+    serializer_class = ShrinkageSerializer
+
+    def parse_row(self, row):
+        if len(row) < 4:
+            raise RowError("Datos incompletos. Se requieren al menos 4 columnas.")
+
+        product, price, quantity, category = row[:4]
+        observation = row[4] if len(row) > 4 else ""
+
+        if not all([product, price, quantity, category]):
+            raise RowError("Uno o más campos requeridos están vacíos.")
+
+        try:
+            price = float(price)
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            raise RowError("Precio o cantidad con formato incorrecto.")
+
+        return {
+            "product": str(product),
+            "price": price,
+            "quantity": quantity,
+            "category": str(category),
+            "observation": observation or "",
+        }
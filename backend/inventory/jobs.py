@@ -0,0 +1,124 @@
+"""
+Importaciones de planillas en segundo plano.
+
+El endpoint guarda la planilla en GridFS y crea un ImportJob pendiente en la
+colección `jobs`. El comando run_import_worker toma los jobs de a uno con
+find_one_and_update, de modo que dos workers nunca procesan el mismo, los
+importa por bloques y va dejando el progreso en el mismo documento.
+"""
+import logging
+from datetime import timedelta
+
+import gridfs  # type: ignore
+from django.conf import settings
+from django.utils import timezone
+from pymongo import ReturnDocument  # type: ignore
+
+from backend.mongo import get_collection, get_database
+from .importers import InvalidWorkbook, ProductImporter, ShrinkageImporter, SupplyImporter
+from .models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+IMPORTERS = {
+    ImportJob.Kind.PRODUCTS: ProductImporter,
+    ImportJob.Kind.SUPPLIES: SupplyImporter,
+    ImportJob.Kind.SHRINKAGES: ShrinkageImporter,
+}
+
+
+def _files():
+    return gridfs.GridFS(get_database(), collection='import_files')
+
+
+def enqueue(kind, upload, user=None, strict=True, mode='insert'):
+    """Guarda el archivo subido y crea el job pendiente."""
+    file_id = _files().put(upload, filename=upload.name)
+    return ImportJob.objects.create(
+        kind=kind,
+        strict=strict,
+        mode=mode,
+        file_id=file_id,
+        filename=upload.name,
+        created_by=user if user and user.is_authenticated else None,
+    )
+
+
+def fail_stale_jobs():
+    """
+    Marca como fallidos los jobs cuyo worker dejó de informar progreso. No
+    se reintentan: parte de las filas pudo haberse insertado ya.
+    """
+    limit = timezone.now() - timedelta(
+        seconds=getattr(settings, 'IMPORT_JOB_STALE_AFTER', 600))
+    return ImportJob.objects.filter(
+        status=ImportJob.Status.RUNNING, heartbeat_at__lt=limit
+    ).update(
+        status=ImportJob.Status.FAILED,
+        message="El proceso de importación dejó de responder.",
+        finished_at=timezone.now(),
+    )
+
+
+def claim_next():
+    """Toma el job pendiente más antiguo y lo marca en proceso."""
+    now = timezone.now()
+    document = get_collection(ImportJob._meta.db_table).find_one_and_update(
+        {'status': ImportJob.Status.PENDING},
+        {'$set': {'status': ImportJob.Status.RUNNING,
+                  'started_at': now, 'heartbeat_at': now}},
+        sort=[('created_at', 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+    if document is None:
+        return None
+    return ImportJob.objects.get(pk=document['_id'])
+
+
+def process(job):
+    """Importa la planilla del job y deja en él el resultado."""
+    importer = IMPORTERS[job.kind](mode=job.mode)
+    jobs = ImportJob.objects.filter(pk=job.pk)
+
+    def progress(phase, result):
+        jobs.update(
+            phase=phase,
+            total_rows=importer.total_rows,
+            rows_processed=result.rows,
+            created_count=result.created,
+            updated_count=result.updated,
+            unchanged_count=result.unchanged,
+            error_count=result.error_count,
+            errors=result.error_messages,
+            heartbeat_at=timezone.now(),
+        )
+
+    fields = {}
+    try:
+        result = importer.run(_files().get(job.file_id), strict=job.strict, progress=progress)
+    except InvalidWorkbook as e:
+        fields.update(status=ImportJob.Status.FAILED, message=str(e))
+    except Exception:
+        logger.exception("Error procesando el job de importación %s", job.pk)
+        fields.update(status=ImportJob.Status.FAILED,
+                      message="Error inesperado al procesar la planilla.")
+    else:
+        fields.update(
+            total_rows=importer.total_rows,
+            rows_processed=result.rows,
+            created_count=result.created,
+            updated_count=result.updated,
+            unchanged_count=result.unchanged,
+            error_count=result.error_count,
+            errors=result.error_messages,
+        )
+        if result.error_count and not result.imported:
+            fields.update(status=ImportJob.Status.FAILED,
+                          message="La planilla tiene errores; no se importó ninguna fila.")
+        else:
+            fields.update(status=ImportJob.Status.DONE)
+
+    _files().delete(job.file_id)
+    jobs.update(file_id=None, finished_at=timezone.now(), **fields)
+    job.refresh_from_db()
+    return job
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne  # type: ignore
+
+from backend.mongo import get_collection
+from backend.utils import normalize_name
+from inventory.models import Product, Supply
+
+
+class Command(BaseCommand):
+    help = ("Completa el nombre normalizado de productos e insumos, usado como "
+            "clave natural en la carga masiva con mode=upsert.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Cantidad de actualizaciones por bulk_write.'
+        )
+
+    def handle(self, *args, **options):
+        for model in (Product, Supply):
+            collection = get_collection(model._meta.db_table)
+            updated = 0
+            operations = []
+            for document in collection.find({}, {'name': 1, 'normalized_name': 1}):
+                normalized = normalize_name(document.get('name') or '')
+                if document.get('normalized_name') == normalized:
+                    continue
+                operations.append(UpdateOne(
+                    {'_id': document['_id']}, {'$set': {'normalized_name': normalized}}))
+                if len(operations) >= options['batch_size']:
+                    updated += collection.bulk_write(operations, ordered=False).modified_count
+                    operations = []
+            if operations:
+                updated += collection.bulk_write(operations, ordered=False).modified_count
+
+            self.stdout.write(self.style.SUCCESS(
+                f"{model._meta.verbose_name_plural}: {updated} nombres normalizados."))
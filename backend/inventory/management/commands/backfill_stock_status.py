@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from backend.cache import bump_version
+from inventory.models import Product, Supply
+from inventory.stock import refresh_stock_status
+
+
+class Command(BaseCommand):
+    help = ("Recalcula el estado de stock (normal, bajo, agotado) de todos los "
+            "productos e insumos a partir de stock y min_stock.")
+
+    def handle(self, *args, **options):
+        for model in (Product, Supply):
+            refresh_stock_status(model, {})
+            self.stdout.write(self.style.SUCCESS(
+                f"{model._meta.verbose_name_plural}: estado de stock recalculado."))
+        bump_version('inventory')
@@ -3,8 +3,10 @@ from datetime import datetime, timedelta
 import random
 from faker import Faker
 
-from inventory.models import Product, Supply, Shrinkage
+from inventory.models import Product, Supply, Shrinkage, stock_status_for
 from suppliers.models import Supplier, ReturnSupplier, ReturnSupplierDetail
+from backend.utils import normalize_name
+from inventory.stock import record_initial_stock
 
 
 class Command(BaseCommand):
@@ -39,14 +41,18 @@ class Command(BaseCommand):
 
         suppliers = []
         for i in range(8):
+            name = f"Proveedor {self.fake.company()}"
             suppliers.append(Supplier(
-                name=f"Proveedor {self.fake.company()}",
+                name=name,
+                normalized_name=normalize_name(name),
                 rut=f"{random.randint(70, 79)}.{random.randint(100, 999)}.{random.randint(100,999)}-{random.randint(0,9)}",
                 address=self.fake.address(),
                 phone=f"+56 9 {random.randint(10000000, 99999999)}",
                 email=self.fake.company_email()
             ))
 
+        for supplier in suppliers:
+            supplier.update_search_tokens()
         Supplier.objects.bulk_create(suppliers)
         self.stdout.write(self.style.SUCCESS(f"Se crearon {len(suppliers)} proveedores correctamente."))
 
@@ -77,7 +83,12 @@ class Command(BaseCommand):
                 }
             ))
 
+        for product in products:
+            product.normalized_name = normalize_name(product.name)
+            product.stock_status = stock_status_for(product.stock, product.min_stock)
+            product.update_search_tokens()
         Product.objects.bulk_create(products)
+        record_initial_stock(products)
         self.stdout.write(self.style.SUCCESS(f"Se crearon {len(products)} productos correctamente."))
 
     # ------------------------------------------------------------
@@ -97,6 +108,9 @@ class Command(BaseCommand):
                 min_stock=random.randint(2, 20)
             ))
 
+        for supply in supplies:
+            supply.normalized_name = normalize_name(supply.name)
+            supply.stock_status = stock_status_for(supply.stock, supply.min_stock)
         Supply.objects.bulk_create(supplies)
         self.stdout.write(self.style.SUCCESS(f"Se crearon {len(supplies)} insumos correctamente."))
 
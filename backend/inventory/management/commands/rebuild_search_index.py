@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import UpdateOne  # type: ignore
+
+from backend.mongo import get_collection
+from backend.search import search_tokens, searchable_models
+
+
+class Command(BaseCommand):
+    help = ("Recalcula los tokens de búsqueda (search_tokens) de productos, "
+            "clientes y proveedores.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'models', nargs='*',
+            help='Modelos a recalcular (p. ej. inventory.Product). Por defecto, todos.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Cantidad de actualizaciones por bulk_write.'
+        )
+
+    def handle(self, *args, **options):
+        models = searchable_models()
+        if options['models']:
+            labels = {label.lower() for label in options['models']}
+            unknown = labels - {model._meta.label_lower for model in models}
+            if unknown:
+                raise CommandError(f"Modelos sin índice de búsqueda: {', '.join(sorted(unknown))}")
+            models = [model for model in models if model._meta.label_lower in labels]
+
+        for model in models:
+            columns = [model._meta.get_field(name).column for name in model.search_index_fields]
+            collection = get_collection(model._meta.db_table)
+            updated = 0
+            operations = []
+            for document in collection.find({}, {column: 1 for column in columns + ['search_tokens']}):
+                tokens = search_tokens(*(document.get(column) for column in columns))
+                if document.get('search_tokens') == tokens:
+                    continue
+                operations.append(UpdateOne(
+                    {'_id': document['_id']}, {'$set': {'search_tokens': tokens}}))
+                if len(operations) >= options['batch_size']:
+                    updated += collection.bulk_write(operations, ordered=False).modified_count
+                    operations = []
+            if operations:
+                updated += collection.bulk_write(operations, ordered=False).modified_count
+
+            self.stdout.write(self.style.SUCCESS(
+                f"{model._meta.verbose_name_plural}: {updated} documentos actualizados."))
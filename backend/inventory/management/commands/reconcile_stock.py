@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from inventory.models import StockMovement
+from inventory.stock import movements, reconcile, record_movements
+
+
+class Command(BaseCommand):
+    help = ("Compara el stock de cada producto con la suma de sus movimientos "
+            "(StockMovement) e informa las diferencias.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--adjust', action='store_true',
+            help=('Registra un ajuste por cada diferencia para que el libro '
+                  'coincida con el stock actual (p. ej. al partir con datos '
+                  'previos al libro).')
+        )
+
+    def handle(self, *args, **options):
+        drift = reconcile()
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("El stock coincide con los movimientos."))
+            return
+
+        for row in drift:
+            self.stdout.write(self.style.WARNING(
+                f"{row.get('name')} ({row['_id']}): stock {row.get('stock')}, "
+                f"movimientos {row['ledger']}, diferencia {(row.get('stock') or 0) - row['ledger']:+d}."))
+
+        if options['adjust']:
+            record_movements([
+                movement
+                for row in drift
+                for movement in movements(
+                    {row['_id']: (row.get('stock') or 0) - row['ledger']},
+                    StockMovement.Reason.ADJUSTMENT, ('reconcile', ''))
+            ])
+            self.stdout.write(self.style.SUCCESS(
+                f"Se registraron ajustes para {len(drift)} productos."))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"{len(drift)} productos con diferencias."))
@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from inventory.jobs import claim_next, fail_stale_jobs, process
+
+
+class Command(BaseCommand):
+    help = ("Procesa las importaciones de planillas encoladas en la colección "
+            "jobs. Sin --once queda consultando cada --interval segundos.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Procesa los jobs pendientes y termina.'
+        )
+        parser.add_argument(
+            '--interval', type=float,
+            default=getattr(settings, 'IMPORT_JOB_POLL_INTERVAL', 2),
+            help='Segundos de espera cuando no hay jobs pendientes.'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Esperando importaciones...')
+        try:
+            while True:
+                stale = fail_stale_jobs()
+                if stale:
+                    self.stdout.write(self.style.WARNING(
+                        f"{stale} importaciones quedaron sin respuesta y se marcaron fallidas."))
+
+                job = claim_next()
+                if job is None:
+                    if options['once']:
+                        return
+                    time.sleep(options['interval'])
+                    continue
+
+                job = process(job)
+                message = (
+                    f"Job {job.pk} ({job.get_kind_display()}): {job.get_status_display()}, "
+                    f"{job.created_count} creados, {job.updated_count} actualizados, "
+                    f"{job.error_count} errores."
+                )
+                style = self.style.SUCCESS if job.status == job.Status.DONE else self.style.WARNING
+                self.stdout.write(style(message))
+        except KeyboardInterrupt:
+            self.stdout.write('Worker detenido.')
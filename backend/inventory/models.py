@@ -1,7 +1,39 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
+from django_mongodb_backend.fields import ObjectIdField  # type: ignore
 
+from backend.search import SearchIndexedModel
+from backend.utils import normalize_name
+
+
+class StockStatus(models.TextChoices):
+    NORMAL = 'normal', 'Stock Normal'
+    LOW = 'low', 'Stock Bajo'
+    OUT = 'out', 'Sin Stock'
+
+
+def stock_status_for(stock, min_stock):
+    if stock <= 0:
+        return StockStatus.OUT
+    if stock < min_stock:
+        return StockStatus.LOW
+    return StockStatus.NORMAL
+
+
+# Misma regla que stock_status_for, para updates con pipeline en MongoDB
+STOCK_STATUS_EXPRESSION = {'$switch': {
+    'branches': [
+        {'case': {'$lte': ['$stock', 0]}, 'then': StockStatus.OUT.value},
+        {'case': {'$lt': ['$stock', '$min_stock']}, 'then': StockStatus.LOW.value},
+    ],
+    'default': StockStatus.NORMAL.value,
+}}
+
+
+class Product(SearchIndexedModel):
+    search_index_fields = ('name', 'category')
 
-class Product(models.Model):
     name = models.CharField(max_length=255)
     price_clp = models.PositiveIntegerField()
     iva = models.BooleanField(default=True)
@@ -10,6 +42,24 @@ class Product(models.Model):
     category = models.CharField(max_length=100)
     supplier = models.CharField(max_length=100)
     data = models.JSONField(null=True, blank=True)  # Campo de datos dinamicos
+    # Clave natural para la carga masiva en modo upsert
+    normalized_name = models.CharField(max_length=255, blank=True, editable=False)
+    # Derivado de stock y min_stock; se recalcula en cada escritura de ambos
+    stock_status = models.CharField(
+        max_length=10, choices=StockStatus.choices,
+        default=StockStatus.OUT, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['normalized_name', 'supplier']),
+            models.Index(fields=['stock_status', 'category']),
+            models.Index(fields=['search_tokens']),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        self.stock_status = stock_status_for(self.stock, self.min_stock)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -18,11 +68,60 @@ class Product(models.Model):
         return self.stock < self.min_stock
 
 
+class StockMovement(models.Model):
+    """
+    Registro append-only de cada cambio de stock de un producto. La suma de
+    `delta` por producto es su stock (ver reconcile_stock).
+    """
+
+    class Reason(models.TextChoices):
+        INITIAL = 'initial', 'Stock inicial'
+        SALE = 'sale', 'Venta'
+        SALE_UPDATE = 'sale_update', 'Modificación de venta'
+        RETURN = 'return', 'Devolución'
+        ADJUSTMENT = 'adjustment', 'Ajuste manual'
+        REVERSAL = 'reversal', 'Reversión'
+
+    product = models.ForeignKey(
+        Product, on_delete=models.DO_NOTHING, related_name='movements')
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=Reason.choices)
+    # Documento que originó el movimiento (p. ej. 'sale' y su id)
+    source_type = models.CharField(max_length=30, blank=True)
+    source_id = models.CharField(max_length=24, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['product', 'created_at']),
+            models.Index(fields=['source_type', 'source_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.delta:+d} ({self.reason})"
+
+
 class Supply(models.Model):
     name = models.CharField(max_length=100)
     category = models.CharField(max_length=50)
     stock = models.PositiveIntegerField(default=0)
     min_stock = models.PositiveIntegerField(default=0)
+    normalized_name = models.CharField(max_length=100, blank=True, editable=False)
+    stock_status = models.CharField(
+        max_length=10, choices=StockStatus.choices,
+        default=StockStatus.OUT, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['normalized_name', 'category']),
+            models.Index(fields=['stock_status', 'category']),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        self.stock_status = stock_status_for(self.stock, self.min_stock)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -41,3 +140,53 @@ class Shrinkage(models.Model):
 
     def __str__(self):
         return self.product
+
+
+class ImportJob(models.Model):
+    """Carga masiva de planillas procesada en segundo plano (run_import_worker)."""
+
+    class Kind(models.TextChoices):
+        PRODUCTS = 'products', 'Productos'
+        SUPPLIES = 'supplies', 'Insumos'
+        SHRINKAGES = 'shrinkages', 'Mermas'
+
+    class Status(models.TextChoices):
+        PENDING = 'PE', 'Pendiente'
+        RUNNING = 'RU', 'En proceso'
+        DONE = 'DO', 'Terminado'
+        FAILED = 'FA', 'Fallido'
+
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    status = models.CharField(
+        max_length=2, choices=Status.choices, default=Status.PENDING)
+    strict = models.BooleanField(default=True)
+    mode = models.CharField(max_length=10, default='insert')
+    # Archivo guardado en GridFS hasta que el job termina
+    file_id = ObjectIdField(null=True, blank=True)
+    filename = models.CharField(max_length=255, blank=True)
+
+    phase = models.CharField(max_length=20, blank=True)
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    rows_processed = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    unchanged_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    message = models.TextField(blank=True)
+
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL,
+        null=True, blank=True, related_name='import_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'jobs'
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} - {self.get_status_display()}"
@@ -1,6 +1,7 @@
 from rest_framework import serializers
-from .models import Product, Supply, Shrinkage
+from .models import ImportJob, Product, Supply, Shrinkage
 from suppliers.models import Supplier
+from .stock import InsufficientStock, record_initial_stock, refresh_stock_status, set_stock
 from bson import ObjectId
 import re
 
@@ -28,7 +29,7 @@ class ProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ['search_tokens']
 
     def get_supplier_name(self, obj):
         return obj.supplier
@@ -52,9 +53,20 @@ class ProductSerializer(serializers.ModelSerializer):
             'Sin proveedor' if supplier_name is None or not supplier_name.strip()
             else supplier_name.strip()
         )
-        return super().create(validated_data)
+        product = super().create(validated_data)
+        record_initial_stock([product])
+        return product
 
     def update(self, instance, validated_data):
+        # El stock cambia con un $inc registrado en el libro, no con el save
+        stock = validated_data.pop('stock', None)
+        if stock is not None and stock != instance.stock:
+            try:
+                set_stock(instance, stock)
+            except InsufficientStock:
+                raise serializers.ValidationError(
+                    {"stock": "El stock cambió mientras se editaba. Vuelva a intentarlo."})
+
         if 'supplier' in validated_data:
             supplier_name = validated_data['supplier']
 
@@ -63,7 +75,19 @@ class ProductSerializer(serializers.ModelSerializer):
             else:
                 validated_data['supplier'] = supplier_name.strip()
 
-        return super().update(instance, validated_data)
+        # Sólo se guardan los campos recibidos: un save completo pisaría el
+        # stock con el valor leído y perdería los $inc concurrentes
+        fields = list(validated_data)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        if fields:
+            if 'name' in fields:
+                fields.append('normalized_name')
+            instance.save(update_fields=fields)
+            if 'min_stock' in fields:
+                # Con el stock guardado, que puede haber cambiado entretanto
+                refresh_stock_status(Product, {'_id': instance.pk})
+        return instance
 
 
 class SupplySerializer(serializers.ModelSerializer):
@@ -92,3 +116,22 @@ class ShrinkageSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    id = ObjectIdField(read_only=True)
+    created_by = ObjectIdField(source='created_by_id', read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        exclude = ['file_id']
+
+    def get_progress(self, obj):
+        """Porcentaje de filas recorridas en la fase actual, si se conoce el total."""
+        if obj.status == ImportJob.Status.DONE:
+            return 100
+        if not obj.total_rows:
+            return None
+        return min(100, round(obj.rows_processed * 100 / obj.total_rows))
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+
+from backend.cache import bump_version
+from .models import Product, Shrinkage, Supply
+
+
+# Invalida las respuestas cacheadas de métricas de inventario
+def bump_inventory_version(sender, **kwargs):
+    bump_version('inventory')
+
+
+for model in (Product, Supply, Shrinkage):
+    post_save.connect(bump_inventory_version, sender=model)
+    post_delete.connect(bump_inventory_version, sender=model)
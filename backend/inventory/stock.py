@@ -0,0 +1,201 @@
+"""
+Movimientos atómicos de stock sobre la colección de productos.
+
+Todas las funciones reciben un diccionario por producto y lo aplican con
+updates atómicos ($inc por pipeline), en lugar de leer el producto,
+modificarlo en Python y guardarlo completo.
+
+Cada cambio aplicado queda además en el libro StockMovement (un insert por
+operación) con su motivo y documento de origen; `reconcile` recalcula el
+stock desde ese libro y `stock_at` da el stock a una fecha.
+"""
+import logging
+
+from django.utils import timezone
+from pymongo import UpdateOne  # type: ignore
+
+from backend.cache import bump_version
+from backend.mongo import get_collection
+from .models import STOCK_STATUS_EXPRESSION, Product, StockMovement
+
+logger = logging.getLogger(__name__)
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id):
+        super().__init__(f"No hay suficiente stock para el producto {product_id}")
+        self.product_id = product_id
+
+
+def _products():
+    return get_collection(Product._meta.db_table)
+
+
+def _inc(delta):
+    """
+    Update con pipeline equivalente a {'$inc': {'stock': delta}} que además
+    recalcula stock_status en la misma escritura atómica.
+    """
+    return [
+        {'$set': {'stock': {'$add': ['$stock', delta]}}},
+        {'$set': {'stock_status': STOCK_STATUS_EXPRESSION}},
+    ]
+
+
+def refresh_stock_status(model, filter):
+    """Recalcula stock_status desde los valores guardados (p. ej. tras cambiar min_stock)."""
+    get_collection(model._meta.db_table).update_many(
+        filter, [{'$set': {'stock_status': STOCK_STATUS_EXPRESSION}}])
+
+
+def reserve_stock(quantities, reason=None, source=None):
+    """Descuenta {product_id: cantidad} de todos los productos o de ninguno."""
+    adjust_stock({pk: -qty for pk, qty in quantities.items()}, reason, source)
+
+
+def release_stock(quantities, reason=None, source=None):
+    """Devuelve stock a los productos (operación inversa de reserve_stock)."""
+    adjust_stock({pk: qty for pk, qty in quantities.items()}, reason, source)
+
+
+def adjust_stock(deltas, reason=None, source=None):
+    """
+    Aplica {product_id: delta} todo o nada. Con `reason` los cambios
+    aplicados se registran en StockMovement, con `source` = (tipo, id) del
+    documento que los origina; sin él, quien llama debe registrarlos
+    (record_movements).
+
+    Los descuentos (delta < 0) son un $inc (ver _inc) condicionado a
+    stock >= cantidad y se aplican de a uno: si el filtro no coincide (falta
+    stock o el producto ya no existe) se revierten los ya aplicados y se
+    lanza InsufficientStock. Los incrementos no pueden fallar por stock y
+    van juntos en un bulk_write.
+    """
+    decrements = [(pk, -delta) for pk, delta in deltas.items() if delta < 0]
+    increments = [(pk, delta) for pk, delta in deltas.items() if delta > 0]
+    if not decrements and not increments:
+        return
+
+    try:
+        _decrement(decrements)
+        if increments:
+            _products().bulk_write([
+                UpdateOne({'_id': pk}, _inc(qty))
+                for pk, qty in increments
+            ], ordered=False)
+    finally:
+        # Las escrituras directas no disparan las señales de Product
+        bump_version('inventory')
+
+    if reason:
+        changes = [(pk, -qty) for pk, qty in decrements] + increments
+        record_movements(movements(dict(changes), reason, source))
+
+
+def _decrement(decrements):
+    applied = []
+    try:
+        for pk, qty in decrements:
+            result = _products().update_one(
+                {'_id': pk, 'stock': {'$gte': qty}}, _inc(-qty))
+            if not result.matched_count:
+                raise InsufficientStock(pk)
+            applied.append((pk, -qty))
+    except Exception:
+        _revert(applied)
+        raise
+
+
+def _revert(changes):
+    operations = [
+        UpdateOne({'_id': pk}, _inc(-delta))
+        for pk, delta in changes
+    ]
+    if operations:
+        _products().bulk_write(operations, ordered=False)
+
+
+def movements(deltas, reason, source=None, created_at=None):
+    """StockMovement sin guardar para {product_id: delta}."""
+    source_type, source_id = source or ('', '')
+    created_at = created_at or timezone.now()
+    return [
+        StockMovement(
+            product_id=pk, delta=delta, reason=reason,
+            source_type=source_type, source_id=str(source_id or ''),
+            created_at=created_at,
+        )
+        for pk, delta in deltas.items() if delta
+    ]
+
+
+def record_movements(items):
+    """
+    Escribe los movimientos en un solo insert sin interrumpir la operación,
+    cuyo stock ya quedó aplicado. Si falla, reconcile_stock lo informa.
+    """
+    if not items:
+        return
+    try:
+        StockMovement.objects.bulk_create(items)
+    except Exception:
+        logger.exception("No se pudieron registrar los movimientos de stock")
+
+
+def record_initial_stock(products):
+    """Movimiento inicial para productos recién creados con stock."""
+    record_movements([
+        movement
+        for product in products
+        for movement in movements(
+            {product.pk: product.stock}, StockMovement.Reason.INITIAL,
+            ('product', product.pk))
+    ])
+
+
+def set_stock(product, stock, source=None):
+    """
+    Lleva el stock de un producto a `stock` con un $inc por la diferencia
+    respecto del valor leído, registrado como ajuste manual.
+    """
+    adjust_stock({product.pk: stock - product.stock},
+                 StockMovement.Reason.ADJUSTMENT, source or ('product', product.pk))
+    product.stock = stock
+
+
+def stock_at(moment, product_ids=None):
+    """Stock de cada producto a la fecha indicada, sumando el libro: {id: stock}."""
+    match = {'created_at': {'$lte': moment}}
+    if product_ids is not None:
+        match['product_id'] = {'$in': list(product_ids)}
+    pipeline = [
+        {'$match': match},
+        {'$group': {'_id': '$product_id', 'stock': {'$sum': '$delta'}}},
+    ]
+    return {
+        row['_id']: row['stock']
+        for row in get_collection(StockMovement._meta.db_table).aggregate(pipeline)
+    }
+
+
+def reconcile():
+    """
+    Compara en una sola agregación el stock de cada producto con la suma de
+    sus movimientos. Devuelve los productos con diferencia:
+    [{'_id', 'name', 'stock', 'ledger'}].
+    """
+    pipeline = [
+        {'$lookup': {
+            'from': StockMovement._meta.db_table,
+            'localField': '_id',
+            'foreignField': 'product_id',
+            'pipeline': [{'$group': {'_id': None, 'total': {'$sum': '$delta'}}}],
+            'as': 'ledger',
+        }},
+        {'$project': {
+            'name': 1,
+            'stock': 1,
+            'ledger': {'$ifNull': [{'$first': '$ledger.total'}, 0]},
+        }},
+        {'$match': {'$expr': {'$ne': ['$stock', '$ledger']}}},
+    ]
+    return list(_products().aggregate(pipeline))
@@ -1,11 +1,38 @@
-from django.test import TestCase
-from inventory.models import Product, Supplier, Supply, Shrinkage, ReturnSupplier
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+import openpyxl
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from inventory.importers import SupplyImporter
+from inventory.jobs import claim_next, fail_stale_jobs
+from inventory.models import ImportJob, Product, Supply, Shrinkage
+from suppliers.models import Supplier, ReturnSupplier
 from bson import ObjectId
-from inventory.serializers import ReturnSupplierSerializer
+from suppliers.serializers import ReturnSupplierSerializer
+from users.models import User
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
 
+
+def supply_workbook(rows, name='insumos.xlsx'):
+    """Planilla de insumos (nombre, categoría, stock, stock mínimo)."""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['Nombre', 'Categoría', 'Stock', 'Stock mínimo'])
+    for row in rows:
+        sheet.append(row)
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return SimpleUploadedFile(
+        name, buffer.getvalue(),
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+
 class SupplierModelTestCase(TestCase):
     def setUp(self):
         self.supplier = Supplier.objects.create(
@@ -269,4 +296,254 @@ class ReturnSupplierViewSetTestCase(APITestCase):
         detail_url = reverse("return-detail", args=[str(self.return_supplier.id)])
         response = self.client.delete(detail_url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
-        self.assertEqual(ReturnSupplier.objects.count(), 0)
\ No newline at end of file
+        self.assertEqual(ReturnSupplier.objects.count(), 0)
+
+
+class ImportJobTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='bodega',
+            password='testpass123',
+            national_id='11111111-1',
+            email='bodega@example.com',
+            position='Bodeguero'
+        )
+        self.client.force_authenticate(self.user)
+        self.url = reverse('supply-bulk-upload-excel') + '?background=true'
+
+    def run_worker(self):
+        call_command('run_import_worker', '--once', stdout=StringIO())
+
+    def test_background_upload_is_processed_by_worker(self):
+        upload = supply_workbook([['Papel', 'Oficina', 10, 2], ['Tinta', 'Oficina', 5, 1]])
+        response = self.client.post(self.url, {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], ImportJob.Status.PENDING)
+        self.assertEqual(Supply.objects.count(), 0)
+
+        self.run_worker()
+        response = self.client.get(reverse('import-job-detail', args=[response.data['id']]))
+        self.assertEqual(response.data['status'], ImportJob.Status.DONE)
+        self.assertEqual(response.data['created_count'], 2)
+        self.assertEqual(response.data['progress'], 100)
+        self.assertEqual(Supply.objects.count(), 2)
+        # La planilla se borra de GridFS al terminar
+        self.assertIsNone(ImportJob.objects.get().file_id)
+
+    def test_strict_job_with_errors_fails_without_importing(self):
+        upload = supply_workbook([['Papel', 'Oficina', 10, 2], ['Tinta', 'Oficina', 'muchos', 1]])
+        self.client.post(self.url, {'file': upload}, format='multipart')
+
+        self.run_worker()
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, ImportJob.Status.FAILED)
+        self.assertEqual(job.error_count, 1)
+        self.assertTrue(job.errors[0].startswith('Fila 3:'))
+        self.assertEqual(Supply.objects.count(), 0)
+
+    def test_jobs_are_claimed_once_in_order(self):
+        for name in ('primero.xlsx', 'segundo.xlsx'):
+            self.client.post(
+                self.url, {'file': supply_workbook([['Papel', 'Oficina', 1, 1]], name)},
+                format='multipart')
+
+        first, second = claim_next(), claim_next()
+        self.assertEqual((first.filename, second.filename), ('primero.xlsx', 'segundo.xlsx'))
+        self.assertEqual(first.status, ImportJob.Status.RUNNING)
+        self.assertIsNone(claim_next())
+
+    def test_stale_running_job_is_failed(self):
+        now = timezone.now()
+        stale = ImportJob.objects.create(
+            kind=ImportJob.Kind.SUPPLIES, status=ImportJob.Status.RUNNING,
+            heartbeat_at=now - timedelta(hours=1))
+        alive = ImportJob.objects.create(
+            kind=ImportJob.Kind.SUPPLIES, status=ImportJob.Status.RUNNING,
+            heartbeat_at=now)
+
+        self.assertEqual(fail_stale_jobs(), 1)
+        stale.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual(stale.status, ImportJob.Status.FAILED)
+        self.assertIsNotNone(stale.finished_at)
+        self.assertEqual(alive.status, ImportJob.Status.RUNNING)
+
+
+class ExcelImporterTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='bodega',
+            password='testpass123',
+            national_id='11111111-1',
+            email='bodega@example.com',
+            position='Bodeguero'
+        )
+        self.client.force_authenticate(self.user)
+        self.url = reverse('supply-bulk-upload-excel')
+        self.rows = [
+            ['Papel', 'Oficina', 10, 2],
+            ['Tinta', 'Oficina', 'muchos', 1],
+            [None, None, None, None],
+            ['Clips', 'Oficina', 3, 1],
+            ['Corchetes', '', 4, 1],
+            ['Lápiz', 'Oficina', 8, 2],
+        ]
+
+    def test_reads_in_chunks_and_numbers_errors_by_row(self):
+        calls = []
+        result = SupplyImporter(chunk_size=2).run(
+            supply_workbook(self.rows), strict=False,
+            progress=lambda phase, result: calls.append((phase, result.rows)))
+
+        # La fila vacía no cuenta; 5 filas en bloques de 2
+        self.assertEqual(calls, [('import', 2), ('import', 4), ('import', 5)])
+        self.assertEqual(result.created, 3)
+        self.assertEqual(result.error_count, 2)
+        self.assertTrue(result.errors[0].startswith('Fila 3: stock:'))
+        self.assertEqual(result.errors[1], 'Fila 6: Uno o más campos requeridos están vacíos.')
+        self.assertEqual(
+            sorted(Supply.objects.values_list('name', flat=True)), ['Clips', 'Lápiz', 'Papel'])
+
+    def test_strict_validates_everything_before_inserting(self):
+        calls = []
+        result = SupplyImporter(chunk_size=2).run(
+            supply_workbook(self.rows), strict=True,
+            progress=lambda phase, result: calls.append(phase))
+
+        self.assertEqual(calls, ['validation'] * 3)
+        self.assertEqual(result.error_count, 2)
+        self.assertEqual(Supply.objects.count(), 0)
+
+        valid = [row for row in self.rows if row not in (self.rows[1], self.rows[4])]
+        result = SupplyImporter(chunk_size=2).run(supply_workbook(valid), strict=True)
+        self.assertEqual(result.created, 3)
+        self.assertEqual(Supply.objects.count(), 3)
+
+    def test_upload_is_all_or_nothing_unless_partial(self):
+        response = self.client.post(
+            self.url, {'file': supply_workbook(self.rows)}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data['errores']), 2)
+        self.assertEqual(Supply.objects.count(), 0)
+
+        response = self.client.post(
+            self.url + '?partial=true', {'file': supply_workbook(self.rows)}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['creados'], 3)
+        self.assertEqual(len(response.data['errores']), 2)
+        self.assertEqual(Supply.objects.count(), 3)
+
+    def test_invalid_file(self):
+        upload = SimpleUploadedFile('insumos.xlsx', b'no es una planilla')
+        response = self.client.post(self.url, {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class InventoryMetricsTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='bodega',
+            password='testpass123',
+            national_id='11111111-1',
+            email='bodega@example.com',
+            position='Bodeguero'
+        )
+        self.client.force_authenticate(self.user)
+        for name, stock, category in (('Cuaderno', 1, 'Oficina'), ('Lápiz', 0, 'Oficina'),
+                                      ('Regla', 20, 'Oficina'), ('Balón', 0, 'Deportes')):
+            Product.objects.create(
+                name=name, stock=stock, price_clp=1000, iva=True, min_stock=5,
+                category=category, supplier='Proveedor X')
+        Supply.objects.create(name='Papel', category='Oficina', stock=10, min_stock=1)
+        Shrinkage.objects.create(product='Balón', price=500, quantity=1, category='Deportes')
+
+    def test_metrics_by_category(self):
+        response = self.client.get(reverse('inventory-metrics'), {'category': 'Oficina'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['amount_products'], 3)
+        self.assertEqual(response.data['amount_supplies'], 1)
+        self.assertEqual(response.data['amount_shrinkages'], 0)
+        self.assertEqual(response.data['low_stock_products_count'], 2)
+        self.assertEqual(
+            sorted(row['product'] for row in response.data['low_stock_chart_data']),
+            ['Cuaderno', 'Lápiz'])
+
+        response = self.client.get(reverse('inventory-metrics'))
+        self.assertEqual(response.data['amount_products'], 4)
+        self.assertEqual(response.data['low_stock_products_count'], 3)
+        self.assertEqual(response.data['recent_shrinkages'][0]['product_name'], 'Balón')
+
+
+class ProductExportTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='bodega',
+            password='testpass123',
+            national_id='11111111-1',
+            email='bodega@example.com',
+            position='Bodeguero'
+        )
+        self.client.force_authenticate(self.user)
+        for name, category in (('Regla', 'Oficina'), ('Balón', 'Deportes'), ('Cuaderno', 'Oficina')):
+            Product.objects.create(
+                name=name, stock=10, price_clp=1000, iva=True, min_stock=2,
+                category=category, supplier='Proveedor X')
+
+    def test_xlsx_export_uses_list_filters_and_template_columns(self):
+        response = self.client.get(reverse('product-export'), {'category': 'Oficina'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response['Content-Type'],
+            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+        workbook = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)))
+        rows = list(workbook['productos'].iter_rows(values_only=True))
+        self.assertEqual(
+            rows[0],
+            ('name', 'price_clp', 'iva', 'stock', 'min_stock', 'category', 'supplier', 'id'))
+        self.assertEqual(
+            [row[:7] for row in rows[1:]],
+            [('Cuaderno', 1000, True, 10, 2, 'Oficina', 'Proveedor X'),
+             ('Regla', 1000, True, 10, 2, 'Oficina', 'Proveedor X')])
+
+    def test_csv_export(self):
+        response = self.client.get(
+            reverse('product-export'), {'file_format': 'csv', 'ordering': '-name'})
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], ['Regla', 'Cuaderno', 'Balón'])
+
+
+class ProductSearchTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='bodega',
+            password='testpass123',
+            national_id='11111111-1',
+            email='bodega@example.com',
+            position='Bodeguero'
+        )
+        self.client.force_authenticate(self.user)
+        # Las coincidencias de otra categoría van primero por _id
+        for name, category in (('Cola fría', 'Bebidas'), ('Coco rallado', 'Bebidas'),
+                               ('Corchetes', 'Bebidas'), ('Cola fría', 'Oficina'),
+                               ('Corrector', 'Oficina'), ('Regla', 'Oficina')):
+            Product.objects.create(
+                name=name, stock=10, price_clp=1000, iva=True, min_stock=2,
+                category=category, supplier='Proveedor X')
+
+    @override_settings(SEARCH_MAX_RESULTS=2)
+    def test_search_limit_applies_after_list_filters(self):
+        response = self.client.get(
+            reverse('product-list'), {'category': 'Oficina', 'search': 'co', 'with_count': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['info']['count'], 2)
+        self.assertEqual(
+            sorted(product['name'] for product in response.data['results']),
+            ['Cola fría', 'Corrector'])
+
+    def test_search_matches_word_prefixes(self):
+        response = self.client.get(reverse('product-list'), {'search': 'rallado'})
+        self.assertEqual([p['name'] for p in response.data['results']], ['Coco rallado'])
+        response = self.client.get(reverse('product-list'), {'search': 'allado'})
+        self.assertEqual(response.data['results'], [])
@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     ProductViewSet, SupplyViewSet,
-    ShrinkageViewSet,
+    ShrinkageViewSet, ImportJobViewSet,
     InventoryMetricsAPIView
 )
 
@@ -10,6 +10,7 @@ router = DefaultRouter()
 router.register(r'products', ProductViewSet, basename='product')
 router.register(r'supplies', SupplyViewSet, basename='supply')
 router.register(r'shrinkages', ShrinkageViewSet, basename='shrinkage')
+router.register(r'import-jobs', ImportJobViewSet, basename='import-job')
 
 urlpatterns = [
     path('', include(router.urls)),
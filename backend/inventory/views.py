@@ -1,4 +1,3 @@
-from django.db import models
 from django.http import HttpResponse
 
 from rest_framework import viewsets, filters, status as drf_status
@@ -9,37 +8,87 @@ from rest_framework.views import APIView
 
 from django_filters.rest_framework import DjangoFilterBackend
 
-import openpyxl
 from openpyxl import Workbook
 
-from .models import Product, Supply, Shrinkage
-from suppliers.models import Supplier
+from .models import ImportJob, Product, Supply, Shrinkage
+from .importers import InvalidWorkbook
+from .jobs import IMPORTERS, enqueue
+from .analytics import LOW_STOCK, inventory_metrics
 from .serializers import (
     ProductSerializer,
     SupplySerializer,
     ShrinkageSerializer,
+    ImportJobSerializer,
 )
+from backend.cache import cached_response
 from users.pagination import CustomPagination
+from backend.exports import ExportMixin
+from backend.search import TokenSearchFilter
 from .filters import ProductFilter
 
 
+def excel_import_response(request, kind, success_message):
+    """
+    Importa el archivo recibido en `file`. Por defecto es todo o nada; con
+    ?partial=true se insertan las filas válidas y se informan las demás.
+    Con ?mode=upsert se actualizan los registros que coinciden por clave
+    natural y con ?background=true se encola un ImportJob y se responde de
+    inmediato.
+    """
+    excel_file = request.FILES.get('file')
+    if not excel_file:
+        return Response({"error": "Archivo no proporcionado."}, status=drf_status.HTTP_400_BAD_REQUEST)
+
+    mode = request.query_params.get('mode', 'insert').lower()
+    if mode not in IMPORTERS[kind].modes:
+        return Response({"error": f"Modo de carga no soportado: {mode}."}, status=drf_status.HTTP_400_BAD_REQUEST)
+
+    strict = request.query_params.get('partial', '').lower() not in ('1', 'true')
+    if request.query_params.get('background', '').lower() in ('1', 'true'):
+        job = enqueue(kind, excel_file, request.user, strict=strict, mode=mode)
+        return Response(ImportJobSerializer(job).data, status=drf_status.HTTP_202_ACCEPTED)
+
+    try:
+        result = IMPORTERS[kind](mode=mode).run(excel_file, strict=strict)
+    except InvalidWorkbook as e:
+        return Response({"error": str(e)}, status=drf_status.HTTP_400_BAD_REQUEST)
+
+    if result.error_count and not result.imported:
+        return Response({"errores": result.error_messages}, status=drf_status.HTTP_400_BAD_REQUEST)
+
+    data = {"message": success_message, "creados": result.created}
+    if mode == 'upsert':
+        data["actualizados"] = result.updated
+        data["sin_cambios"] = result.unchanged
+    if result.error_count:
+        data["errores"] = result.error_messages
+    return Response(data, status=drf_status.HTTP_201_CREATED)
+
+
 # -------------------------------
 # PRODUCTOS
 # -------------------------------
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ExportMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     pagination_class = CustomPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, TokenSearchFilter]
     filterset_class = ProductFilter
     search_fields = ['name', 'category']
     ordering_fields = ['name', 'price_clp', 'stock']
     ordering = ['name']
     parser_classes = [MultiPartParser, JSONParser]
+    # Mismas columnas iniciales que la plantilla de carga masiva
+    export_filename = 'productos'
+    export_columns = [
+        ("name", 'name'), ("price_clp", 'price_clp'), ("iva", 'iva'),
+        ("stock", 'stock'), ("min_stock", 'min_stock'), ("category", 'category'),
+        ("supplier", 'supplier'), ("id", 'pk'),
+    ]
 
     @action(detail=False, methods=['get'], url_path='low-stock')
     def low_stock_products(self, request):
-        low_stock = Product.objects.filter(stock__lt=models.F('min_stock'))
+        low_stock = Product.objects.filter(stock_status__in=LOW_STOCK)
         page = self.paginate_queryset(low_stock)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -49,65 +98,7 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['post'], url_path='bulk-upload-excel')
     def bulk_upload_excel(self, request):
-        excel_file = request.FILES.get('file')
-        if not excel_file:
-            return Response({"error": "Archivo no proporcionado."}, status=drf_status.HTTP_400_BAD_REQUEST)
-
-        try:
-            wb = openpyxl.load_workbook(excel_file)
-            sheet = wb.active
-        except Exception:
-            return Response({"error": "Archivo inválido o corrupto."}, status=drf_status.HTTP_400_BAD_REQUEST)
-
-        products_data = []
-        errores = []
-
-        for i, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-            # Verifica si la fila está completamente vacía
-            if not row or all(cell is None or str(cell).strip() == '' for cell in row):
-                continue  # Ignora filas completamente vacías
-
-            if not row or len(row) < 7:
-                errores.append(f"Fila {i}: Datos incompletos.")
-                continue
-
-            name, price_clp, iva, stock, min_stock, category, supplier_name = row
-
-            if not all([name, price_clp, iva, stock, min_stock, category]):
-                errores.append(f"Fila {i}: Uno o más campos requeridos están vacíos.")
-                continue
-
-            # Convertir IVA
-            iva = True if str(iva).strip().upper() in ["VERDADERO", "TRUE", "1"] else False
-
-            # Usar "Sin proveedor" si está vacío
-            if not supplier_name:
-                supplier_name = "Sin proveedor"
-
-            supplier_obj = Supplier.objects.filter(name__iexact=supplier_name.strip()).first()
-
-            if not supplier_obj:
-                supplier_obj = Supplier.objects.create(name=supplier_name.strip())
-
-            products_data.append({
-                "name": name,
-                "price_clp": price_clp,
-                "iva": iva,
-                "stock": stock,
-                "min_stock": min_stock,
-                "category": category,
-                "supplier": str(supplier_obj.id)
-            })
-
-        if errores:
-            return Response({"errores": errores}, status=drf_status.HTTP_400_BAD_REQUEST)
-
-        serializer = ProductSerializer(data=products_data, many=True)
-        if serializer.is_valid():
-            serializer.save()
-            return Response({"message": "Productos cargados exitosamente."}, status=drf_status.HTTP_201_CREATED)
-
-        return Response(serializer.errors, status=drf_status.HTTP_400_BAD_REQUEST)
+        return excel_import_response(request, ImportJob.Kind.PRODUCTS, "Productos cargados exitosamente.")
 
     @action(detail=False, methods=['get'], url_path='excel-template')
     def download_template(self, request):
@@ -126,7 +117,7 @@ class ProductViewSet(viewsets.ModelViewSet):
 # -------------------------------
 # INSUMOS
 # -------------------------------
-class SupplyViewSet(viewsets.ModelViewSet):
+class SupplyViewSet(ExportMixin, viewsets.ModelViewSet):
     queryset = Supply.objects.all()
     serializer_class = SupplySerializer
     pagination_class = CustomPagination
@@ -136,10 +127,15 @@ class SupplyViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'category', 'stock']
     ordering = ['name']
     parser_classes = [MultiPartParser, JSONParser]
+    export_filename = 'insumos'
+    export_columns = [
+        ("name", 'name'), ("category", 'category'), ("stock", 'stock'),
+        ("min_stock", 'min_stock'), ("id", 'pk'),
+    ]
 
     @action(detail=False, methods=['get'], url_path='low-stock')
     def low_stock_supplies(self, request):
-        low_stock = Supply.objects.filter(stock__lt=models.F('min_stock'))
+        low_stock = Supply.objects.filter(stock_status__in=LOW_STOCK)
         page = self.paginate_queryset(low_stock)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -149,49 +145,7 @@ class SupplyViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['post'], url_path='bulk-upload-excel')
     def bulk_upload_excel(self, request):
-        excel_file = request.FILES.get('file')
-        if not excel_file:
-            return Response({"error": "Archivo no proporcionado."}, status=drf_status.HTTP_400_BAD_REQUEST)
-
-        try:
-            wb = openpyxl.load_workbook(excel_file)
-            sheet = wb.active
-        except Exception:
-            return Response({"error": "Archivo inválido o corrupto."}, status=drf_status.HTTP_400_BAD_REQUEST)
-
-        supplies_data = []
-        errores = []
-
-        for i, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-            if not row or all(cell is None or str(cell).strip() == '' for cell in row):
-                continue
-
-            if len(row) < 4:
-                errores.append(f"Fila {i}: Datos incompletos.")
-                continue
-
-            name, category, stock, min_stock = row
-
-            if not all([name, category, stock, min_stock]):
-                errores.append(f"Fila {i}: Uno o más campos requeridos están vacíos.")
-                continue
-
-            supplies_data.append({
-                "name": name,
-                "category": category,
-                "stock": stock,
-                "min_stock": min_stock,
-            })
-
-        if errores:
-            return Response({"errores": errores}, status=drf_status.HTTP_400_BAD_REQUEST)
-
-        serializer = SupplySerializer(data=supplies_data, many=True)
-        if serializer.is_valid():
-            serializer.save()
-            return Response({"message": "Insumos cargados exitosamente."}, status=drf_status.HTTP_201_CREATED)
-
-        return Response(serializer.errors, status=drf_status.HTTP_400_BAD_REQUEST)
+        return excel_import_response(request, ImportJob.Kind.SUPPLIES, "Insumos cargados exitosamente.")
 
     @action(detail=False, methods=['get'], url_path='excel-template')
     def download_template(self, request):
@@ -209,7 +163,7 @@ class SupplyViewSet(viewsets.ModelViewSet):
 # -------------------------------
 # MERMAS
 # -------------------------------
-class ShrinkageViewSet(viewsets.ModelViewSet):
+class ShrinkageViewSet(ExportMixin, viewsets.ModelViewSet):
     queryset = Shrinkage.objects.all()
     serializer_class = ShrinkageSerializer
     pagination_class = CustomPagination
@@ -219,61 +173,16 @@ class ShrinkageViewSet(viewsets.ModelViewSet):
     ordering_fields = ['product', 'category', 'quantity', 'price']
     ordering = ['product']
     parser_classes = [JSONParser, MultiPartParser]
+    export_filename = 'mermas'
+    export_columns = [
+        ("product", 'product'), ("price", 'price'), ("quantity", 'quantity'),
+        ("category", 'category'), ("observation", 'observation'),
+        ("created_at", 'created_at'), ("id", 'pk'),
+    ]
 
     @action(detail=False, methods=['post'], url_path='bulk-upload-excel')
     def bulk_upload_excel(self, request):
-        excel_file = request.FILES.get('file')
-        if not excel_file:
-            return Response({"error": "Archivo no proporcionado."}, status=drf_status.HTTP_400_BAD_REQUEST)
-
-        try:
-            wb = openpyxl.load_workbook(excel_file)
-            sheet = wb.active
-        except Exception:
-            return Response({"error": "Archivo inválido o corrupto."}, status=drf_status.HTTP_400_BAD_REQUEST)
-
-        shrinkages_data = []
-        errores = []
-
-        for i, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-            if not row or all(cell is None or str(cell).strip() == '' for cell in row):
-                continue
-
-            if len(row) < 4:
-                errores.append(f"Fila {i}: Datos incompletos. Se requieren al menos 4 columnas.")
-                continue
-
-            product, price, quantity, category = row[:4]
-            observation = row[4] if len(row) > 4 else ""
-
-            if not all([product, price, quantity, category]):
-                errores.append(f"Fila {i}: Uno o más campos requeridos están vacíos.")
-                continue
-
-            try:
-                price = float(price)
-                quantity = int(quantity)
-            except ValueError:
-                errores.append(f"Fila {i}: Precio o cantidad con formato incorrecto.")
-                continue
-
-            shrinkages_data.append({
-                "product": str(product),
-                "price": price,
-                "quantity": quantity,
-                "category": str(category),
-                "observation": observation or "",
-            })
-
-        if errores:
-            return Response({"errores": errores}, status=drf_status.HTTP_400_BAD_REQUEST)
-
-        serializer = ShrinkageSerializer(data=shrinkages_data, many=True)
-        if serializer.is_valid():
-            serializer.save()
-            return Response({"message": "Mermas cargadas exitosamente."}, status=drf_status.HTTP_201_CREATED)
-
-        return Response(serializer.errors, status=drf_status.HTTP_400_BAD_REQUEST)
+        return excel_import_response(request, ImportJob.Kind.SHRINKAGES, "Mermas cargadas exitosamente.")
 
     @action(detail=False, methods=['get'], url_path='excel-template')
     def download_template(self, request):
@@ -289,42 +198,25 @@ class ShrinkageViewSet(viewsets.ModelViewSet):
         return response
 
 
+# -------------------------------
+# IMPORTACIONES EN SEGUNDO PLANO
+# -------------------------------
+class ImportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Estado y progreso de las cargas masivas encoladas con ?background=true."""
+    queryset = ImportJob.objects.all()
+    serializer_class = ImportJobSerializer
+    pagination_class = CustomPagination
+    filterset_fields = ['kind', 'status']
+
+
 # -----------------------
 # Metricas para Dashboard inventario
 # -----------------------
 
 class InventoryMetricsAPIView(APIView):
 
+    @cached_response('inventory')
     def get(self, request):
-        amount_products = Product.objects.count()
-        amount_supplies = Supply.objects.count()
-        amount_shrinkages = Shrinkage.objects.count()
-        low_stock_products = Product.objects.filter(stock__lt=models.F('min_stock'))
-
-        # Mermas recientes (últimos 5 registros)
-        recent_shrinkages = Shrinkage.objects.order_by('-id')[:5]
-        recent_shrinkages_serialized = [
-            {
-                "product_name": s.product,
-                "quantity": s.quantity,
-                "reason": s.observation,
-                "created_at": s.created_at.isoformat() if s.created_at else None
-            } for s in recent_shrinkages
-        ]
-
-        # Datos para gráfico
-        low_stock_chart_data = [
-            {
-                "product": p.name,
-                "stock": p.stock
-            } for p in low_stock_products[:10]
-        ]
-
-        return Response({
-            "amount_products": amount_products,
-            "amount_supplies": amount_supplies,
-            "amount_shrinkages": amount_shrinkages,
-            "low_stock_products_count": low_stock_products.count(),
-            "recent_shrinkages": recent_shrinkages_serialized,
-            "low_stock_chart_data": low_stock_chart_data
-        })
+        # ?category= acota todas las métricas a una categoría
+        category = request.query_params.get('category') or None
+        return Response(inventory_metrics(category))
@@ -1,6 +1,6 @@
-from django.db.models import Count, Sum, F
+from django.db.models import Count, Sum
 from users.models import User, UserActivity
-from inventory.models import Product, Supply, Shrinkage
+from inventory.models import Product, Supply, Shrinkage, StockStatus
 from suppliers.models import Supplier, BuyOrder, ReturnSupplier
 
 def get_user_report_data():
@@ -33,8 +33,9 @@ def get_inventory_report_data():
     supplies = Supply.objects.all()
     shrinkages = Shrinkage.objects.all()
 
-    low_stock_products = products.filter(stock__lt=F('min_stock')).count()
-    low_stock_supplies = supplies.filter(stock__lt=F('min_stock')).count()
+    low_stock = [StockStatus.LOW, StockStatus.OUT]
+    low_stock_products = products.filter(stock_status__in=low_stock).count()
+    low_stock_supplies = supplies.filter(stock_status__in=low_stock).count()
 
     total_products = products.count()
     total_supplies = supplies.count()
@@ -110,22 +111,44 @@ def get_supplier_report_data():
 def get_sales_report_data():
     try:
         from sales.models import Sale
-        
-        # Obtener datos básicos de ventas
-        total_sales = Sale.objects.count()
-        total_amount = Sale.objects.aggregate(total=Sum('total_amount'))['total'] or 0
+        from sales.rollups import rollups_enabled, summarize
+
+        if rollups_enabled():
+            # Un documento por día y combinación, en lugar de cada venta
+            by_type = {
+                row['document_type']: row['count']
+                for row in summarize(['document_type'])
+            }
+            payment_methods_data = sorted(
+                (
+                    {'payment_method': row['payment_method'],
+                     'count': row['count'], 'amount': row['total_amount']}
+                    for row in summarize(['payment_method'])
+                    if row['count']
+                ),
+                key=lambda row: row['amount'], reverse=True
+            )
+            total_sales = sum(by_type.values())
+            total_amount = sum(row['amount'] for row in payment_methods_data)
+            invoices = by_type.get(Sale.DocType.INVOICE, 0)
+            receipts = by_type.get(Sale.DocType.RECEIPT, 0)
+        else:
+            # Obtener datos básicos de ventas
+            total_sales = Sale.objects.count()
+            total_amount = Sale.objects.aggregate(total=Sum('total_amount'))['total'] or 0
+
+            # Tipos de documento
+            invoices = Sale.objects.filter(document_type=Sale.DocType.INVOICE).count()
+            receipts = Sale.objects.filter(document_type=Sale.DocType.RECEIPT).count()
+
+            # Métodos de pago (ajustado para trabajar sin el modelo PaymentMethod)
+            payment_methods_data = Sale.objects.values('payment_method').annotate(
+                count=Count('id'),
+                amount=Sum('total_amount')
+            ).order_by('-amount')
+
         average_sale = total_amount / total_sales if total_sales > 0 else 0
-        
-        # Tipos de documento
-        invoices = Sale.objects.filter(document_type='F').count()
-        receipts = Sale.objects.filter(document_type='B').count()
-        
-        # Métodos de pago (ajustado para trabajar sin el modelo PaymentMethod)
-        payment_methods_data = Sale.objects.values('payment_method').annotate(
-            count=Count('id'),
-            amount=Sum('total_amount')
-        ).order_by('-amount')
-        
+
         total_payments = sum(method['amount'] for method in payment_methods_data) or 1
         payment_methods = []
         for method in payment_methods_data:
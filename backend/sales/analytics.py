@@ -0,0 +1,256 @@
+"""
+Agregaciones de ventas para el dashboard, ejecutadas como pipelines únicos
+sobre la colección de ventas o, con SALES_ROLLUPS_READ, sobre los rollups
+diarios (sales.rollups), cuyo costo depende del rango y no de las ventas.
+"""
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from backend.mongo import get_collection
+from inventory.models import Product
+from .models import Client, DailyProductRollup, DailySalesRollup, Quote, Sale, SaleDetail
+from .rollups import rollup_day, rollups_enabled
+
+
+def add_months(value, months):
+    """Suma (o resta) meses calendario a una fecha que cae en el día 1."""
+    index = value.year * 12 + value.month - 1 + months
+    return value.replace(year=index // 12, month=index % 12 + 1)
+
+
+def current_month_start():
+    """Inicio del mes actual en la zona horaria configurada."""
+    return timezone.localtime(timezone.now()).replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def monthly_totals(ranges):
+    """
+    Suma total_amount por mes calendario (según settings.TIME_ZONE) para las
+    ventas dentro de cualquiera de los rangos [inicio, fin) indicados.
+    Devuelve {(año, mes): total} en una sola agregación.
+    """
+    if rollups_enabled():
+        # El día del rollup ya es la fecha local
+        model, field, tz = DailySalesRollup, 'day', 'UTC'
+        ranges = [(rollup_day(start), rollup_day(end)) for start, end in ranges]
+    else:
+        model, field, tz = Sale, 'created_at', settings.TIME_ZONE
+    pipeline = [
+        {'$match': {'$or': [
+            {field: {'$gte': start, '$lt': end}} for start, end in ranges
+        ]}},
+        {'$group': {
+            '_id': {
+                'year': {'$year': {'date': f'${field}', 'timezone': tz}},
+                'month': {'$month': {'date': f'${field}', 'timezone': tz}},
+            },
+            'total': {'$sum': '$total_amount'},
+        }},
+    ]
+    return {
+        (row['_id']['year'], row['_id']['month']): row['total']
+        for row in get_collection(model._meta.db_table).aggregate(pipeline)
+    }
+
+
+def monthly_profit_series(months=6, compare_years=1):
+    """
+    Serie de los últimos `months` meses (incluido el actual) con el total de
+    cada mes y el del mismo mes en cada uno de los `compare_years` años
+    anteriores.
+    """
+    first = add_months(current_month_start(), -(months - 1))
+    end = add_months(first, months)
+    ranges = [
+        (add_months(first, -12 * years), add_months(end, -12 * years))
+        for years in range(compare_years + 1)
+    ]
+    totals = monthly_totals(ranges)
+
+    series = []
+    for offset in range(months):
+        month = add_months(first, offset)
+        previous = [
+            totals.get((month.year - years, month.month), 0)
+            for years in range(1, compare_years + 1)
+        ]
+        entry = {
+            'name': datetime(month.year, month.month, 1).strftime('%B'),
+            'year': month.year,
+            'month': month.month,
+            'value': totals.get((month.year, month.month), 0),
+            'previous_values': previous,
+        }
+        if previous:
+            entry['previous_value'] = previous[0]
+        series.append(entry)
+    return series
+
+
+def _timed_aggregate(model, pipeline, timings, name):
+    """Ejecuta la agregación y anota su duración (ms) en `timings`."""
+    start = time.perf_counter()
+    result = next(get_collection(model._meta.db_table).aggregate(pipeline), {})
+    timings[name] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def _first(facet, field='value'):
+    return facet[0][field] if facet else 0
+
+
+def _figure_facets(field, month_start, count):
+    """Montos del mes actual y anterior, cantidad y ventas por estado."""
+    current = {field: {'$gte': month_start}}
+    return {
+        'monthly_profit': [
+            {'$match': current},
+            {'$group': {'_id': None, 'value': {'$sum': '$total_amount'},
+                        'count': {'$sum': count}}},
+        ],
+        'previous_month_profit': [
+            {'$match': {field: {'$lt': month_start}}},
+            {'$group': {'_id': None, 'value': {'$sum': '$total_amount'}}},
+        ],
+        'by_status': [
+            {'$match': current},
+            {'$group': {'_id': '$status', 'value': {'$sum': count}}},
+        ],
+    }
+
+
+def _top_clients_facet(top):
+    return [
+        {'$match': {'client_id': {'$ne': None}}},
+        {'$group': {'_id': '$client_id', 'value': {'$sum': '$total_amount'}}},
+        {'$sort': {'value': -1}},
+        {'$limit': top},
+        {'$lookup': {
+            'from': Client._meta.db_table,
+            'localField': '_id',
+            'foreignField': '_id',
+            'as': 'client',
+        }},
+        {'$unwind': '$client'},
+        {'$project': {
+            'value': 1,
+            'first_name': '$client.first_name',
+            'last_name': '$client.last_name',
+        }},
+    ]
+
+
+def sales_stats(month_start, timings, top=3):
+    """
+    Ventas del mes actual y del anterior en un solo $facet: montos, cantidad,
+    pagadas/pendientes y los clientes que más gastaron (agrupados por id).
+    Con rollups, los montos salen de DailySalesRollup y sólo los clientes
+    destacados recorren las ventas del mes.
+    """
+    previous_start = add_months(month_start, -1)
+    current = {'created_at': {'$gte': month_start}}
+    if rollups_enabled():
+        day = rollup_day(month_start)
+        result = _timed_aggregate(DailySalesRollup, [
+            {'$match': {'day': {'$gte': rollup_day(previous_start)}}},
+            {'$facet': _figure_facets('day', day, '$count')},
+        ], timings, 'rollups')
+        result.update(_timed_aggregate(Sale, [
+            {'$match': current},
+            {'$facet': {'top_clients': _top_clients_facet(top)}},
+        ], timings, 'sales'))
+    else:
+        result = _timed_aggregate(Sale, [
+            {'$match': {'created_at': {'$gte': previous_start}}},
+            {'$facet': {
+                **_figure_facets('created_at', month_start, 1),
+                'top_clients': [{'$match': current}] + _top_clients_facet(top),
+            }},
+        ], timings, 'sales')
+
+    by_status = {row['_id']: row['value'] for row in result.get('by_status', [])}
+    return {
+        'monthly_profit': _first(result.get('monthly_profit')),
+        'previous_month_profit': _first(result.get('previous_month_profit')),
+        'total_sales': _first(result.get('monthly_profit'), 'count'),
+        'paid_sales': by_status.get(Sale.Status.PAID, 0),
+        'due_sales': by_status.get(Sale.Status.PENDING, 0),
+        'top_clients': [
+            {
+                'id': str(row['_id']),
+                'name': f"{row['first_name']} {row['last_name']}",
+                'value': row['value'],
+            }
+            for row in result.get('top_clients', [])
+        ],
+    }
+
+
+def quote_stats(month_start, timings):
+    """Cotizaciones del mes actual por estado en un solo $facet."""
+    # Quote.created_at es DateField: se guarda como medianoche sin zona horaria
+    start = datetime(month_start.year, month_start.month, 1)
+    pipeline = [
+        {'$match': {'created_at': {'$gte': start}}},
+        {'$facet': {
+            'by_status': [
+                {'$group': {'_id': '$status', 'value': {'$sum': 1}}},
+            ],
+        }},
+    ]
+    result = _timed_aggregate(Quote, pipeline, timings, 'quotes')
+    by_status = {row['_id']: row['value'] for row in result.get('by_status', [])}
+    return {
+        'approved_quotes': by_status.get(Quote.StatusQuote.APPROVED, 0),
+        'pending_quotes': by_status.get(Quote.StatusQuote.PENDING, 0),
+        'rejected_quotes': by_status.get(Quote.StatusQuote.REJECTED, 0),
+    }
+
+
+def dashboard_stats():
+    """
+    Estadísticas del dashboard en dos agregaciones (ventas y cotizaciones).
+    Devuelve (datos, tiempos) con la duración en ms de cada una.
+    """
+    month_start = current_month_start()
+    timings = {}
+    data = sales_stats(month_start, timings)
+    data.update(quote_stats(month_start, timings))
+    return data, timings
+
+
+def top_selling_products(month_start, limit=10):
+    """Productos más vendidos desde `month_start`: lista de (nombre, unidades)."""
+    if not rollups_enabled():
+        rows = (
+            SaleDetail.objects
+            .filter(sale__created_at__gte=month_start)
+            .values('product__name')
+            .annotate(total_sold=Sum('quantity'))
+            .order_by('-total_sold')[:limit]
+        )
+        return [(row['product__name'], row['total_sold']) for row in rows]
+
+    pipeline = [
+        {'$match': {'day': {'$gte': rollup_day(month_start)}}},
+        {'$group': {'_id': '$product_id', 'total_sold': {'$sum': '$quantity'}}},
+        {'$match': {'total_sold': {'$gt': 0}}},
+        {'$sort': {'total_sold': -1}},
+        {'$limit': limit},
+        {'$lookup': {
+            'from': Product._meta.db_table,
+            'localField': '_id',
+            'foreignField': '_id',
+            'as': 'product',
+        }},
+        {'$unwind': '$product'},
+    ]
+    return [
+        (row['product']['name'], row['total_sold'])
+        for row in get_collection(DailyProductRollup._meta.db_table).aggregate(pipeline)
+    ]
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class SalesConfig(AppConfig):
+    default_auto_field = 'django_mongodb_backend.fields.ObjectIdAutoField'
+    name = 'sales'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,323 @@
+"""
+Ingreso masivo de ventas (sincronización de puntos de venta sin conexión).
+
+Un lote se valida completo, descuenta el stock agregado por producto en un
+solo bulk_write, reserva los folios de cada tipo de documento con un único
+$inc y escribe ventas y detalles con un insert por colección. Los rollups
+diarios se actualizan con un único delta para todo el lote.
+"""
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+from django.db import IntegrityError
+
+from backend.cache import bump_version
+
+from inventory.models import Product, StockMovement
+from inventory.stock import (
+    InsufficientStock, movements, record_movements, reserve_stock, release_stock)
+from .folios import folio_allocator, void_folios
+from .models import Client, Sale, SaleDetail
+from .rollups import RollupDelta, record
+from .serializers import SaleSerializer, quantities_by_product, sale_totals
+
+STOCK_RETRIES = 3
+
+
+class BulkSaleTooLarge(Exception):
+    pass
+
+
+def _object_ids(values):
+    ids = set()
+    for value in values:
+        try:
+            ids.add(ObjectId(value))
+        except (InvalidId, TypeError):
+            continue
+    return ids
+
+
+INVALID_KEY = object()
+
+
+def _idempotency_key(item):
+    """
+    idempotency_key del ítem como texto (igual que la guarda el serializer),
+    None si no trae o INVALID_KEY si no es texto ni número.
+    """
+    if not isinstance(item, dict):
+        return None
+    key = item.get('idempotency_key')
+    if key is None or key == '':
+        return None
+    if isinstance(key, bool) or not isinstance(key, (str, int, float)):
+        return INVALID_KEY
+    return str(key)
+
+
+def _prefetch(items):
+    """Carga en dos consultas todos los productos y clientes del lote."""
+    product_ids = _object_ids(
+        detail.get('product_id')
+        for item in items for detail in item.get('details') or []
+        if isinstance(detail, dict)
+    )
+    client_ids = _object_ids(
+        item.get('client_id') or item.get('client') for item in items)
+    return {
+        Product: Product.objects.in_bulk(product_ids),
+        Client: Client.objects.in_bulk(client_ids),
+    }
+
+
+def _plan_stock(pending, stocks):
+    """
+    Acepta las ventas en orden mientras alcance el stock y devuelve
+    (aceptadas, rechazadas) junto con el total a descontar por producto.
+    """
+    available = dict(stocks)
+    accepted, rejected = [], []
+    for entry in pending:
+        short = next(
+            (pk for pk, qty in entry['quantities'].items()
+             if available.get(pk, 0) < qty),
+            None
+        )
+        if short is not None:
+            rejected.append((entry, short))
+            continue
+        for pk, qty in entry['quantities'].items():
+            available[pk] -= qty
+        accepted.append(entry)
+
+    totals = {}
+    for entry in accepted:
+        for pk, qty in entry['quantities'].items():
+            totals[pk] = totals.get(pk, 0) + qty
+    return accepted, rejected, totals
+
+
+def ingest_sales(items):
+    """
+    Procesa un lote de ventas y devuelve un resultado por ítem, en el mismo
+    orden: created, duplicate (misma idempotency_key ya registrada) o error.
+    """
+    max_items = getattr(settings, 'SALES_BULK_MAX_ITEMS', 500)
+    if len(items) > max_items:
+        raise BulkSaleTooLarge(
+            f"El lote supera el máximo de {max_items} ventas.")
+
+    results = [None] * len(items)
+
+    # Claves ya registradas (reintentos) y repetidas dentro del mismo lote
+    keys = [_idempotency_key(item) for item in items]
+    existing = {
+        sale.idempotency_key: sale
+        for sale in Sale.objects.filter(
+            idempotency_key__in=[key for key in keys if isinstance(key, str)])
+    }
+    first_by_key = {}
+
+    context = {'prefetched': _prefetch([i for i in items if isinstance(i, dict)])}
+    pending = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = {'index': index, 'status': 'error',
+                              'errors': ["Cada venta debe ser un objeto."]}
+            continue
+        key = keys[index]
+        if key is INVALID_KEY:
+            results[index] = {'index': index, 'status': 'error',
+                              'errors': {'idempotency_key': ["Debe ser un texto o un número."]}}
+            continue
+        if key in existing:
+            sale = existing[key]
+            results[index] = {'index': index, 'status': 'duplicate',
+                              'id': str(sale.id), 'folio': sale.folio}
+            continue
+        if key and key in first_by_key:
+            results[index] = {'index': index, 'status': 'duplicate',
+                              'duplicate_of': first_by_key[key]}
+            continue
+        if key:
+            first_by_key[key] = index
+
+        serializer = SaleSerializer(data=item, context=context)
+        if not serializer.is_valid():
+            results[index] = {'index': index, 'status': 'error',
+                              'errors': serializer.errors}
+            continue
+
+        validated_data = dict(serializer.validated_data)
+        details_data = validated_data.pop('details', [])
+        if not details_data:
+            results[index] = {
+                'index': index, 'status': 'error',
+                'errors': ["Debe incluir al menos un producto en la venta."]}
+            continue
+
+        details = [SaleDetail(**detail_data) for detail_data in details_data]
+        pending.append({
+            'index': index,
+            'data': validated_data,
+            'details': details,
+            'quantities': quantities_by_product(details),
+        })
+
+    accepted = _reserve(pending, context['prefetched'][Product], results)
+    if accepted:
+        _insert(accepted, results)
+
+    for result in results:
+        if 'duplicate_of' in result:
+            original = results[result['duplicate_of']]
+            if original['status'] in ('created', 'duplicate'):
+                result.update(id=original['id'], folio=original['folio'])
+            else:
+                result.update(status='error', errors=original['errors'])
+    return results
+
+
+def _reserve(pending, products, results):
+    """Descuenta el stock agregado del lote, reintentando si cambió entre medio."""
+    stocks = {pk: product.stock for pk, product in products.items()}
+    for _ in range(STOCK_RETRIES):
+        accepted, rejected, totals = _plan_stock(pending, stocks)
+        try:
+            reserve_stock(totals)
+        except InsufficientStock:
+            # Otra venta consumió stock entre la lectura y el descuento
+            stocks = dict(Product.objects.filter(
+                pk__in=list(stocks)).values_list('pk', 'stock'))
+            continue
+
+        for entry, product_id in rejected:
+            results[entry['index']] = {
+                'index': entry['index'], 'status': 'error',
+                'errors': [f"No hay suficiente stock para el producto "
+                           f"{products[product_id].name}"]}
+        return accepted
+
+    for entry in pending:
+        results[entry['index']] = {
+            'index': entry['index'], 'status': 'error',
+            'errors': ["El stock cambió durante la sincronización. Reintente."]}
+    return []
+
+
+def _quantities(entries):
+    totals = {}
+    for entry in entries:
+        for pk, qty in entry['quantities'].items():
+            totals[pk] = totals.get(pk, 0) + qty
+    return totals
+
+
+def _write(entries):
+    """Inserta ventas y detalles; si falla, borra lo que alcanzó a escribir."""
+    sale_ids = [entry['sale'].id for entry in entries]
+    try:
+        Sale.objects.bulk_create([entry['sale'] for entry in entries])
+        SaleDetail.objects.bulk_create(
+            [detail for entry in entries for detail in entry['details']])
+    except Exception:
+        SaleDetail.objects.filter(sale_id__in=sale_ids).delete()
+        Sale.objects.filter(pk__in=sale_ids).delete()
+        raise
+
+
+def _registered_keys(entries):
+    """Ventas que otro request registró con las claves de `entries`."""
+    keys = [entry['data']['idempotency_key'] for entry in entries
+            if entry['data'].get('idempotency_key')]
+    return {
+        sale.idempotency_key: sale
+        for sale in Sale.objects.filter(idempotency_key__in=keys).exclude(
+            pk__in=[entry['sale'].id for entry in entries])
+    }
+
+
+def _discard(entries, reason):
+    """Devuelve el stock de ventas que no se guardaron y anula sus folios."""
+    release_stock(_quantities(entries))
+    by_type = {}
+    for entry in entries:
+        by_type.setdefault(entry['sale'].document_type, []).append(entry['sale'].folio)
+    for document_type, folios in by_type.items():
+        void_folios(document_type, folios, reason)
+
+
+def _insert(accepted, results):
+    by_type = {}
+    for entry in accepted:
+        document_type = entry['data'].get('document_type', Sale.DocType.RECEIPT)
+        by_type.setdefault(document_type, []).append(entry)
+
+    for document_type, entries in by_type.items():
+        folios = folio_allocator.allocate(document_type, len(entries))
+        for entry, folio in zip(entries, folios):
+            net_amount, iva = sale_totals(entry['details'])
+            sale = Sale(
+                id=ObjectId(),
+                **entry['data'],
+                folio=folio,
+                net_amount=net_amount,
+                iva=iva,
+                total_amount=net_amount + iva
+            )
+            for detail in entry['details']:
+                detail.sale = sale
+            entry['sale'] = sale
+
+    # La verificación previa de idempotency_key no impide que otro request
+    # registre la misma clave entre medio: esas ventas chocan con el índice
+    # único, se informan como duplicadas y el resto se vuelve a insertar.
+    while accepted:
+        try:
+            _write(accepted)
+            break
+        except IntegrityError:
+            registered = _registered_keys(accepted)
+            if not registered:
+                _discard(accepted, "Error al registrar el lote de ventas.")
+                raise
+        except Exception:
+            _discard(accepted, "Error al registrar el lote de ventas.")
+            raise
+
+        duplicates = [entry for entry in accepted
+                      if entry['data'].get('idempotency_key') in registered]
+        # Sus folios ya se entregaron: quedan anulados para la auditoría
+        _discard(duplicates, "Venta duplicada: otro request registró la misma idempotency_key.")
+        for entry in duplicates:
+            sale = registered[entry['data']['idempotency_key']]
+            results[entry['index']] = {'index': entry['index'], 'status': 'duplicate',
+                                       'id': str(sale.id), 'folio': sale.folio}
+        accepted = [entry for entry in accepted
+                    if entry['data'].get('idempotency_key') not in registered]
+    if not accepted:
+        return
+
+    # bulk_create no dispara señales
+    bump_version('sales')
+
+    delta = RollupDelta()
+    for entry in accepted:
+        delta.add_sale(entry['sale'])
+        delta.add_details(entry['sale'].created_at, entry['details'])
+    record(delta)
+
+    # El stock se descontó agregado por lote; el libro lo registra por venta
+    record_movements([
+        movement
+        for entry in accepted
+        for movement in movements(
+            {pk: -qty for pk, qty in entry['quantities'].items()},
+            StockMovement.Reason.SALE, ('sale', entry['sale'].id))
+    ])
+
+    for entry in accepted:
+        sale = entry['sale']
+        results[entry['index']] = {'index': entry['index'], 'status': 'created',
+                                   'id': str(sale.id), 'folio': sale.folio}
@@ -0,0 +1,149 @@
+import os
+import socket
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo import ReturnDocument  # type: ignore
+
+from backend.mongo import get_collection
+
+COUNTERS_COLLECTION = 'counters'
+BLOCKS_COLLECTION = 'folio_blocks'
+VOIDED_COLLECTION = 'voided_folios'
+
+
+def reserve_block(document_type, size=1):
+    """
+    Reserva `size` folios consecutivos con un único $inc atómico sobre el
+    contador y devuelve la tupla (primero, último).
+    """
+    result = get_collection(COUNTERS_COLLECTION).find_one_and_update(
+        {'document_type': document_type},
+        {'$inc': {'next_folio': size}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    last = result['next_folio']
+    return last - size + 1, last
+
+
+class FolioAllocator:
+    """
+    Asignador hi-lo de folios. Cada proceso reserva bloques de `block_size`
+    folios y los entrega desde memoria, de modo que sólo cada N ventas se
+    consulta la colección de contadores.
+
+    Con block_size=1 (por defecto) el comportamiento es idéntico al contador
+    estrictamente correlativo. Con bloques mayores los folios que un proceso
+    no alcance a usar quedan como huecos; cada bloque se registra en
+    `folio_blocks` para poder auditarlos con `audit_gaps`.
+    """
+
+    def __init__(self, block_size=None):
+        self._block_size = block_size
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def block_size(self):
+        if self._block_size is not None:
+            return self._block_size
+        return max(1, getattr(settings, 'FOLIO_BLOCK_SIZE', 1))
+
+    def next(self, document_type):
+        return self.allocate(document_type, 1)[0]
+
+    def allocate(self, document_type, count=1):
+        """Entrega `count` folios, reservando bloques nuevos si hace falta."""
+        folios = []
+        with self._lock:
+            while len(folios) < count:
+                block = self._blocks.get(document_type)
+                if block is None or block[0] > block[1]:
+                    size = max(self.block_size, count - len(folios))
+                    block = list(reserve_block(document_type, size))
+                    self._blocks[document_type] = block
+                    if size > 1:
+                        self._record_block(document_type, *block)
+
+                take = min(count - len(folios), block[1] - block[0] + 1)
+                folios.extend(range(block[0], block[0] + take))
+                block[0] += take
+        return folios
+
+    def _record_block(self, document_type, start, end):
+        get_collection(BLOCKS_COLLECTION).insert_one({
+            'document_type': document_type,
+            'start': start,
+            'end': end,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'reserved_at': timezone.now(),
+        })
+
+
+folio_allocator = FolioAllocator()
+
+
+def void_folios(document_type, folios, reason):
+    """
+    Registra folios ya entregados que no llegarán a usarse (la venta no se
+    guardó), para que audit_gaps informe el motivo del hueco.
+    """
+    if not folios:
+        return
+    now = timezone.now()
+    get_collection(VOIDED_COLLECTION).insert_many([
+        {'document_type': document_type, 'folio': folio, 'reason': reason, 'voided_at': now}
+        for folio in folios
+    ])
+
+
+def audit_gaps(document_type):
+    """
+    Compara los folios entregados por el contador con los usados por las
+    ventas y devuelve los huecos, indicando el bloque (host/pid) al que
+    pertenecía cada uno cuando está registrado y el motivo si se anuló con
+    void_folios.
+    """
+    from .models import Sale
+
+    counter = get_collection(COUNTERS_COLLECTION).find_one(
+        {'document_type': document_type})
+    if not counter:
+        return []
+
+    used = set(
+        Sale.objects.filter(document_type=document_type, folio__isnull=False)
+        .values_list('folio', flat=True)
+    )
+    missing = [
+        folio for folio in range(1, counter['next_folio'] + 1)
+        if folio not in used
+    ]
+    if not missing:
+        return []
+
+    blocks = list(get_collection(BLOCKS_COLLECTION).find(
+        {'document_type': document_type,
+         'end': {'$gte': missing[0]}, 'start': {'$lte': missing[-1]}},
+        {'_id': 0, 'start': 1, 'end': 1, 'host': 1, 'pid': 1, 'reserved_at': 1}
+    ).sort('start', 1))
+
+    voided = {
+        row['folio']: row['reason']
+        for row in get_collection(VOIDED_COLLECTION).find(
+            {'document_type': document_type,
+             'folio': {'$gte': missing[0], '$lte': missing[-1]}},
+            {'_id': 0, 'folio': 1, 'reason': 1})
+    }
+
+    gaps = []
+    index = 0
+    for folio in missing:
+        while index < len(blocks) and blocks[index]['end'] < folio:
+            index += 1
+        block = blocks[index] if index < len(blocks) and blocks[index]['start'] <= folio else None
+        gaps.append({'folio': folio, 'block': block, 'voided': voided.get(folio)})
+    return gaps
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from sales.folios import audit_gaps
+from sales.models import Sale
+
+
+class Command(BaseCommand):
+    help = "Lista los folios reservados que no fueron usados por ninguna venta."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--document-type',
+            choices=Sale.DocType.values,
+            help='Tipo de documento a auditar (por defecto: todos).'
+        )
+
+    def handle(self, *args, **options):
+        document_types = (
+            [options['document_type']] if options['document_type']
+            else Sale.DocType.values
+        )
+
+        for document_type in document_types:
+            gaps = audit_gaps(document_type)
+            if not gaps:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{document_type}: sin folios faltantes."))
+                continue
+
+            self.stdout.write(self.style.WARNING(
+                f"{document_type}: {len(gaps)} folios sin venta asociada."))
+            for gap in gaps:
+                block = gap['block']
+                origin = (
+                    f"bloque {block['start']}-{block['end']} ({block['host']}:{block['pid']})"
+                    if block else "reserva individual"
+                )
+                if gap['voided']:
+                    origin += f", anulado: {gap['voided']}"
+                self.stdout.write(f"  {gap['folio']} - {origin}")
@@ -0,0 +1,38 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sales.rollups import rebuild
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Fecha inválida: {value}. Use el formato AAAA-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = ("Recalcula los rollups diarios de ventas y productos desde las "
+            "ventas registradas, para todo el historial o un rango de fechas.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from', dest='start', type=_parse_date,
+            help='Primer día a recalcular (AAAA-MM-DD, fecha local).'
+        )
+        parser.add_argument(
+            '--to', dest='end', type=_parse_date,
+            help='Último día a recalcular, inclusive (AAAA-MM-DD, fecha local).'
+        )
+
+    def handle(self, *args, **options):
+        start, end = options['start'], options['end']
+        if start and end and start > end:
+            raise CommandError("--from debe ser anterior o igual a --to.")
+
+        sales, products = rebuild(start, end)
+        period = f"{start or 'inicio'} a {end or 'hoy'}"
+        self.stdout.write(self.style.SUCCESS(
+            f"Rollups recalculados ({period}): {sales} filas de ventas, "
+            f"{products} filas de productos."))
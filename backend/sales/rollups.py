@@ -0,0 +1,190 @@
+"""
+Rollups diarios de ventas.
+
+Cada alta, modificación, cambio de estado o eliminación de una venta aplica
+un $inc sobre las filas afectadas de DailySalesRollup y DailyProductRollup,
+de modo que dashboard y reportes lean un documento por día en lugar de
+recorrer todas las ventas. `rebuild` los recalcula desde las ventas para un
+rango de fechas (comando rebuild_sales_rollups).
+
+El día es la fecha local (settings.TIME_ZONE) de created_at, guardada como
+medianoche igual que cualquier DateField.
+"""
+import logging
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo import UpdateOne  # type: ignore
+
+from backend.cache import bump_version
+from backend.mongo import get_collection
+from backend.rollups import RollupWriter, day_expression, grouped_rows, rollup_day
+from .models import DailyProductRollup, DailySalesRollup, Sale, SaleDetail
+
+logger = logging.getLogger(__name__)
+
+SALE_KEYS = ('day', 'document_type', 'payment_method', 'status')
+SALE_TOTALS = ('count', 'net_amount', 'iva', 'total_amount')
+
+
+def rollups_enabled():
+    """Indica si los lectores deben usar los rollups en lugar de las ventas."""
+    return getattr(settings, 'SALES_ROLLUPS_READ', False)
+
+
+class RollupDelta:
+    """
+    Acumula los cambios de una o varias ventas y los escribe con un
+    bulk_write por colección. Las claves cuyo delta queda en cero no se
+    escriben.
+    """
+
+    def __init__(self):
+        self.sales = {}
+        self.products = {}
+
+    def add_sale(self, sale, sign=1):
+        key = (rollup_day(sale.created_at), sale.document_type,
+               sale.payment_method, sale.status)
+        totals = self.sales.setdefault(key, [0] * len(SALE_TOTALS))
+        values = (1, sale.net_amount, sale.iva, sale.total_amount)
+        for index, value in enumerate(values):
+            totals[index] += sign * value
+
+    def add_details(self, created_at, details, sign=1):
+        day = rollup_day(created_at)
+        for detail in details:
+            totals = self.products.setdefault((day, detail.product_id), [0, 0])
+            totals[0] += sign * detail.quantity
+            totals[1] += sign * detail.quantity * detail.unit_price
+
+    def apply(self):
+        sales = [
+            UpdateOne(dict(zip(SALE_KEYS, key)),
+                      {'$inc': dict(zip(SALE_TOTALS, totals))}, upsert=True)
+            for key, totals in self.sales.items() if any(totals)
+        ]
+        products = [
+            UpdateOne({'day': day, 'product_id': product_id},
+                      {'$inc': {'quantity': quantity, 'amount': amount}},
+                      upsert=True)
+            for (day, product_id), (quantity, amount) in self.products.items()
+            if quantity or amount
+        ]
+        if sales:
+            get_collection(DailySalesRollup._meta.db_table).bulk_write(
+                sales, ordered=False)
+        if products:
+            get_collection(DailyProductRollup._meta.db_table).bulk_write(
+                products, ordered=False)
+
+
+def record(delta):
+    """
+    Aplica el delta sin interrumpir la operación de venta, que ya quedó
+    escrita. Si falla, el rollup se repara con rebuild_sales_rollups.
+    """
+    try:
+        delta.apply()
+    except Exception:
+        logger.exception("No se pudieron actualizar los rollups de ventas")
+
+
+def _local_bounds(start, end):
+    """Convierte fechas locales [start, end] en el rango [inicio, fin) aware."""
+    tz = timezone.get_current_timezone()
+    bounds = {}
+    if start:
+        bounds['$gte'] = timezone.make_aware(datetime.combine(start, time.min), tz)
+    if end:
+        bounds['$lt'] = timezone.make_aware(
+            datetime.combine(end + timedelta(days=1), time.min), tz)
+    return bounds
+
+
+def rebuild(start=None, end=None):
+    """
+    Recalcula los rollups de los días [start, end] (fechas locales; sin
+    límites, todos) a partir de las ventas y sus detalles. Devuelve la
+    cantidad de documentos de cada rollup en el rango.
+
+    Una venta registrada mientras corre puede quedar fuera del recálculo de
+    su fila si su $inc llega entre la lectura y el reemplazo; conviene
+    ejecutarlo con poco movimiento o repetirlo para el día en curso.
+    """
+    bounds = _local_bounds(start, end)
+    sale_match = {'created_at': bounds} if bounds else {}
+    day_match = {}
+    if start:
+        day_match['$gte'] = rollup_day(start)
+    if end:
+        day_match['$lt'] = rollup_day(end + timedelta(days=1))
+    rollup_match = {'day': day_match} if day_match else {}
+
+    day = day_expression('$created_at')
+    sales = get_collection(Sale._meta.db_table)
+
+    sales_writer = RollupWriter(DailySalesRollup._meta.db_table, SALE_KEYS, SALE_TOTALS)
+    for row in grouped_rows(sales.aggregate([
+        {'$match': sale_match},
+        {'$group': {
+            '_id': {'day': day, 'document_type': '$document_type',
+                    'payment_method': '$payment_method', 'status': '$status'},
+            'count': {'$sum': 1},
+            'net_amount': {'$sum': '$net_amount'},
+            'iva': {'$sum': '$iva'},
+            'total_amount': {'$sum': '$total_amount'},
+        }},
+    ])):
+        sales_writer.replace(row)
+
+    products_writer = RollupWriter(
+        DailyProductRollup._meta.db_table, ('day', 'product_id'), ('quantity', 'amount'))
+    for row in grouped_rows(sales.aggregate([
+        {'$match': sale_match},
+        {'$lookup': {
+            'from': SaleDetail._meta.db_table,
+            'localField': '_id',
+            'foreignField': 'sale_id',
+            'as': 'details',
+        }},
+        {'$unwind': '$details'},
+        {'$group': {
+            '_id': {'day': day, 'product_id': '$details.product_id'},
+            'quantity': {'$sum': '$details.quantity'},
+            'amount': {'$sum': {'$multiply': [
+                '$details.quantity', '$details.unit_price']}},
+        }},
+    ])):
+        products_writer.replace(row)
+
+    counts = (
+        sales_writer.delete_stale(rollup_match),
+        products_writer.delete_stale(rollup_match),
+    )
+    bump_version('sales')
+    return counts
+
+
+def summarize(group_by, start=None, end=None):
+    """
+    Suma los rollups de ventas agrupando por los campos indicados, dentro
+    de los días [start, end). Devuelve una fila por grupo con los totales.
+    """
+    day_match = {}
+    if start:
+        day_match['$gte'] = rollup_day(start)
+    if end:
+        day_match['$lt'] = rollup_day(end)
+    pipeline = [
+        {'$match': {'day': day_match} if day_match else {}},
+        {'$group': {
+            '_id': {field: f'${field}' for field in group_by},
+            **{total: {'$sum': f'${total}'} for total in SALE_TOTALS},
+        }},
+    ]
+    return [
+        {**row.pop('_id'), **row}
+        for row in get_collection(DailySalesRollup._meta.db_table).aggregate(pipeline)
+    ]
@@ -1,10 +1,13 @@
 from bson import ObjectId
 from rest_framework import serializers
 from django.db.models import Sum
-from inventory.models import Product
+from inventory.models import Product, StockMovement
 from inventory.serializers import ProductSerializer
+from inventory.stock import InsufficientStock, adjust_stock, reserve_stock, release_stock
 from users.models import User
 from .models import SaleDetail, Sale, Client, Quote, QuoteDetail, Return, WorkOrder, DocumentCounter
+from .folios import void_folios
+from .rollups import RollupDelta, record
 
 
 class ObjectIdField(serializers.Field):
@@ -18,18 +21,33 @@ class ObjectIdField(serializers.Field):
             raise serializers.ValidationError("Invalid ObjectId")
 
 
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Busca primero en context['prefetched'][Modelo] (un dict pk -> objeto)
+    para que la validación de lotes no haga una consulta por relación.
+    """
+
+    def to_internal_value(self, data):
+        prefetched = self.context.get('prefetched', {}).get(self.queryset.model)
+        if prefetched is not None:
+            pk = self.pk_field.to_internal_value(data) if self.pk_field else data
+            if pk in prefetched:
+                return prefetched[pk]
+        return super().to_internal_value(data)
+
+
 class ClientSerializer(serializers.ModelSerializer):
     id = ObjectIdField(read_only=True)
 
     class Meta:
         model = Client
-        fields = '__all__'
+        exclude = ['search_tokens']
 
 
 class SaleDetailSerializer(serializers.ModelSerializer):
     id = ObjectIdField(read_only=True)
     product = ProductSerializer(read_only=True)
-    product_id = serializers.PrimaryKeyRelatedField(
+    product_id = PrefetchedPrimaryKeyRelatedField(
         queryset=Product.objects.all(),
         pk_field=ObjectIdField(),
         source='product',
@@ -42,11 +60,34 @@ class SaleDetailSerializer(serializers.ModelSerializer):
                   'quantity', 'unit_price', 'discount']
 
 
+def quantities_by_product(details):
+    """Suma las cantidades de las líneas por producto."""
+    quantities = {}
+    for detail in details:
+        quantities[detail.product.pk] = quantities.get(
+            detail.product.pk, 0) + detail.quantity
+    return quantities
+
+
+def sale_totals(details):
+    """Devuelve (neto, iva) de una venta a partir de sus líneas."""
+    net_amount = sum(detail.net_price * detail.quantity for detail in details)
+    iva = sum(detail.iva_amount * detail.quantity for detail in details)
+    return net_amount, iva
+
+
+def insufficient_stock_error(details, product_id):
+    product = next(
+        detail.product for detail in details if detail.product.pk == product_id)
+    return serializers.ValidationError(
+        f"No hay suficiente stock para el producto {product.name}")
+
+
 class SaleSerializer(serializers.ModelSerializer):
     id = ObjectIdField(read_only=True)
     details = SaleDetailSerializer(many=True)
     client = ClientSerializer(read_only=True)
-    client_id = serializers.PrimaryKeyRelatedField(
+    client_id = PrefetchedPrimaryKeyRelatedField(
         queryset=Client.objects.all(),
         source='client',
         pk_field=ObjectIdField(),
@@ -54,6 +95,10 @@ class SaleSerializer(serializers.ModelSerializer):
         allow_null=True,
         write_only=True
     )
+    # Sin UniqueValidator: la unicidad la garantiza el índice y se resuelve
+    # en la vista devolviendo la venta ya registrada.
+    idempotency_key = serializers.CharField(
+        max_length=64, required=False, allow_null=True)
 
     class Meta:
         model = Sale
@@ -83,88 +128,142 @@ class SaleSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 "Debe incluir al menos un producto en la venta.")
 
-        # Obtener folio siguiente
-        next_folio = DocumentCounter.get_next(
-            document_type=validated_data['document_type'])
+        details = [SaleDetail(**detail_data) for detail_data in details_data]
+        quantities = quantities_by_product(details)
 
-        sale = Sale.objects.create(
-            **validated_data,
-            folio=next_folio,
-            net_amount=0,
-            iva=0,
-            total_amount=0
-        )
-
-        total_net = 0
-        total_iva = 0
-
-        for detail_data in details_data:
-            product = detail_data['product']
-
-            # Validar stock
-            if product.stock < detail_data['quantity']:
-                raise serializers.ValidationError(
-                    f"No hay suficiente stock para el producto {product.name}"
-                )
-
-            # Crear detalle vinculado a la venta
-            detail = SaleDetail.objects.create(sale=sale, **detail_data)
-
-            # Actualizar stock
-            product.stock -= detail.quantity
-            product.save()
-
-            # Calcular montos
-            net_price = detail.net_price * detail.quantity
-            total_net += net_price
-            total_iva += detail.iva_amount * detail.quantity
-
-        sale.net_amount = total_net
-        sale.iva = total_iva
-        sale.total_amount = total_net + total_iva
-        sale.save()
+        # Descuento atómico de stock para todas las líneas (un solo bulk_write);
+        # el id se fija antes para registrar la venta en los movimientos
+        source = ('sale', ObjectId())
+        try:
+            reserve_stock(quantities, StockMovement.Reason.SALE, source)
+        except InsufficientStock as exc:
+            raise insufficient_stock_error(details, exc.product_id)
 
+        sale = next_folio = None
+        try:
+            # Obtener folio siguiente
+            next_folio = DocumentCounter.get_next(
+                document_type=validated_data['document_type'])
+
+            net_amount, iva = sale_totals(details)
+            sale = Sale.objects.create(
+                id=source[1],
+                **validated_data,
+                folio=next_folio,
+                net_amount=net_amount,
+                iva=iva,
+                total_amount=net_amount + iva
+            )
+
+            for detail in details:
+                detail.sale = sale
+            SaleDetail.objects.bulk_create(details)
+        except Exception:
+            if sale is not None:
+                Sale.objects.filter(pk=sale.pk).delete()
+            if next_folio is not None:
+                void_folios(validated_data['document_type'], [next_folio],
+                            "La venta no se pudo registrar.")
+            release_stock(quantities, StockMovement.Reason.REVERSAL, source)
+            raise
+
+        delta = RollupDelta()
+        delta.add_sale(sale)
+        delta.add_details(sale.created_at, details)
+        record(delta)
         return sale
 
     def update(self, instance, validated_data):
         details_data = validated_data.pop('details', None)
 
-        # Actualiza campos de la venta
-        instance = super().update(instance, validated_data)
+        # Se descuenta la venta tal como estaba y se suma como queda
+        delta = RollupDelta()
+        delta.add_sale(instance, -1)
 
         if details_data is not None:
-            # Eliminar detalles anteriores y restaurar stock
-            for old_detail in instance.details.all():
-                old_detail.product.stock += old_detail.quantity
-                old_detail.product.save()
-            instance.details.all().delete()
-
-            total_net = 0
-            total_iva = 0
-
-            for detail_data in details_data:
-                product = detail_data['product']
-
-                if product.stock < detail_data['quantity']:
-                    raise serializers.ValidationError(
-                        f"No hay suficiente stock para el producto {product.name}"
-                    )
-
-                detail = SaleDetail.objects.create(
-                    sale=instance, **detail_data)
-                product.stock -= detail.quantity
-                product.save()
+            net_amount, iva = self._reconcile_details(
+                instance, details_data, delta)
+            validated_data.update(
+                net_amount=net_amount,
+                iva=iva,
+                total_amount=net_amount + iva
+            )
+
+        # Actualiza campos y montos de la venta en un solo guardado
+        sale = super().update(instance, validated_data)
+        delta.add_sale(sale)
+        record(delta)
+        return sale
 
-                net_price = detail.net_price * detail.quantity
-                total_net += net_price
-                total_iva += detail.iva_amount * detail.quantity
+    def _reconcile_details(self, instance, details_data, delta):
+        """
+        Compara las líneas recibidas con los SaleDetail existentes y escribe
+        sólo las diferencias: las líneas iguales no se tocan, las que cambian
+        se actualizan en bloque y el stock se ajusta por el delta neto de
+        cada producto. Devuelve (neto, iva) calculados desde las líneas
+        recibidas, sin recargar los detalles. Las líneas escritas se anotan
+        en `delta` para los rollups diarios.
+        """
+        existing = {}
+        for detail in instance.details.all():
+            existing.setdefault(detail.product_id, []).append(detail)
+
+        incoming = [SaleDetail(sale=instance, **detail_data)
+                    for detail_data in details_data]
+        to_create, to_update, replaced = [], [], []
+        for detail in incoming:
+            candidates = existing.get(detail.product.pk, [])
+            match = next(
+                (old for old in candidates if self._same_line(old, detail)),
+                candidates[0] if candidates else None
+            )
+            if match is None:
+                to_create.append(detail)
+                continue
+            candidates.remove(match)
+            if not self._same_line(match, detail):
+                detail.pk = match.pk
+                to_update.append(detail)
+                replaced.append(match)
+        to_delete = [old for candidates in existing.values() for old in candidates]
+
+        # Delta de stock por producto: lo vendido antes menos lo vendido ahora
+        stock_deltas = {}
+        for detail in to_create + to_update:
+            stock_deltas[detail.product.pk] = stock_deltas.get(
+                detail.product.pk, 0) - detail.quantity
+        for old in to_delete + replaced:
+            stock_deltas[old.product_id] = stock_deltas.get(
+                old.product_id, 0) + old.quantity
 
-            instance.net_amount = total_net
-            instance.iva = total_iva
-            instance.total_amount = total_net + total_iva
-            instance.save()
+        try:
+            adjust_stock(stock_deltas, StockMovement.Reason.SALE_UPDATE,
+                         ('sale', instance.pk))
+        except InsufficientStock as exc:
+            raise insufficient_stock_error(incoming, exc.product_id)
 
-        return instance
+        try:
+            if to_create:
+                SaleDetail.objects.bulk_create(to_create)
+            if to_update:
+                SaleDetail.objects.bulk_update(
+                    to_update, ['quantity', 'unit_price', 'discount'])
+            if to_delete:
+                SaleDetail.objects.filter(
+                    pk__in=[old.pk for old in to_delete]).delete()
+        except Exception:
+            adjust_stock({pk: -change for pk, change in stock_deltas.items()},
+                         StockMovement.Reason.REVERSAL, ('sale', instance.pk))
+            raise
+
+        delta.add_details(instance.created_at, to_delete + replaced, -1)
+        delta.add_details(instance.created_at, to_create + to_update)
+        return sale_totals(incoming)
+
+    @staticmethod
+    def _same_line(old, new):
+        return (old.quantity, old.unit_price, old.discount) == (
+            new.quantity, new.unit_price, new.discount)
 
 
 class QuoteDetailSerializer(serializers.ModelSerializer):
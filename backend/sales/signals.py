@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+
+from backend.cache import bump_version
+from .models import Quote, Sale, SaleDetail
+
+
+# Invalida las respuestas cacheadas del dashboard de ventas
+def bump_sales_version(sender, **kwargs):
+    bump_version('sales')
+
+
+for model in (Sale, SaleDetail, Quote):
+    post_save.connect(bump_sales_version, sender=model)
+    post_delete.connect(bump_sales_version, sender=model)
@@ -1,14 +1,36 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework.response import Response
+from django.http import QueryDict
 from django.urls import reverse
 from users.models import User
-from inventory.models import Product
-from sales.models import Client, Sale, SaleDetail, Return, WorkOrder, Quote, QuoteDetail
-from datetime import date, timedelta
+from inventory.models import Product, StockMovement
+from inventory.stock import (
+    InsufficientStock, reconcile, record_initial_stock, refresh_stock_status, reserve_stock)
+from sales.models import (
+    Client, Sale, SaleDetail, Return, WorkOrder, Quote, QuoteDetail,
+    DailySalesRollup, DailyProductRollup)
+from sales.rollups import rebuild, summarize
+from sales.bulk import ingest_sales
+from sales.folios import FolioAllocator, audit_gaps, folio_allocator
+from sales.serializers import SaleSerializer
+from sales.analytics import add_months, current_month_start, dashboard_stats, monthly_profit_series
+from django.db import connection
+from django.core.cache import cache
+from backend.cache import _single_flight, bump_version, cached_response
+from backend.testing import ConstantQueriesMixin
+from rest_framework.exceptions import ValidationError
+import threading
+from unittest import mock
+from datetime import date, datetime, timedelta
+from django.utils import timezone
 import re
 from bson import ObjectId
 import json
+from io import BytesIO
+
+import openpyxl
 
 # Función para generar un RUT válido con dígito verificador
 def generar_rut_valido(base_numero):
@@ -50,6 +72,24 @@ class ClientTests(TestCase):
         self.assertEqual(Client.objects.count(), 1)
         self.assertEqual(Client.objects.first().first_name, "Juan")
 
+    def test_search_uses_tokens_and_relevance(self):
+        Client.objects.create(
+            national_id=generar_rut_valido(11111111), first_name="Josefina", last_name="Perez")
+        Client.objects.create(
+            national_id=generar_rut_valido(22222222), first_name="José", last_name="Pérez")
+        Client.objects.create(
+            national_id=generar_rut_valido(33333333), first_name="Ana", last_name="Soto")
+
+        response = self.client.get(reverse('client-list'), {'search': 'jose PEREZ'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [client['first_name'] for client in response.data['results']]
+        # Coincidencia de palabra completa primero, luego por prefijo
+        self.assertEqual(names, ["José", "Josefina"])
+
+        rut = generar_rut_valido(33333333).replace('-', '')
+        response = self.client.get(reverse('client-list'), {'search': rut})
+        self.assertEqual([c['first_name'] for c in response.data['results']], ["Ana"])
+
     def test_invalid_rut(self):
         url = reverse('client-list')
         data = {
@@ -108,6 +148,291 @@ class SaleTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(Sale.objects.count(), 1)
 
+class SaleStockTests(TestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(
+                name=f"Producto {i}",
+                stock=5,
+                price_clp=1000,
+                iva=True,
+                min_stock=1,
+                category="General",
+                supplier="Proveedor X"
+            )
+            for i in range(3)
+        ]
+
+    def _sale_data(self, products, quantity=1):
+        return {
+            "document_type": "BOL",
+            "payment_method": "EF",
+            "details": [{
+                "product_id": str(product.id),
+                "quantity": quantity,
+                "unit_price": 1000
+            } for product in products]
+        }
+
+    def _create_sale(self, data):
+        serializer = SaleSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def test_create_sale_round_trips(self):
+        """
+        Antes: un insert y un save de producto por línea, más venta, folio y
+        guardado de totales (2N + 3). Ahora: un descuento condicionado por
+        línea, folio, venta y detalles, más un $inc por rollup y un insert en
+        el libro de movimientos (N + 6).
+        """
+        serializer = SaleSerializer(data=self._sale_data(self.products))
+        serializer.is_valid(raise_exception=True)
+        with self.assertNumQueries(9):
+            sale = serializer.save()
+
+        self.assertEqual(sale.details.count(), 3)
+        for product in self.products:
+            product.refresh_from_db()
+            self.assertEqual(product.stock, 4)
+
+    def test_update_writes_only_changed_lines(self):
+        sale = self._create_sale(self._sale_data(self.products))
+        data = self._sale_data(self.products)
+        data["details"][0]["quantity"] = 3
+
+        serializer = SaleSerializer(sale, data=data)
+        serializer.is_valid(raise_exception=True)
+        # detalles actuales, stock, movimiento, detalle modificado, venta y rollups
+        with self.assertNumQueries(7):
+            sale = serializer.save()
+
+        stocks = []
+        for product in self.products:
+            product.refresh_from_db()
+            stocks.append(product.stock)
+        self.assertEqual(stocks, [2, 4, 4])
+        self.assertEqual(sale.details.count(), 3)
+        self.assertEqual(sale.total_amount, 5000)
+
+    def test_stock_movements_follow_the_sale(self):
+        sale = self._create_sale(self._sale_data(self.products))
+        data = self._sale_data(self.products)
+        data["details"][0]["quantity"] = 3
+        serializer = SaleSerializer(sale, data=data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        movements = StockMovement.objects.filter(source_type='sale', source_id=str(sale.pk))
+        self.assertEqual(
+            sorted(movements.values_list('reason', 'delta')),
+            [('sale', -1), ('sale', -1), ('sale', -1), ('sale_update', -2)])
+
+        # Los productos del setUp no tienen movimiento inicial
+        record_initial_stock(self.products)
+        self.assertEqual(reconcile(), [])
+
+    def test_stock_status_follows_stock(self):
+        self._create_sale(self._sale_data(self.products[:1], quantity=5))
+        self._create_sale(self._sale_data(self.products[1:2], quantity=4))
+
+        statuses = []
+        for product in self.products:
+            product.refresh_from_db()
+            statuses.append(product.stock_status)
+        self.assertEqual(statuses, ['out', 'normal', 'normal'])
+
+        Product.objects.filter(pk=self.products[1].pk).update(min_stock=3)
+        refresh_stock_status(Product, {'_id': self.products[1].pk})
+        self.products[1].refresh_from_db()
+        self.assertEqual(self.products[1].stock_status, 'low')
+
+    def test_update_removes_and_adds_lines(self):
+        sale = self._create_sale(self._sale_data(self.products[:2]))
+        serializer = SaleSerializer(
+            sale, data=self._sale_data(self.products[1:], quantity=2))
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        stocks = []
+        for product in self.products:
+            product.refresh_from_db()
+            stocks.append(product.stock)
+        self.assertEqual(stocks, [5, 3, 3])
+        self.assertEqual(
+            sorted(sale.details.values_list('quantity', flat=True)), [2, 2])
+
+    def test_insufficient_stock_rolls_back_every_line(self):
+        data = self._sale_data(self.products)
+        data["details"][-1]["quantity"] = 6
+
+        with self.assertRaises(ValidationError):
+            self._create_sale(data)
+
+        self.assertEqual(Sale.objects.count(), 0)
+        for product in self.products:
+            product.refresh_from_db()
+            self.assertEqual(product.stock, 5)
+
+    def test_missing_product_reverts_without_creating_it(self):
+        missing = self.products[1].pk
+        Product.objects.filter(pk=missing).delete()
+
+        with self.assertRaises(InsufficientStock) as context:
+            reserve_stock({product.pk: 1 for product in self.products})
+
+        self.assertEqual(context.exception.product_id, missing)
+        self.assertFalse(Product.objects.filter(pk=missing).exists())
+        for product in (self.products[0], self.products[2]):
+            product.refresh_from_db()
+            self.assertEqual(product.stock, 5)
+
+    def test_concurrent_sales_do_not_oversell(self):
+        product = self.products[0]
+        results = []
+
+        def sell():
+            try:
+                self._create_sale(self._sale_data([product]))
+                results.append(True)
+            except ValidationError:
+                results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=sell) for _ in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(results.count(True), 5)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(SaleDetail.objects.filter(product=product).count(), 5)
+
+
+class BulkSaleTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="caja@example.com",
+            password="testpass123",
+            national_id=generar_rut_valido(12345678),
+            position="Vendedor"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(
+            name="Producto Test",
+            stock=3,
+            price_clp=1000,
+            iva=True,
+            min_stock=1,
+            category="General",
+            supplier="Proveedor X"
+        )
+        self.url = reverse('sale-bulk')
+
+    def _sale(self, key, quantity=1):
+        return {
+            "idempotency_key": key,
+            "document_type": "BOL",
+            "payment_method": "EF",
+            "details": [{
+                "product_id": str(self.product.id),
+                "quantity": quantity,
+                "unit_price": 1190
+            }]
+        }
+
+    def test_bulk_creates_sales_with_consecutive_folios(self):
+        response = self.client.post(
+            self.url, {"sales": [self._sale("a"), self._sale("b")]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        folios = [result['folio'] for result in response.data['results']]
+        self.assertEqual(folios[1], folios[0] + 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+
+    def test_replayed_batch_is_not_duplicated(self):
+        batch = {"sales": [self._sale("a"), self._sale("b")]}
+        first = self.client.post(self.url, batch, format='json')
+        replay = self.client.post(self.url, batch, format='json')
+        self.assertEqual(replay.data['duplicate'], 2)
+        self.assertEqual(
+            [r['id'] for r in replay.data['results']],
+            [r['id'] for r in first.data['results']]
+        )
+        self.assertEqual(Sale.objects.count(), 2)
+
+    def test_items_without_stock_fail_individually(self):
+        response = self.client.post(
+            self.url, [self._sale("a", 2), self._sale("b", 2), self._sale("c", 1)],
+            format='json')
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, ['created', 'error', 'created'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+
+    def test_non_object_items_fail_individually(self):
+        response = self.client.post(self.url, [1, [2], self._sale("a")], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, ['error', 'error', 'created'])
+
+    def test_invalid_idempotency_keys_fail_individually(self):
+        response = self.client.post(
+            self.url,
+            [{**self._sale("a"), "idempotency_key": ["a"]},
+             {**self._sale("b"), "idempotency_key": {"b": 1}},
+             self._sale(7), self._sale("7")],
+            format='json')
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results],
+                         ['error', 'error', 'created', 'duplicate'])
+        self.assertIn('idempotency_key', results[0]['errors'])
+        self.assertEqual(results[3]['id'], results[2]['id'])
+
+    def _racing(self, concurrent):
+        """Ejecuta `concurrent` justo antes de la primera reserva de folios."""
+        allocate, calls = folio_allocator.allocate, []
+
+        def racing(*args, **kwargs):
+            if not calls:
+                calls.append(args)
+                concurrent()
+            return allocate(*args, **kwargs)
+        return mock.patch.object(folio_allocator, 'allocate', side_effect=racing)
+
+    def test_key_registered_during_ingest_is_duplicate(self):
+        concurrent = {}
+        with self._racing(lambda: concurrent.update(ingest_sales([self._sale("a")])[0])):
+            response = self.client.post(
+                self.url, [self._sale("a"), self._sale("b")], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], ['duplicate', 'created'])
+        self.assertEqual(results[0]['id'], concurrent['id'])
+        self.assertEqual(Sale.objects.count(), 2)
+        # El stock reservado para la venta duplicada se devuelve
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+        # y su folio queda anulado en la auditoría
+        voided = {gap['folio']: gap['voided'] for gap in audit_gaps('BOL')}
+        self.assertIn('idempotency_key', voided[results[1]['folio'] - 1])
+
+    def test_single_create_returns_sale_registered_concurrently(self):
+        concurrent = {}
+        with self._racing(lambda: concurrent.update(ingest_sales([self._sale("a")])[0])):
+            response = self.client.post(reverse('sale-list'), self._sale("a"), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(str(response.data['id']), concurrent['id'])
+        self.assertEqual(Sale.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+
+
 class QuoteTests(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -308,4 +633,382 @@ class WorkOrderTests(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         work_order.refresh_from_db()
-        self.assertEqual(work_order.status, "en_proceso")
\ No newline at end of file
+        self.assertEqual(work_order.status, "en_proceso")
+
+class FolioAllocatorTests(TestCase):
+    def test_block_allocation_is_consecutive(self):
+        allocator = FolioAllocator(block_size=5)
+        first = allocator.next('BOL')
+        folios = [first] + allocator.allocate('BOL', 6)
+        self.assertEqual(folios, list(range(first, first + 7)))
+
+    def test_separate_allocators_do_not_overlap(self):
+        a = FolioAllocator(block_size=3)
+        b = FolioAllocator(block_size=3)
+        folios = a.allocate('FAC', 2) + b.allocate('FAC', 2) + a.allocate('FAC', 2)
+        self.assertEqual(len(folios), len(set(folios)))
+
+    def test_audit_reports_unused_folios(self):
+        allocator = FolioAllocator(block_size=4)
+        used, unused = allocator.allocate('BOL', 2)
+        Sale.objects.create(
+            document_type='BOL', folio=used,
+            net_amount=1, iva=0, total_amount=1
+        )
+        missing = [gap['folio'] for gap in audit_gaps('BOL')]
+        self.assertIn(unused, missing)
+        self.assertNotIn(used, missing)
+
+
+class MonthlyProfitTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="admin@example.com",
+            password="testpass123",
+            national_id=generar_rut_valido(12345678),
+            position="Administrador"
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def _sale_at(self, created_at, total):
+        sale = Sale.objects.create(
+            document_type='BOL', folio=1,
+            net_amount=total, iva=0, total_amount=total
+        )
+        Sale.objects.filter(pk=sale.pk).update(created_at=created_at)
+
+    def test_add_months_crosses_year_boundaries(self):
+        start = date(2025, 1, 1)
+        self.assertEqual(add_months(start, -1), date(2024, 12, 1))
+        self.assertEqual(add_months(start, 13), date(2026, 2, 1))
+        self.assertEqual(add_months(start, -25), date(2022, 12, 1))
+
+    def test_series_groups_by_calendar_month_in_one_query(self):
+        month = current_month_start()
+        self._sale_at(month + timedelta(hours=1), 1000)
+        self._sale_at(add_months(month, -12) + timedelta(hours=1), 400)
+        self._sale_at(add_months(month, -24) + timedelta(hours=1), 100)
+        self._sale_at(add_months(month, -1) + timedelta(hours=1), 50)
+
+        with self.assertNumQueries(1):
+            series = monthly_profit_series(months=2, compare_years=2)
+
+        self.assertEqual([entry['value'] for entry in series], [50, 1000])
+        self.assertEqual(series[-1]['previous_values'], [400, 100])
+        self.assertEqual(series[-1]['previous_value'], 400)
+
+    def test_invalid_parameters(self):
+        url = reverse('dashboard-monthly-profit')
+        response = self.client.get(url, {'months': 100})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DashboardStatsTests(TestCase):
+    def _client(self, national_id, email):
+        return Client.objects.create(
+            national_id=national_id, first_name='Ana', last_name='Pérez',
+            email=email
+        )
+
+    def _sale(self, client, total, sale_status='PA', created_at=None):
+        sale = Sale.objects.create(
+            document_type='BOL', folio=1, client=client, status=sale_status,
+            net_amount=total, iva=0, total_amount=total
+        )
+        if created_at:
+            Sale.objects.filter(pk=sale.pk).update(created_at=created_at)
+
+    def test_stats_in_two_aggregations(self):
+        first = self._client(generar_rut_valido(11111111), 'ana1@example.com')
+        second = self._client(generar_rut_valido(22222222), 'ana2@example.com')
+        self._sale(first, 500)
+        self._sale(second, 300, sale_status='PE')
+        self._sale(first, 200, created_at=add_months(current_month_start(), -1))
+        Quote.objects.create(client=first, total=100, status='AP')
+
+        with self.assertNumQueries(2):
+            data, timings = dashboard_stats()
+
+        self.assertEqual(set(timings), {'sales', 'quotes'})
+        self.assertEqual(data['monthly_profit'], 800)
+        self.assertEqual(data['previous_month_profit'], 200)
+        self.assertEqual(data['total_sales'], 2)
+        self.assertEqual((data['paid_sales'], data['due_sales']), (1, 1))
+        self.assertEqual(data['approved_quotes'], 1)
+        # Clientes homónimos no se mezclan
+        self.assertEqual(
+            [(c['id'], c['value']) for c in data['top_clients']],
+            [(str(first.id), 500), (str(second.id), 300)]
+        )
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="admin@example.com",
+            password="testpass123",
+            national_id=generar_rut_valido(12345678),
+            position="Administrador"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(
+            name="Producto Rollup", stock=20, price_clp=1000, iva=False, min_stock=1)
+
+    def _create_sale(self, quantity, **extra):
+        serializer = SaleSerializer(data={
+            "document_type": "BOL",
+            "payment_method": "EF",
+            "details": [{"product_id": str(self.product.id),
+                         "quantity": quantity, "unit_price": 1000}],
+            **extra,
+        })
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def _rollups(self):
+        sales = sorted(
+            (row.status, row.count, row.total_amount)
+            for row in DailySalesRollup.objects.all() if row.count)
+        products = [
+            (row.product_id, row.quantity, row.amount)
+            for row in DailyProductRollup.objects.all() if row.quantity]
+        return sales, products
+
+    def test_incremental_updates_match_rebuild(self):
+        paid = self._create_sale(2)
+        pending = self._create_sale(1)
+        self.client.patch(
+            reverse('sale-cambiar-estado', args=[paid.id]), {'status': 'PA'},
+            format='json')
+        serializer = SaleSerializer(pending, data={
+            "document_type": "BOL",
+            "payment_method": "EF",
+            "details": [{"product_id": str(self.product.id),
+                         "quantity": 4, "unit_price": 1000}],
+        })
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        removed = self._create_sale(3)
+        self.client.delete(reverse('sale-detail', args=[removed.id]))
+
+        incremental = self._rollups()
+        self.assertEqual(incremental[0], [('PA', 1, 2000), ('PE', 1, 4000)])
+        self.assertEqual(incremental[1], [(self.product.id, 6, 6000)])
+
+        rebuild()
+        self.assertEqual(self._rollups(), incremental)
+
+    def test_rebuild_repairs_rows_in_range_only(self):
+        self._create_sale(2)
+        today = timezone.localdate()
+        DailySalesRollup.objects.filter(day=today).update(count=99, total_amount=1)
+        # Fila de un día sin ventas dentro del rango y otra fuera de él
+        stale = DailySalesRollup.objects.create(
+            day=today - timedelta(days=1), document_type='FAC',
+            payment_method='EF', status='PA', count=1, total_amount=500)
+        outside = DailySalesRollup.objects.create(
+            day=today - timedelta(days=5), document_type='FAC',
+            payment_method='EF', status='PA', count=1, total_amount=700)
+
+        self.assertEqual(rebuild(today - timedelta(days=1), today), (1, 1))
+
+        row = DailySalesRollup.objects.get(day=today)
+        self.assertEqual((row.count, row.total_amount), (1, 2000))
+        self.assertFalse(DailySalesRollup.objects.filter(pk=stale.pk).exists())
+        self.assertTrue(DailySalesRollup.objects.filter(pk=outside.pk).exists())
+        self.assertEqual(
+            [(r.quantity, r.amount) for r in DailyProductRollup.objects.all()], [(2, 2000)])
+
+    def test_summarize_by_payment_method(self):
+        self._create_sale(1)
+        self._create_sale(2, payment_method="TR")
+        rows = {row['payment_method']: row['total_amount']
+                for row in summarize(['payment_method'])}
+        self.assertEqual(rows, {'EF': 1000, 'TR': 2000})
+
+
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="admin@example.com",
+            password="testpass123",
+            national_id=generar_rut_valido(12345678),
+            position="Administrador"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('dashboard-stats')
+
+    def _create_sale(self, total):
+        return Sale.objects.create(
+            document_type='BOL', folio=1,
+            net_amount=total, iva=0, total_amount=total
+        )
+
+    def test_signals_invalidate_cached_stats(self):
+        sale = self._create_sale(1000)
+        self.assertEqual(self.client.get(self.url).data['monthly_profit'], 1000)
+
+        # update() no dispara señales: se sigue sirviendo la respuesta cacheada
+        Sale.objects.filter(pk=sale.pk).update(total_amount=3000)
+        self.assertEqual(self.client.get(self.url).data['monthly_profit'], 1000)
+
+        self._create_sale(500)
+        self.assertEqual(self.client.get(self.url).data['monthly_profit'], 3500)
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+        release = threading.Event()
+
+        class View:
+            @cached_response('sales')
+            def get(self, request):
+                calls.append(1)
+                release.wait(5)
+                return Response({'calls': len(calls)})
+
+        request = type('Request', (), {'query_params': QueryDict('a=1')})()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(View().get(request).data))
+            for _ in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'calls': 1}] * 20)
+
+        bump_version('sales')
+        self.assertEqual(View().get(request).data, {'calls': 2})
+
+    @override_settings(RESPONSE_CACHE_WAIT=0)
+    def test_lock_held_by_another_process_is_kept(self):
+        cache.add('stats:lock', 'otro-proceso')
+        response = _single_flight('stats', lambda: Response({'calls': 1}))
+        self.assertEqual(response.data, {'calls': 1})
+        self.assertEqual(cache.get('stats'), {'calls': 1})
+        self.assertEqual(cache.get('stats:lock'), 'otro-proceso')
+
+
+class ListQueryCountTests(ConstantQueriesMixin, TestCase):
+    """Listados de ventas, cotizaciones, devoluciones y órdenes de trabajo."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="admin@example.com",
+            password="testpass123",
+            national_id=generar_rut_valido(12345678),
+            position="Administrador"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.customer = Client.objects.create(
+            national_id=generar_rut_valido(87654321),
+            first_name="Cliente",
+            last_name="Test"
+        )
+        self.products = [
+            Product.objects.create(
+                name=f"Producto {i}", stock=10, price_clp=1000, iva=True, min_stock=1)
+            for i in range(2)
+        ]
+        self.counter = 0
+
+    def _sale(self):
+        self.counter += 1
+        sale = Sale.objects.create(
+            document_type='BOL', folio=self.counter, client=self.customer,
+            net_amount=1000, iva=190, total_amount=1190
+        )
+        for product in self.products:
+            SaleDetail.objects.create(
+                sale=sale, product=product, quantity=1, unit_price=1190)
+        return sale
+
+    def _quote(self):
+        quote = Quote.objects.create(client=self.customer, total=2000)
+        for product in self.products:
+            QuoteDetail.objects.create(
+                quote=quote, product=product, quantity=1, unit_price=1000)
+
+    def _return(self):
+        Return.objects.create(
+            client=self.customer, sale=self._sale(), product=self.products[0],
+            quantity=1, reason="Falla"
+        )
+
+    def _work_order(self):
+        self.counter += 1
+        WorkOrder.objects.create(
+            numero_orden=f"WO-TEST-{self.counter:04d}", trabajador=self.user,
+            tipo_tarea="Reparación", descripcion="Detalle", plazo=date.today()
+        )
+
+    def test_sale_list(self):
+        self.assertConstantQueries(reverse('sale-list'), self._sale)
+
+    def test_quote_list(self):
+        self.assertConstantQueries(reverse('quote-list'), self._quote)
+
+    def test_return_list(self):
+        self.assertConstantQueries(reverse('return-list'), self._return)
+
+    def test_work_order_list(self):
+        self.assertConstantQueries(reverse('workorder-list'), self._work_order)
+
+
+class SaleExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="admin@example.com",
+            password="testpass123",
+            national_id=generar_rut_valido(12345678),
+            position="Administrador"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.customer = Client.objects.create(
+            national_id=generar_rut_valido(87654321),
+            first_name="Cliente",
+            last_name="Test"
+        )
+        for folio, customer in enumerate((self.customer, None), start=1):
+            Sale.objects.create(
+                document_type='BOL', folio=folio, client=customer,
+                net_amount=1000, iva=190, total_amount=1190
+            )
+
+    def test_csv_export_uses_list_filters(self):
+        response = self.client.get(
+            reverse('sale-export'), {'file_format': 'csv', 'search': 'Cliente'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0].split(',')[:4], ['id', 'fecha', 'documento', 'folio'])
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Cliente Test', lines[1])
+
+    def test_xlsx_export_is_a_workbook(self):
+        response = self.client.get(reverse('sale-export'), {'ordering': 'folio'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Disposition'].endswith('.xlsx'))
+
+        workbook = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)))
+        rows = list(workbook['ventas'].iter_rows(values_only=True))
+        self.assertEqual(rows[0][:4], ('id', 'fecha', 'documento', 'folio'))
+        self.assertEqual([row[3] for row in rows[1:]], [1, 2])
+        self.assertEqual([row[5] for row in rows[1:]], ['Cliente Test', None])
+        self.assertIsInstance(rows[1][1], datetime)
+        self.assertEqual(rows[1][-1], 1190)
+
+    def test_invalid_format(self):
+        response = self.client.get(reverse('sale-export'), {'file_format': 'pdf'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -7,14 +7,22 @@ from rest_framework import status
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import get_template
 from django.conf import settings
+from django.db.models import Prefetch
+from django.db import IntegrityError
 from weasyprint import HTML
 import tempfile
 import datetime
 import os
 
 from users.pagination import CustomPagination
+from inventory.models import StockMovement
+from inventory.stock import InsufficientStock, release_stock, reserve_stock
+from backend.exports import ExportMixin
+from backend.search import TokenSearchFilter
 from .serializers import ClientSerializer, SaleSerializer, QuoteSerializer, ReturnSerializer, WorkOrderSerializer
-from .models import Client, Sale, DocumentCounter, Quote, Return, WorkOrder
+from .models import Client, Sale, SaleDetail, DocumentCounter, Quote, QuoteDetail, Return, WorkOrder
+from .bulk import BulkSaleTooLarge, ingest_sales
+from .rollups import RollupDelta, record
 
 
 class ClientViewSet(viewsets.ModelViewSet):
@@ -22,7 +30,7 @@ class ClientViewSet(viewsets.ModelViewSet):
     serializer_class = ClientSerializer
     pagination_class = CustomPagination
     filter_backends = [DjangoFilterBackend,
-                       filters.SearchFilter, filters.OrderingFilter]
+                       filters.OrderingFilter, TokenSearchFilter]
     search_fields = ['first_name', 'last_name',
                      'national_id', 'email',]
     ordering_fields = ['first_name', 'last_name',
@@ -66,16 +74,41 @@ class ClientViewSet(viewsets.ModelViewSet):
         )
 
 
-class SaleViewSet(viewsets.ModelViewSet):
-    queryset = Sale.objects.all().select_related('client')
+class SaleViewSet(ExportMixin, viewsets.ModelViewSet):
+    # Cliente y detalles con su producto, tal como los anida SaleSerializer
+    queryset = Sale.objects.all().select_related('client').prefetch_related(
+        Prefetch('details', queryset=SaleDetail.objects.select_related('product'))
+    )
     filter_backends = [DjangoFilterBackend,
                        filters.SearchFilter, filters.OrderingFilter]
     serializer_class = SaleSerializer
     search_fields = ['client__first_name', 'client__last_name',
                      'client__national_id', 'client__email', 'client__phone_number']
     pagination_class = CustomPagination
+    export_filename = 'ventas'
+    export_columns = [
+        ("id", 'pk'), ("fecha", 'created_at'), ("documento", 'document_type'),
+        ("folio", 'folio'), ("rut_cliente", 'client.national_id'),
+        ("cliente", lambda sale: f"{sale.client.first_name} {sale.client.last_name}" if sale.client else None),
+        ("medio_pago", 'payment_method'), ("estado", 'status'),
+        ("neto", 'net_amount'), ("iva", 'iva'), ("total", 'total_amount'),
+    ]
+
+    def get_export_queryset(self):
+        # La exportación no incluye los detalles
+        return super().get_export_queryset().prefetch_related(None)
 
     def create(self, request, *args, **kwargs):
+        # Un reintento del punto de venta devuelve la venta ya registrada
+        idempotency_key = request.data.get('idempotency_key')
+        if idempotency_key:
+            sale = Sale.objects.filter(idempotency_key=idempotency_key).first()
+            if sale is not None:
+                return Response(
+                    self.get_serializer(sale).data,
+                    status=status.HTTP_200_OK
+                )
+
         serializer = self.get_serializer(data=request.data)
         try:
             serializer.is_valid(raise_exception=True)
@@ -84,6 +117,20 @@ class SaleViewSet(viewsets.ModelViewSet):
                 self.get_serializer(sale).data,
                 status=status.HTTP_201_CREATED
             )
+        except IntegrityError as e:
+            # Un reintento simultáneo registró la clave después de la consulta
+            # anterior; el serializer ya devolvió el stock de este intento.
+            sale = Sale.objects.filter(
+                idempotency_key=idempotency_key).first() if idempotency_key else None
+            if sale is not None:
+                return Response(
+                    self.get_serializer(sale).data,
+                    status=status.HTTP_200_OK
+                )
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
             return Response(
                 {"error": str(e)},
@@ -99,6 +146,8 @@ class SaleViewSet(viewsets.ModelViewSet):
         try:
             serializer.is_valid(raise_exception=True)
             sale = serializer.save()
+            # Los detalles prefetcheados quedaron desactualizados
+            sale._prefetched_objects_cache = {}
             return Response(
                 self.get_serializer(sale).data,
                 status=status.HTTP_200_OK
@@ -109,6 +158,44 @@ class SaleViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    def perform_destroy(self, instance):
+        delta = RollupDelta()
+        delta.add_sale(instance, -1)
+        delta.add_details(instance.created_at, instance.details.all(), -1)
+        instance.delete()
+        record(delta)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Recibe un lote de ventas (lista o {"sales": [...]}) y devuelve un
+        resultado por venta. Las ventas con idempotency_key ya registrada se
+        informan como 'duplicate', por lo que reenviar un lote es seguro.
+        """
+        items = request.data.get('sales') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {"error": "Debe enviar una lista de ventas."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            results = ingest_sales(items)
+        except BulkSaleTooLarge as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        summary = {
+            state: sum(1 for result in results if result['status'] == state)
+            for state in ('created', 'duplicate', 'error')
+        }
+        return Response(
+            {**summary, "results": results},
+            status=status.HTTP_201_CREATED if summary['created'] else status.HTTP_200_OK
+        )
+
     @action(detail=False, methods=['GET'])
     def document_counter(self, request):
         document_type = request.query_params.get('document_type')
@@ -138,14 +225,21 @@ class SaleViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        delta = RollupDelta()
+        delta.add_sale(sale, -1)
         sale.status = new_status
         sale.save()
+        delta.add_sale(sale)
+        record(delta)
+
         serializer = self.get_serializer(sale)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 class QuoteViewSet(viewsets.ModelViewSet):
-    queryset = Quote.objects.all()
+    queryset = Quote.objects.all().select_related('client').prefetch_related(
+        Prefetch('details', queryset=QuoteDetail.objects.select_related('product'))
+    )
     serializer_class = QuoteSerializer
     pagination_class = CustomPagination
     filter_backends = [DjangoFilterBackend,
@@ -291,6 +385,22 @@ class ReturnViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        # Al completarse la devolución el producto vuelve al stock; si deja
+        # de estar completada, se descuenta de nuevo
+        completed = Return.Status.COMPLETED
+        source = ('return', return_obj.pk)
+        quantities = {return_obj.product_id: return_obj.quantity}
+        try:
+            if new_status == completed and return_obj.status != completed:
+                release_stock(quantities, StockMovement.Reason.RETURN, source)
+            elif return_obj.status == completed and new_status != completed:
+                reserve_stock(quantities, StockMovement.Reason.REVERSAL, source)
+        except InsufficientStock:
+            return Response(
+                {"error": "No hay stock suficiente para revertir la devolución."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         return_obj.status = new_status
         return_obj.save()
         
@@ -299,7 +409,7 @@ class ReturnViewSet(viewsets.ModelViewSet):
 
 
 class WorkOrderViewSet(viewsets.ModelViewSet):
-    queryset = WorkOrder.objects.all()
+    queryset = WorkOrder.objects.all().select_related('trabajador')
     serializer_class = WorkOrderSerializer
     pagination_class = CustomPagination
 
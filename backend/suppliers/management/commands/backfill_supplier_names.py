@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne  # type: ignore
+
+from backend.mongo import get_collection
+from backend.search import search_tokens
+from backend.utils import normalize_name
+from suppliers.models import Supplier
+
+
+class Command(BaseCommand):
+    help = ("Completa el nombre normalizado de los proveedores existentes. "
+            "Los nombres repetidos se informan y quedan sin normalizar (no se "
+            "pueden guardar hasta renombrarlos); con --rename se les agrega un "
+            "sufijo numérico.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rename', action='store_true',
+            help='Renombra los proveedores repetidos como "Nombre (2)", "Nombre (3)"...'
+        )
+
+    def handle(self, *args, **options):
+        collection = get_collection(Supplier._meta.db_table)
+        fields = {name: 1 for name in Supplier.search_index_fields}
+        taken = {}
+        pending = []
+        for supplier in collection.find({**fields, 'normalized_name': 1}).sort('_id', 1):
+            normalized = normalize_name(supplier.get('name') or '')
+            if supplier.get('normalized_name') == normalized:
+                taken.setdefault(normalized, supplier['_id'])
+            else:
+                pending.append((supplier, normalized))
+
+        operations = []
+        duplicates = []
+        renamed = 0
+        for supplier, normalized in pending:
+            values = {'normalized_name': normalized}
+            if normalized in taken:
+                if not options['rename']:
+                    duplicates.append(supplier)
+                    continue
+                values = self.rename(supplier, taken)
+                renamed += 1
+                self.stdout.write(
+                    f"Proveedor {supplier['_id']} ({supplier.get('name')}) "
+                    f"renombrado a {values['name']}.")
+            taken[values['normalized_name']] = supplier['_id']
+            operations.append(UpdateOne({'_id': supplier['_id']}, {'$set': values}))
+
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+
+        for supplier in duplicates:
+            self.stdout.write(self.style.WARNING(
+                f"Proveedor {supplier['_id']} ({supplier.get('name')}): el nombre "
+                f"ya existe en {taken[normalize_name(supplier.get('name') or '')]}."))
+        self.stdout.write(self.style.SUCCESS(
+            f"Nombres normalizados: {len(operations)} actualizados "
+            f"({renamed} renombrados), {len(duplicates)} repetidos."))
+
+    def rename(self, supplier, taken):
+        """Primer "Nombre (n)" libre, con sus tokens de búsqueda."""
+        base = (supplier.get('name') or '').strip()
+        number = 2
+        while normalize_name(f"{base} ({number})") in taken:
+            number += 1
+        name = f"{base} ({number})"
+        values = {**supplier, 'name': name}
+        return {
+            'name': name,
+            'normalized_name': normalize_name(name),
+            'search_tokens': search_tokens(
+                *(values.get(field) for field in Supplier.search_index_fields)),
+        }
@@ -1,14 +1,41 @@
-from django.db import models
+from django.db import IntegrityError, models
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 
+from backend.search import SearchIndexedModel
+from backend.utils import normalize_name
+
+
+class Supplier(SearchIndexedModel):
+    search_index_fields = ('name', 'rut', 'email', 'address')
 
-class Supplier(models.Model):
     name = models.CharField(max_length=255)
     address = models.CharField(max_length=255)
     phone = models.CharField(max_length=20)
     email = models.EmailField()
-    rut = models.CharField(max_length=13, unique=True)
+    # Nulo para los proveedores creados desde la carga masiva de productos
+    rut = models.CharField(max_length=13, unique=True, null=True)
     category = models.CharField(max_length=100)
+    # Nombre normalizado (normalize_name) para búsquedas exactas por índice
+    normalized_name = models.CharField(
+        max_length=255, unique=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['search_tokens'])]
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        try:
+            super().save(*args, **kwargs)
+        except IntegrityError:
+            # Proveedores con nombre repetido que backfill_supplier_names dejó
+            # sin normalizar: se deben renombrar antes de poder guardarlos
+            duplicates = Supplier.objects.filter(
+                normalized_name=self.normalized_name).exclude(pk=self.pk)
+            if duplicates.exists():
+                raise ValidationError(
+                    {'name': "Ya existe un proveedor con este nombre."})
+            raise
 
     def __str__(self):
         return self.name
@@ -92,17 +119,16 @@ class ReturnSupplier(models.Model):
     reason = models.TextField()
     return_date = models.DateField()
 
+    # Ambas usan details.all() para aprovechar el prefetch del listado
     @property
     def total_items(self):
         """Cantidad total de items en el retorno"""
-        return self.details.aggregate(
-            total=models.Sum('quantity')
-        )['total'] or 0
+        return sum(detail.quantity for detail in self.details.all())
 
     @property
     def total_products(self):
         """Cantidad total de productos diferentes"""
-        return self.details.count()
+        return len(self.details.all())
 
     def __str__(self):
         return f"{self.id} - {self.supplier.name}"
@@ -1,6 +1,8 @@
 from rest_framework import serializers
+from django.core.exceptions import ValidationError as DjangoValidationError
 from inventory.models import Product
 from .models import Supplier, BuyOrder, BuyOrderDetail, ReturnSupplierDetail, ReturnSupplier
+from backend.utils import normalize_name
 from bson import ObjectId
 import re
 
@@ -25,7 +27,22 @@ class SupplierSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Supplier
-        fields = '__all__'
+        exclude = ['search_tokens']
+        extra_kwargs = {'rut': {'required': True, 'allow_null': False}}
+
+    def validate_name(self, value):
+        duplicates = Supplier.objects.filter(normalized_name=normalize_name(value))
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError("Ya existe un proveedor con este nombre.")
+        return value
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(exc.message_dict)
 
     def validate_rut(self, value):
         rut = re.sub(r'\.', '', value)
@@ -1,3 +1,153 @@
+from datetime import date
+from io import BytesIO, StringIO
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from openpyxl import Workbook
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from backend.search import WORD_MARK
+from backend.testing import ConstantQueriesMixin
+from inventory.importers import ProductImporter
+from inventory.models import Product
+from users.models import User
+from .models import BuyOrder, BuyOrderDetail, ReturnSupplier, ReturnSupplierDetail, Supplier
+
+
+class ListQueryCountTests(ConstantQueriesMixin, TestCase):
+    """Listados de órdenes de compra y devoluciones a proveedores."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="admin@example.com",
+            password="testpass123",
+            national_id="12345678-5",
+            position="Administrador"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.supplier = Supplier.objects.create(
+            name="Proveedor", address="Calle 1", phone="912345678",
+            email="proveedor@example.com", rut="76543210-3", category="General"
+        )
+        self.product = Product.objects.create(
+            name="Producto", stock=10, price_clp=1000, iva=True, min_stock=1)
+
+    def _buy_order(self):
+        order = BuyOrder.objects.create(
+            supplier=self.supplier.name, net_amount=1000, iva=190, total_amount=1190)
+        for quantity in (1, 2):
+            BuyOrderDetail.objects.create(
+                buy_order=order, product=self.product.name,
+                quantity=quantity, unit_price=500)
+
+    def _return_supplier(self):
+        return_supplier = ReturnSupplier.objects.create(
+            supplier=self.supplier, purchase_number="OC-1",
+            purchase_date=date.today(), reason="Falla", return_date=date.today()
+        )
+        ReturnSupplierDetail.objects.create(
+            return_supplier=return_supplier, product=self.product, quantity=2)
+
+    def test_buy_order_list(self):
+        self.assertConstantQueries(reverse('buy_order-list'), self._buy_order)
+
+    def test_return_supplier_list(self):
+        self.assertConstantQueries(
+            reverse('return_suppliers-list'), self._return_supplier)
+
+
+class ProductImportSupplierTests(TestCase):
+    """La carga masiva resuelve proveedores por nombre normalizado."""
+
+    def _workbook(self, suppliers, price=1000):
+        wb = Workbook()
+        sheet = wb.active
+        sheet.append(['name', 'price_clp', 'iva', 'stock', 'min_stock', 'category', 'supplier'])
+        for index, supplier in enumerate(suppliers):
+            sheet.append([f'Producto {index}', price, 'TRUE', 5, 1, 'General', supplier])
+        stream = BytesIO()
+        wb.save(stream)
+        stream.seek(0)
+        return stream
+
+    def test_existing_and_missing_suppliers(self):
+        existing = Supplier.objects.create(
+            name="Proveedor Uno", address="Calle 1", phone="912345678",
+            email="uno@example.com", rut="76543210-3", category="General"
+        )
+        self.assertEqual(existing.normalized_name, "proveedor uno")
+
+        result = ProductImporter().run(self._workbook(
+            ['proveedor  UNO', 'Proveedor Dos', 'PROVEEDOR DOS', None]))
+
+        self.assertEqual(result.error_count, 0)
+        self.assertEqual(result.created, 4)
+        self.assertEqual(
+            sorted(Supplier.objects.values_list('normalized_name', flat=True)),
+            ['proveedor dos', 'proveedor uno', 'sin proveedor'])
+        self.assertEqual(
+            Product.objects.filter(supplier=str(existing.id)).count(), 1)
+
+    def test_upsert_matches_on_normalized_name_and_supplier(self):
+        ProductImporter().run(self._workbook(['Proveedor Uno', 'Proveedor Dos']))
+
+        result = ProductImporter(mode='upsert').run(
+            self._workbook(['Proveedor Uno', 'Proveedor Dos', 'Proveedor Tres'], price=1500))
+
+        self.assertEqual((result.created, result.updated, result.unchanged), (1, 2, 0))
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertFalse(Product.objects.exclude(price_clp=1500).exists())
+
+        result = ProductImporter(mode='upsert').run(
+            self._workbook(['Proveedor Uno'], price=1500))
+        self.assertEqual((result.created, result.updated, result.unchanged), (0, 0, 1))
+
+
+class DuplicateSupplierNameTests(TestCase):
+    """Proveedores repetidos que backfill_supplier_names dejó sin normalizar."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(
+            email="compras@example.com", password="testpass123",
+            national_id="11111111-1", position="Compras"))
+        self.original = self._supplier("Proveedor Uno", "76543210-3")
+        self.duplicate = self._supplier("Otro", "12345678-5")
+        # Como quedaron antes de normalizar los nombres
+        Supplier.objects.filter(pk=self.duplicate.pk).update(
+            name="proveedor  UNO", normalized_name=None)
+        self.duplicate.refresh_from_db()
+
+    def _supplier(self, name, rut):
+        return Supplier.objects.create(
+            name=name, address="Calle 1", phone="912345678",
+            email="proveedor@example.com", rut=rut, category="General")
+
+    def test_saving_duplicate_is_a_validation_error(self):
+        self.duplicate.phone = "987654321"
+        with self.assertRaises(ValidationError):
+            self.duplicate.save()
+
+        response = self.client.patch(
+            reverse('supplier-detail', args=[self.duplicate.pk]),
+            {'phone': '987654321'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('name', response.data)
+
+    def test_backfill_renames_duplicates(self):
+        call_command('backfill_supplier_names', stdout=StringIO())
+        self.duplicate.refresh_from_db()
+        self.assertIsNone(self.duplicate.normalized_name)
 
-# Create your tests here.
+        call_command('backfill_supplier_names', '--rename', stdout=StringIO())
+        self.duplicate.refresh_from_db()
+        self.assertEqual(self.duplicate.name, "proveedor  UNO (2)")
+        self.assertEqual(self.duplicate.normalized_name, "proveedor uno (2)")
+        # Los tokens de búsqueda siguen al nuevo nombre
+        self.assertIn(WORD_MARK + 'uno', self.duplicate.search_tokens)
+        self.duplicate.phone = "987654321"
+        self.duplicate.save()
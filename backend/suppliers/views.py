@@ -3,8 +3,10 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
 from users.pagination import CustomPagination
+from backend.search import TokenSearchFilter
 from .serializers import SupplierSerializer, BuyOrderSerializer, ReturnSupplierSerializer, ReturnSupplierListSerializer
-from .models import Supplier, BuyOrder, ReturnSupplier
+from django.db.models import Prefetch
+from .models import Supplier, BuyOrder, ReturnSupplier, ReturnSupplierDetail
 from .filters import ReturnSupplierFilter
 
 
@@ -13,7 +15,7 @@ class SupplierViewSet(viewsets.ModelViewSet):
     serializer_class = SupplierSerializer
     pagination_class = CustomPagination
     filter_backends = [DjangoFilterBackend,
-                       filters.SearchFilter, filters.OrderingFilter]
+                       filters.OrderingFilter, TokenSearchFilter]
     filterset_fields = ['category']
     search_fields = ['name', 'rut', 'email', 'address']
     ordering_fields = ['name', 'rut']
@@ -21,7 +23,7 @@ class SupplierViewSet(viewsets.ModelViewSet):
 
 
 class BuyOrderViewSet(viewsets.ModelViewSet):
-    queryset = BuyOrder.objects.all()
+    queryset = BuyOrder.objects.all().prefetch_related('details')
     serializer_class = BuyOrderSerializer
     pagination_class = CustomPagination
     filter_backends = [DjangoFilterBackend,
@@ -37,7 +39,8 @@ class BuyOrderViewSet(viewsets.ModelViewSet):
 
 class ReturnSupplierViewSet(viewsets.ModelViewSet):
     queryset = ReturnSupplier.objects.all().select_related(
-        'supplier').prefetch_related('details__product')
+        'supplier').prefetch_related(
+        Prefetch('details', queryset=ReturnSupplierDetail.objects.select_related('product')))
     serializer_class = ReturnSupplierSerializer
     pagination_class = CustomPagination
     filter_backends = [DjangoFilterBackend,
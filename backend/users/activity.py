@@ -0,0 +1,342 @@
+"""
+Registro de actividad de usuarios en segundo plano.
+
+El middleware y log_activity no escriben UserActivity en el request: dejan
+el documento ya preparado en una cola acotada del proceso y un hilo lo
+inserta con insert_many cuando se juntan ACTIVITY_SINK['BATCH_SIZE']
+eventos o pasan FLUSH_INTERVAL segundos. Al terminar el proceso (atexit) la
+cola se vacía antes de salir.
+
+Si la cola se llena, ACTIVITY_SINK['OVERFLOW'] decide qué hacer:
+
+- 'block': el request espera hasta BLOCK_TIMEOUT segundos a que haya
+  espacio y, si no lo hay, escribe el evento directamente.
+- 'drop_view': se descartan primero los eventos VIEW (el nuevo o el más
+  antiguo en cola); los demás eventos esperan como en 'block'.
+- 'spill': el evento se agrega a SPILL_FILE (JSON extendido, una línea por
+  evento) y el hilo lo reinserta después de vaciar la cola.
+
+Con ACTIVITY_SINK['ASYNC'] = False cada evento se inserta en el momento.
+Cada escritura suma además sus conteos al rollup diario (users/rollups.py).
+
+Qué peticiones se registran lo decide ACTIVITY_LOG_POLICIES: una lista de
+reglas con 'path' (regex sobre request.path), 'methods' y 'policy'; se
+aplica la primera que calza y, si ninguna calza, 'always'.
+
+- 'always': un UserActivity por petición.
+- 'sample': un UserActivity para el 'rate' % de las peticiones, con
+  data.sample_rate para poder extrapolar.
+- 'aggregate': un UserActivityAggregate por usuario, ruta y minuto con el
+  total de peticiones; los contadores se suman en memoria y el hilo los
+  escribe con $inc.
+- 'never': no se registra.
+"""
+import atexit
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from bson import json_util
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from pymongo import UpdateOne  # type: ignore
+
+from backend.mongo import get_collection
+
+from . import rollups
+from .models import UserActivity, UserActivityAggregate
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ASYNC': True,
+    'MAX_QUEUE': 10000,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+    'OVERFLOW': 'block',
+    'BLOCK_TIMEOUT': 2.0,
+    'SPILL_FILE': 'user_activity.spill',
+}
+OVERFLOW_POLICIES = ('block', 'drop_view', 'spill')
+LOG_POLICIES = ('always', 'sample', 'aggregate', 'never')
+AGGREGATE_KEY = ('user', 'action_type', 'method', 'route', 'minute')
+
+
+def sink_settings():
+    options = {**DEFAULTS, **getattr(settings, 'ACTIVITY_SINK', {})}
+    if options['OVERFLOW'] not in OVERFLOW_POLICIES:
+        raise ValueError(f"ACTIVITY_SINK['OVERFLOW'] debe ser uno de {OVERFLOW_POLICIES}.")
+    return options
+
+
+def activity_policy(method, path):
+    """Primera regla de ACTIVITY_LOG_POLICIES que calza con la petición."""
+    for rule in getattr(settings, 'ACTIVITY_LOG_POLICIES', ()):
+        if rule.get('methods') and method not in rule['methods']:
+            continue
+        if rule.get('path') and not re.search(rule['path'], path):
+            continue
+        if rule['policy'] not in LOG_POLICIES:
+            raise ValueError(f"La política de actividad debe ser una de {LOG_POLICIES}.")
+        return rule
+    return {'policy': 'always'}
+
+
+def _prepared(model, instance, names):
+    connection = connections[model.objects.db]
+    fields = [model._meta.get_field(name) for name in names] if names else [
+        field for field in model._meta.concrete_fields if not field.primary_key]
+    return {
+        field.column: field.get_db_prep_save(field.pre_save(instance, True), connection)
+        for field in fields
+    }
+
+
+def activity_document(**fields):
+    """
+    Documento de UserActivity listo para insert_many, preparado igual que lo
+    haría el ORM (auto_now_add incluido, así la hora es la del request).
+    """
+    activity = UserActivity(**fields)
+    activity.compact()
+    return _prepared(UserActivity, activity, None)
+
+
+def aggregate_key(**fields):
+    """Filtro del UserActivityAggregate del minuto actual."""
+    minute = timezone.now().replace(second=0, microsecond=0)
+    aggregate = UserActivityAggregate(minute=minute, **fields)
+    return tuple(_prepared(UserActivityAggregate, aggregate, AGGREGATE_KEY).items())
+
+
+def client_ip(request):
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        return x_forwarded_for.split(',')[0]
+    return request.META.get('REMOTE_ADDR')
+
+
+def _collection():
+    return get_collection(UserActivity._meta.db_table)
+
+
+def _aggregates():
+    return get_collection(UserActivityAggregate._meta.db_table)
+
+
+def _write_documents(documents):
+    _collection().insert_many(documents, ordered=False)
+    delta = rollups.ActivityRollupDelta()
+    delta.add_documents(documents)
+    rollups.record(delta)
+
+
+def _write_counters(counters):
+    _aggregates().bulk_write([
+        UpdateOne(dict(key), {'$inc': {'count': count, 'error_count': errors}}, upsert=True)
+        for key, (count, errors) in counters.items()
+    ], ordered=False)
+    delta = rollups.ActivityRollupDelta()
+    delta.add_counters(counters)
+    rollups.record(delta)
+
+
+class ActivitySink:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._spill_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._buffer = deque()
+        self._counters = {}
+        self._thread = None
+        self._closing = False
+        self.dropped = 0
+
+    def record(self, **fields):
+        document = activity_document(**fields)
+        options = sink_settings()
+        if not options['ASYNC']:
+            _write_documents([document])
+            return
+        self._put(document, options)
+
+    def count(self, error=False, **fields):
+        """Suma una petición al UserActivityAggregate de este minuto."""
+        key = aggregate_key(**fields)
+        options = sink_settings()
+        if not options['ASYNC']:
+            _write_counters({key: (1, int(error))})
+            return
+        with self._lock:
+            self._ensure_thread(options)
+            count, errors = self._counters.get(key, (0, 0))
+            self._counters[key] = (count + 1, errors + int(error))
+
+    def _put(self, document, options):
+        with self._lock:
+            self._ensure_thread(options)
+            if self._has_room(options):
+                self._append(document, options)
+                return
+            if options['OVERFLOW'] == 'spill':
+                self._spill([document], options)
+                return
+            if options['OVERFLOW'] == 'drop_view' and self._drop_view(document):
+                return
+            deadline = time.monotonic() + options['BLOCK_TIMEOUT']
+            while not self._closing and (remaining := deadline - time.monotonic()) > 0:
+                self._not_full.wait(remaining)
+                if self._has_room(options):
+                    self._append(document, options)
+                    return
+        # Sin espacio después de esperar: se escribe fuera del lock.
+        _write_documents([document])
+
+    def _has_room(self, options):
+        return len(self._buffer) < options['MAX_QUEUE']
+
+    def _append(self, document, options):
+        self._buffer.append(document)
+        if len(self._buffer) >= options['BATCH_SIZE']:
+            self._not_empty.notify()
+
+    def _drop_view(self, document):
+        """Hace espacio descartando un VIEW; False si no hay ninguno."""
+        if document['action_type'] == 'VIEW':
+            self.dropped += 1
+            return True
+        for index, queued in enumerate(self._buffer):
+            if queued['action_type'] == 'VIEW':
+                del self._buffer[index]
+                self._buffer.append(document)
+                self.dropped += 1
+                return True
+        return False
+
+    def _ensure_thread(self, options):
+        # Después de un fork el hilo y la cola del proceso padre no sirven.
+        if self._pid != os.getpid():
+            self._reset()
+        if self._thread is None or not self._thread.is_alive():
+            self._closing = False
+            self._thread = threading.Thread(
+                target=self._run, name='activity-sink', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            options = sink_settings()
+            with self._lock:
+                if len(self._buffer) < options['BATCH_SIZE'] and not self._closing:
+                    self._not_empty.wait(options['FLUSH_INTERVAL'])
+                closing = self._closing
+            self._flush(options)
+            if closing:
+                return
+
+    def _take(self, size):
+        with self._lock:
+            batch = [self._buffer.popleft() for _ in range(min(size, len(self._buffer)))]
+            self._not_full.notify_all()
+        return batch
+
+    def _flush(self, options):
+        while batch := self._take(options['BATCH_SIZE']):
+            self._insert(batch, options)
+        with self._lock:
+            counters, self._counters = self._counters, {}
+        if counters:
+            try:
+                _write_counters(counters)
+            except Exception:
+                logger.exception("No se pudieron guardar %s contadores de actividad", len(counters))
+        if options['OVERFLOW'] == 'spill':
+            self._replay_spill(options)
+
+    def _insert(self, batch, options):
+        try:
+            _write_documents(batch)
+        except Exception:
+            logger.exception("No se pudieron guardar %s eventos de actividad", len(batch))
+            if options['OVERFLOW'] == 'spill':
+                self._spill(batch, options)
+
+    def _spill(self, documents, options):
+        with self._spill_lock, open(options['SPILL_FILE'], 'a', encoding='utf-8') as spill:
+            for document in documents:
+                spill.write(json_util.dumps(document) + '\n')
+
+    def _replay_spill(self, options):
+        path = options['SPILL_FILE']
+        replaying = f'{path}.{os.getpid()}'
+        with self._spill_lock:
+            try:
+                os.replace(path, replaying)
+            except FileNotFoundError:
+                return
+        with open(replaying, encoding='utf-8') as spill:
+            documents = [json_util.loads(line) for line in spill if line.strip()]
+        os.remove(replaying)
+        for start in range(0, len(documents), options['BATCH_SIZE']):
+            self._insert(documents[start:start + options['BATCH_SIZE']], options)
+
+    def flush(self):
+        """Inserta lo que haya en cola desde el hilo actual."""
+        self._flush(sink_settings())
+
+    def close(self, timeout=10):
+        """Vacía la cola y detiene el hilo."""
+        with self._lock:
+            thread = self._thread if self._pid == os.getpid() else None
+            self._closing = True
+            self._not_empty.notify()
+            self._not_full.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+
+sink = ActivitySink()
+atexit.register(sink.close)
+
+
+def record_activity(**fields):
+    """Registra un UserActivity con los mismos argumentos de objects.create."""
+    sink.record(**fields)
+
+
+def record_request_activity(request, response, **fields):
+    """
+    Registra la actividad de una petición según ACTIVITY_LOG_POLICIES.
+    `fields` son los argumentos de record_activity.
+    """
+    rule = activity_policy(request.method, request.path)
+    policy = rule['policy']
+    if policy == 'never':
+        return
+    if policy == 'aggregate':
+        match = getattr(request, 'resolver_match', None)
+        sink.count(
+            user=fields['user'],
+            action_type=fields['action_type'],
+            method=request.method,
+            route=match.route if match else request.path,
+            error=response.status_code >= 400,
+        )
+        return
+    if policy == 'sample':
+        rate = rule.get('rate', 100)
+        if random.random() * 100 >= rate:
+            return
+        fields['data'] = {**(fields.get('data') or {}), 'sample_rate': rate}
+    record_activity(**fields)
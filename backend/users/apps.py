@@ -3,3 +3,6 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django_mongodb_backend.fields.ObjectIdAutoField'
     name = 'users'
+
+    def ready(self):
+        from . import signals  # noqa: F401
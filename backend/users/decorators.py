@@ -1,5 +1,5 @@
 from functools import wraps
-from .models import UserActivity
+from .activity import record_request_activity
 from django.contrib.contenttypes.models import ContentType
 
 def log_activity(action_type, description=None):
@@ -37,7 +37,8 @@ def log_activity(action_type, description=None):
                     if object_id:
                         action_description += f" ID: {object_id}"
                 
-                UserActivity.objects.create(
+                record_request_activity(
+                    request, response,
                     user=request.user,
                     action_type=action_type,
                     description=action_description,
@@ -47,6 +48,7 @@ def log_activity(action_type, description=None):
                     user_agent=request.META.get('HTTP_USER_AGENT', ''),
                     data=activity_data
                 )
+                request._request._activity_logged = True
                 
             return response
         return _wrapped_view
@@ -1,4 +1,7 @@
+from datetime import datetime, time, timedelta
+
 import django_filters
+from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
 from .models import UserActivity
 
@@ -7,18 +10,24 @@ class UserActivityFilter(django_filters.FilterSet):
     action_type = django_filters.ChoiceFilter(choices=UserActivity.ACTION_TYPES)
     content_type = django_filters.ModelChoiceFilter(queryset=ContentType.objects.all())
 
-    # Filtros para el JSONField 'data' (ej: data__status_type)
-    data__status_type = django_filters.CharFilter(field_name="data__status_type", lookup_expr="exact")
+    # data__status_type se mantiene como nombre, pero filtra la copia indexada status_type
+    data__status_type = django_filters.CharFilter(field_name="status_type", lookup_expr="exact")
 
-    # Filtro por rango de fechas en timestamp
-    date__range = django_filters.DateFromToRangeFilter(field_name="date", lookup_expr="exact")
+    # Filtros por fecha, sobre timestamp (ya no hay campo date)
+    date = django_filters.DateFilter(method='filter_date')
+    date__range = django_filters.DateFromToRangeFilter(field_name="timestamp")
+    date__year__gt = django_filters.NumberFilter(field_name="timestamp", lookup_expr="year__gt")
+    date__year__lt = django_filters.NumberFilter(field_name="timestamp", lookup_expr="year__lt")
 
     class Meta:
         model = UserActivity
         fields = {
             'user': ['exact'],
-            'date': ['exact', 'year__gt', 'year__lt'],
-        } 
+        }
+
+    def filter_date(self, queryset, name, value):
+        start = timezone.make_aware(datetime.combine(value, time.min))
+        return queryset.filter(timestamp__gte=start, timestamp__lt=start + timedelta(days=1))
 
     def filter_by_content_object(self, queryset, name, value):
         """
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backend.mongo import get_collection, get_database
+from users.models import UserActivity, UserActivityAggregate
+
+
+def month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(value):
+    return month_start(month_start(value) + timedelta(days=32))
+
+
+class Command(BaseCommand):
+    help = ("Mueve la actividad de usuarios anterior al período de retención a "
+            "colecciones mensuales <colección>_archive_AAAAMM (o la elimina con "
+            "--delete).")
+
+    # Modelo y campo de fecha de cada colección de actividad
+    sources = (
+        (UserActivity, 'timestamp'),
+        (UserActivityAggregate, 'minute'),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ACTIVITY_RETENTION_DAYS,
+            help='Días de actividad que se mantienen en la colección principal.'
+        )
+        parser.add_argument(
+            '--delete', action='store_true',
+            help='Elimina la actividad antigua en lugar de archivarla.'
+        )
+        parser.add_argument(
+            '--keep-archives', type=int, default=None,
+            help='Elimina las colecciones de archivo con más de N meses.'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        for model, field in self.sources:
+            table = model._meta.db_table
+            moved = self.archive(table, field, cutoff, options['delete'])
+            action = 'eliminados' if options['delete'] else 'archivados'
+            self.stdout.write(self.style.SUCCESS(f"{table}: {moved} documentos {action}."))
+            if options['keep_archives'] is not None:
+                self.drop_archives(table, options['keep_archives'])
+
+    def archive(self, table, field, cutoff, delete):
+        """Procesa mes a mes, desde el documento más antiguo hasta cutoff."""
+        collection = get_collection(table)
+        oldest = collection.find_one(
+            {field: {'$lt': cutoff}}, {field: 1}, sort=[(field, 1)])
+        if oldest is None:
+            return 0
+
+        moved = 0
+        start = month_start(oldest[field]).replace(tzinfo=dt_timezone.utc)
+        while start < cutoff:
+            end = min(next_month(start), cutoff)
+            window = {field: {'$gte': start, '$lt': end}}
+            if not delete:
+                # $merge es idempotente: si se corta a mitad, repetir no duplica.
+                collection.aggregate([
+                    {'$match': window},
+                    {'$merge': {
+                        'into': f'{table}_archive_{start:%Y%m}',
+                        'on': '_id',
+                        'whenMatched': 'keepExisting',
+                        'whenNotMatched': 'insert',
+                    }},
+                ])
+            moved += collection.delete_many(window).deleted_count
+            start = end
+        return moved
+
+    def drop_archives(self, table, months):
+        limit = month_start(timezone.now())
+        for _ in range(months):
+            limit = month_start(limit - timedelta(days=1))
+        prefix = f'{table}_archive_'
+        database = get_database()
+        for name in database.list_collection_names():
+            if not name.startswith(prefix):
+                continue
+            try:
+                month = datetime.strptime(name[len(prefix):], '%Y%m')
+            except ValueError:
+                continue
+            if month < limit.replace(tzinfo=None):
+                database.drop_collection(name)
+                self.stdout.write(f"{name} eliminada.")
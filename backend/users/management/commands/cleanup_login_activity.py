@@ -0,0 +1,106 @@
+import re
+
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne  # type: ignore
+
+from backend.mongo import get_collection
+from backend.rollups import day_expression
+from users.models import ActivityPath, UserActivity
+
+# Antes cada respuesta autenticada quedaba registrada como LOGIN; los
+# inicios de sesión reales son los que se hicieron sobre .../login/.
+LOGIN_PATH = re.compile(r'/login/$')
+
+
+def spurious_logins():
+    """
+    Filtro de los LOGIN sin inicio de sesión real. La ruta está en data.path
+    en los documentos anteriores a compact_activity y en path_id (ActivityPath)
+    en los compactados.
+    """
+    login_paths = [
+        document['_id'] for document in get_collection(ActivityPath._meta.db_table).find(
+            {'value': LOGIN_PATH}, {'_id': 1})
+    ]
+    return {
+        'action_type': 'LOGIN',
+        '$or': [
+            {'data.path': {'$exists': True, '$not': LOGIN_PATH}},
+            {'path_id': {'$ne': None, '$nin': login_paths}},
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = ("Elimina los registros LOGIN que no corresponden a un inicio de sesión "
+            "(uno por cada respuesta autenticada). Con --collapse deja el primero "
+            "de cada usuario por día con el total en data.collapsed. Sirve antes o "
+            "después de compact_activity.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--collapse', action='store_true',
+            help='Conserva un registro por usuario y día en lugar de borrarlos todos.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Cantidad de registros por delete_many.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Sólo informa cuántos registros se verían afectados.'
+        )
+
+    def handle(self, *args, **options):
+        collection = get_collection(UserActivity._meta.db_table)
+        spurious = spurious_logins()
+        total = collection.count_documents(spurious)
+        if options['dry_run'] or not total:
+            self.stdout.write(f"{total} registros LOGIN sin inicio de sesión real.")
+            return
+
+        kept = 0
+        query = spurious
+        if options['collapse']:
+            kept = self.collapse(collection, spurious, options['batch_size'])
+            query = {**spurious, 'data.collapsed': {'$exists': False}}
+
+        deleted = 0
+        while True:
+            ids = [document['_id'] for document in
+                   collection.find(query, {'_id': 1}).limit(options['batch_size'])]
+            if not ids:
+                break
+            deleted += collection.delete_many({'_id': {'$in': ids}}).deleted_count
+            self.stdout.write(f"{deleted}/{total - kept} registros eliminados...")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{deleted} registros LOGIN eliminados, {kept} conservados."))
+
+    def collapse(self, collection, spurious, batch_size):
+        """
+        Marca el primer registro de cada usuario y día local (calculado desde
+        timestamp, ya que los compactados no tienen date) con el total del día
+        (incluye los ya colapsados, así el comando se puede repetir).
+        """
+        groups = collection.aggregate([
+            {'$match': spurious},
+            {'$sort': {'timestamp': 1}},
+            {'$group': {
+                '_id': {'user': '$user_id', 'day': day_expression('$timestamp')},
+                'first': {'$first': '$_id'},
+                'count': {'$sum': {'$ifNull': ['$data.collapsed', 1]}},
+            }},
+        ], allowDiskUse=True)
+
+        kept, operations = 0, []
+        for group in groups:
+            kept += 1
+            operations.append(UpdateOne(
+                {'_id': group['first']}, {'$set': {'data.collapsed': group['count']}}))
+            if len(operations) >= batch_size:
+                collection.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+        return kept
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne  # type: ignore
+
+from backend.mongo import get_collection
+from users.models import ActivityPath, UserActivity, UserAgent, cap_request_data
+
+LEGACY = {'$or': [
+    {'user_agent': {'$exists': True}},
+    {'date': {'$exists': True}},
+    {'time': {'$exists': True}},
+    {'data.path': {'$exists': True}},
+    {'data.status_type': {'$exists': True}, 'status_type': {'$exists': False}},
+]}
+
+
+class Command(BaseCommand):
+    help = ("Pasa la actividad de usuarios guardada antes del formato compacto: "
+            "user agent y ruta a sus diccionarios, sin date/time, con status_type "
+            "y request_data acotado.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Cantidad de actualizaciones por bulk_write.'
+        )
+
+    def handle(self, *args, **options):
+        collection = get_collection(UserActivity._meta.db_table)
+        compacted = 0
+        while True:
+            documents = list(collection.find(
+                LEGACY, {'user_agent': 1, 'data': 1}).limit(options['batch_size']))
+            if not documents:
+                break
+            operations = [self.compact(document) for document in documents]
+            compacted += collection.bulk_write(operations, ordered=False).modified_count
+            self.stdout.write(f"{compacted} registros compactados...")
+
+        self.stdout.write(self.style.SUCCESS(f"{compacted} registros compactados."))
+
+    def compact(self, document):
+        values = {}
+        if document.get('user_agent'):
+            values['agent_id'] = UserAgent.id_for(document['user_agent'])
+        data = document.get('data')
+        if isinstance(data, dict):
+            if 'path' in data:
+                values['path_id'] = ActivityPath.id_for(data.pop('path'))
+            if 'request_data' in data:
+                data['request_data'] = cap_request_data(data['request_data'])
+            if 'status_type' in data:
+                values['status_type'] = data['status_type']
+            values['data'] = data
+
+        update = {'$unset': {'user_agent': '', 'date': '', 'time': ''}}
+        if values:
+            update['$set'] = values
+        return UpdateOne({'_id': document['_id']}, update)
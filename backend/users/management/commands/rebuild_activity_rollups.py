@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.rollups import rebuild
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Fecha inválida: {value}. Use el formato AAAA-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = ("Recalcula el rollup diario de actividad de usuarios desde la actividad "
+            "registrada, desde una fecha o desde el día más antiguo no archivado.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from', dest='start', type=_parse_date,
+            help='Primer día a recalcular (AAAA-MM-DD, fecha local).'
+        )
+
+    def handle(self, *args, **options):
+        rows = rebuild(options['start'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rollup de actividad recalculado desde {options['start'] or 'la actividad no archivada'}: "
+            f"{rows} filas."))
@@ -1,4 +1,4 @@
-from .models import UserActivity
+from .activity import client_ip, record_request_activity
 from django.utils.deprecation import MiddlewareMixin
 
 class UserActivityMiddleware(MiddlewareMixin):
@@ -6,8 +6,11 @@ class UserActivityMiddleware(MiddlewareMixin):
         # Ignora peticiones de recursos estáticos o autenticacion
         if any(path in request.path for path in ['/static/', '/media/', '/favicon.ico', '/api/auth/']):
             return response
-            
-            
+
+        # Las vistas con @log_activity ya registraron la petición
+        if getattr(request, '_activity_logged', False):
+            return response
+
         if hasattr(request, 'user') and request.user.is_authenticated:
             # Determina el tipo de acción basado en el método HTTP
             action_mapping = {
@@ -33,25 +36,18 @@ class UserActivityMiddleware(MiddlewareMixin):
                 safe_data = self._filter_sensitive_data(request.data)
                 activity_data['request_data'] = safe_data
             
-            UserActivity.objects.create(
+            record_request_activity(
+                request, response,
                 user=request.user,
                 action_type=action_type,
                 description=f"{action_type} en {request.path}",
-                ip_address=self._get_client_ip(request),
+                ip_address=client_ip(request),
                 user_agent=request.META.get('HTTP_USER_AGENT', ''),
                 data=activity_data
             )
             
         return response
     
-    def _get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
-    
     def _filter_sensitive_data(self, data):
         # Copia los datos para no modificar el original
         if not data:
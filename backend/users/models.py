@@ -1,11 +1,18 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django_mongodb_backend.fields import ObjectIdField #type: ignore
 from django.db import models
+import hashlib
+import json
 import re
 
+from pymongo import ReturnDocument  # type: ignore
+
+from backend.mongo import get_collection
+
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
@@ -98,6 +105,69 @@ class User(AbstractUser):
 
 User = get_user_model()
 
+class ActivityDictionary(models.Model):
+    """
+    Valores repetidos de la actividad (user agents, rutas) guardados una vez
+    y referenciados por id. `digest` es el índice único, así el valor puede
+    ser largo.
+    """
+    value = models.TextField()
+    digest = models.CharField(max_length=40, unique=True, editable=False)
+
+    # Ids ya resueltos en este proceso
+    _ids = None
+    MAX_CACHED = 10000
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return self.value
+
+    @classmethod
+    def id_for(cls, value):
+        """Id del valor, creándolo si no existe (un upsert por valor nuevo)."""
+        if value in (None, ''):
+            return None
+        if cls._ids is None or len(cls._ids) >= cls.MAX_CACHED:
+            cls._ids = {}
+        if value not in cls._ids:
+            digest = hashlib.sha1(value.encode()).hexdigest()
+            document = get_collection(cls._meta.db_table).find_one_and_update(
+                {'digest': digest},
+                {'$setOnInsert': {'value': value}},
+                projection={'_id': 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            cls._ids[value] = document['_id']
+        return cls._ids[value]
+
+
+class UserAgent(ActivityDictionary):
+    pass
+
+
+class ActivityPath(ActivityDictionary):
+    pass
+
+
+def cap_request_data(data):
+    """
+    request_data de más de ACTIVITY_REQUEST_DATA_MAX_BYTES (en JSON) se
+    reemplaza por un marcador con el tamaño y el comienzo del contenido.
+    """
+    limit = getattr(settings, 'ACTIVITY_REQUEST_DATA_MAX_BYTES', 2048)
+    encoded = json.dumps(data, default=str, ensure_ascii=False)
+    if len(encoded.encode()) <= limit:
+        return data
+    return {
+        'truncated': True,
+        'size': len(encoded.encode()),
+        'preview': encoded.encode()[:limit].decode(errors='ignore'),
+    }
+
+
 class UserActivity(models.Model):
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activities')
@@ -123,14 +193,17 @@ class UserActivity(models.Model):
     object_id = ObjectIdField(null=True, blank=True)
     content_object = GenericForeignKey('content_type', 'object_id')
     
-    # Datos adicionales
+    # Datos adicionales. La ruta se guarda aparte en `path`.
     data = models.JSONField(null=True, blank=True)
     
+    # Copia de data['status_type'] ('success' o 'error') para filtrarla con índice
+    status_type = models.CharField(max_length=10, null=True, blank=True, editable=False)
+
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    user_agent = models.TextField(null=True, blank=True)
-    
-    date = models.DateField(auto_now_add=True)
-    time = models.TimeField(auto_now_add=True)
+    # User agent y ruta van como referencias a diccionarios (ver user_agent)
+    agent = models.ForeignKey(UserAgent, on_delete=models.DO_NOTHING, null=True, blank=True)
+    path = models.ForeignKey(ActivityPath, on_delete=models.DO_NOTHING, null=True, blank=True)
+
     timestamp = models.DateTimeField(auto_now_add=True)
     
     
@@ -138,6 +211,85 @@ class UserActivity(models.Model):
         ordering = ['-timestamp']
         verbose_name = 'Actividad de usuario'
         verbose_name_plural = 'Actividades de usuarios'
+        # Un índice por filtro de UserActivityViewSet, seguido del orden
+        indexes = [
+            models.Index(fields=['-timestamp']),
+            models.Index(fields=['user', '-timestamp']),
+            models.Index(fields=['action_type', '-timestamp']),
+            models.Index(fields=['status_type', '-timestamp']),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        self._user_agent = None
+        super().__init__(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.action_type} - {self.timestamp}"
+
+    @property
+    def user_agent(self):
+        if self._user_agent is None and self.agent_id:
+            self._user_agent = self.agent.value
+        return self._user_agent
+
+    @user_agent.setter
+    def user_agent(self, value):
+        self._user_agent = value
+        self.agent_id = None
+
+    def compact(self):
+        """Pasa user agent y ruta a sus diccionarios y acota request_data."""
+        if self._user_agent and not self.agent_id:
+            self.agent_id = UserAgent.id_for(self._user_agent)
+        if isinstance(self.data, dict):
+            data = dict(self.data)
+            if 'path' in data:
+                self.path_id = ActivityPath.id_for(data.pop('path'))
+            if 'request_data' in data:
+                data['request_data'] = cap_request_data(data['request_data'])
+            self.status_type = data.get('status_type', self.status_type)
+            self.data = data
+
+    def save(self, *args, **kwargs):
+        self.compact()
+        super().save(*args, **kwargs)
+
+
+class UserActivityAggregate(models.Model):
+    """
+    Contador de peticiones de un usuario a una ruta en un minuto, para las
+    rutas cuya política de registro es 'aggregate' (ver ACTIVITY_LOG_POLICIES).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_aggregates')
+    action_type = models.CharField(max_length=10, choices=UserActivity.ACTION_TYPES)
+    method = models.CharField(max_length=10)
+    # Patrón de la URL (api/inventory/products/<pk>/), no la ruta con ids
+    route = models.CharField(max_length=255)
+    minute = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-minute']
+        verbose_name = 'Actividad agregada de usuario'
+        verbose_name_plural = 'Actividades agregadas de usuarios'
+        unique_together = ('user', 'route', 'method', 'action_type', 'minute')
 
     def __str__(self):
-        return f"{self.user.username} - {self.action_type} - {self.timestamp} - {self.action_status}"
\ No newline at end of file
+        return f"{self.user_id} - {self.method} {self.route} - {self.minute} - {self.count}"
+
+
+class UserActivityDailyRollup(models.Model):
+    """
+    Acciones y errores por usuario, día (fecha local) y tipo de acción,
+    sumando UserActivity y UserActivityAggregate. Se actualiza con $inc al
+    registrar actividad (users/rollups.py).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_rollups')
+    day = models.DateField()
+    action_type = models.CharField(max_length=10, choices=UserActivity.ACTION_TYPES)
+    count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('day', 'user', 'action_type')
@@ -1,17 +1,106 @@
-from django.core.paginator import EmptyPage, PageNotAnInteger
+import base64
+import datetime
+import hashlib
+import operator
+from decimal import Decimal
+from functools import reduce
+
+from bson import json_util
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
+from backend.mongo import get_collection
+
+
+class CountStrategyPaginator(Paginator):
+    """Paginator cuyo total resuelve CustomPagination.get_count."""
+
+    def __init__(self, object_list, per_page, get_count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.get_count = get_count
+        self.count_exact = True
+
+    @cached_property
+    def count(self):
+        count, self.count_exact = self.get_count()
+        return count
+
+    def page(self, number):
+        """
+        Con un total estimado la página no se recorta según ese total: se
+        pide un elemento extra para saber si hay siguiente y, al llegar a la
+        última página, el total pasa a ser exacto.
+        """
+        self.count  # resuelve count_exact
+        if self.count_exact:
+            return super().page(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages['invalid_page'])
+        if number < 1:
+            raise EmptyPage(self.error_messages['min_page'])
+
+        bottom = (number - 1) * self.per_page
+        items = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not items and number > 1:
+            raise EmptyPage(self.error_messages['no_results'])
+
+        has_next = len(items) > self.per_page
+        items = items[:self.per_page]
+        seen = bottom + len(items)
+        if not has_next:
+            self.__dict__['count'] = seen
+            self.count_exact = True
+        elif self.count <= seen:
+            self.__dict__['count'] = seen + 1
+        return EstimatedPage(items, number, self, has_next)
+
+
+class EstimatedPage(Page):
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
 class CustomPagination(PageNumberPagination):
     page_size = 10  # Valor por defecto
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+    # Modo cursor (opcional): ?cursor= para la primera página y luego el
+    # token recibido en info.next / info.previous.
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Cursor inválido.'
+    invalid_cursor_ordering_message = (
+        'El modo cursor sólo admite ordenar por campos del propio modelo.')
+
+    # Totales: sin filtros se usa estimatedDocumentCount y con filtros el
+    # último conteo cacheado para la misma firma de filtro. info.count_exact
+    # indica si el total es exacto; ?with_count=true lo fuerza.
+    count_query_param = 'with_count'
+
     def paginate_queryset(self, queryset, request, view=None):
         self.page_size = self.get_page_size(request)
         if not self.page_size:
             return None  # Si no se especifica el tamaño de página, no se pagina.
-        paginator = self.django_paginator_class(queryset, self.page_size)
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if self.cursor_mode:
+            self.request = request
+            return self.paginate_cursor(queryset, request, view)
+        paginator = CountStrategyPaginator(
+            queryset, self.page_size,
+            lambda: self.get_count(queryset, request, view, compute=True))
         page_number = request.query_params.get(self.page_query_param, 1)
         try:
             self.page = paginator.page(page_number)
@@ -23,11 +112,14 @@ class CustomPagination(PageNumberPagination):
         return list(self.page)
 
     def get_paginated_response(self, data):
+        if self.cursor_mode:
+            return self.get_cursor_paginated_response(data)
         if not self.page:
             # Devolvemos una respuesta estructurada para el caso de que no haya datos.
             return Response({
                 'info': {
                     'count': 0,
+                    'count_exact': True,
                     'current_page': 1,
                     'pages': 0,
                     'next': None,
@@ -41,6 +133,7 @@ class CustomPagination(PageNumberPagination):
         return Response({
             'info': {
                 'count': self.page.paginator.count,
+                'count_exact': self.page.paginator.count_exact,
                 'current_page': self.page.number,
                 'pages': self.page.paginator.num_pages,
                 'next': next_page,
@@ -48,3 +141,174 @@ class CustomPagination(PageNumberPagination):
             },
             'results': data
         })
+
+    # --- Modo cursor -----------------------------------------------------
+
+    def paginate_cursor(self, queryset, request, view):
+        """
+        Paginación por clave: el token guarda los valores de las claves de
+        orden (terminando en _id) del último (o primer) elemento visto y la
+        página siguiente se obtiene con un predicado de rango, sin skip ni
+        conteo.
+        """
+        self.cursor_count, self.cursor_count_exact = self.get_count(
+            queryset, request, view, compute=False)
+        ordering = self.get_cursor_ordering(queryset)
+        fields = [field for field, _ in ordering]
+        token = request.query_params.get(self.cursor_query_param)
+        cursor = self.decode_cursor(token, fields) if token else None
+
+        # Hacia atrás se recorre en orden inverso y se da vuelta el resultado
+        backwards = bool(cursor and cursor['reverse'])
+        keys = [(field, descending != backwards) for field, descending in ordering]
+        queryset = queryset.order_by(
+            *(f"{'-' if descending else ''}{field}" for field, descending in keys))
+        if cursor:
+            queryset = queryset.filter(self.seek_filter(keys, cursor['values']))
+
+        items = list(queryset[:self.page_size + 1])
+        has_more = len(items) > self.page_size
+        items = items[:self.page_size]
+        if backwards:
+            items.reverse()
+
+        self.next_cursor = self.previous_cursor = None
+        if items:
+            if has_more or backwards:
+                self.next_cursor = self.encode_cursor(fields, items[-1], reverse=False)
+            if cursor and (has_more or not backwards):
+                self.previous_cursor = self.encode_cursor(fields, items[0], reverse=True)
+        return items
+
+    def get_cursor_paginated_response(self, data):
+        count = self.cursor_count
+        return Response({
+            'info': {
+                'count': count,
+                'count_exact': self.cursor_count_exact,
+                'current_page': None,
+                'pages': -(-count // self.page_size) if count is not None else None,
+                'next': self.next_cursor,
+                'previous': self.previous_cursor,
+            },
+            'results': data
+        })
+
+    def get_cursor_ordering(self, queryset):
+        """
+        Claves de orden del queryset (o del modelo) como (campo, descendente),
+        terminando siempre en pk. Los órdenes por expresión (relevancia de la
+        búsqueda) se ignoran; los campos de otra relación o inexistentes no
+        se pueden codificar en el cursor y se rechazan.
+        """
+        ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+        keys = []
+        for item in ordering:
+            if not isinstance(item, str):
+                continue
+            descending = item.startswith('-')
+            name = item.lstrip('-')
+            if name in ('pk', 'id'):
+                return keys + [('pk', descending)]
+            try:
+                field = queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                field = None
+            if field is None or not field.concrete or field.many_to_many:
+                raise ValidationError({'ordering': [self.invalid_cursor_ordering_message]})
+            keys.append((field.attname if field.is_relation else name, descending))
+        return keys + [('pk', keys[-1][1] if keys else True)]
+
+    @staticmethod
+    def seek_filter(keys, values):
+        """
+        Elementos posteriores a `values` en el orden de `keys`: iguales en
+        las primeras claves y posteriores en la siguiente.
+        """
+        terms, equal = [], Q()
+        for (field, descending), value in zip(keys, values):
+            # Los nulos van primero en orden ascendente y al final en descendente
+            if value is None:
+                after = None if descending else Q(**{f'{field}__isnull': False})
+                same = Q(**{f'{field}__isnull': True})
+            else:
+                after = Q(**{f"{field}__{'lt' if descending else 'gt'}": value})
+                if descending and field != 'pk':
+                    after |= Q(**{f'{field}__isnull': True})
+                same = Q(**{field: value})
+            if after is not None:
+                terms.append(equal & after)
+            equal &= same
+        return reduce(operator.or_, terms)
+
+    def encode_cursor(self, fields, item, reverse):
+        values = []
+        for field in fields:
+            value = getattr(item, field)
+            if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+                value = value.isoformat()
+            elif isinstance(value, Decimal):
+                value = str(value)
+            values.append(value)
+        payload = json_util.dumps({'f': fields, 'v': values, 'r': reverse})
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, token, fields):
+        try:
+            payload = json_util.loads(
+                base64.urlsafe_b64decode(token.encode()),
+                json_options=json_util.JSONOptions(tz_aware=True))
+            # Un token de otro orden no sirve para esta consulta
+            if payload['f'] != fields or len(payload['v']) != len(fields):
+                raise ValueError(payload['f'])
+            return {'values': payload['v'], 'reverse': bool(payload['r'])}
+        except (ValueError, TypeError, KeyError, AttributeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    # --- Totales -----------------------------------------------------------
+
+    def count_cache_key(self, queryset, request, view):
+        """
+        Firma normalizada del filtro: vista, modelo, parámetros de filtro y
+        usuario, ya que un get_queryset puede acotar los resultados según
+        quién consulta.
+        """
+        ignored = {self.page_query_param, self.page_size_query_param,
+                   self.cursor_query_param, self.count_query_param, 'ordering'}
+        params = sorted(
+            (key, sorted(values)) for key, values in request.query_params.lists()
+            if key not in ignored
+        )
+        signature = hashlib.md5(
+            repr((type(view).__name__, queryset.model._meta.label, params,
+                  getattr(request.user, 'pk', None))).encode(),
+            usedforsecurity=False
+        ).hexdigest()
+        return f'pagination-count:{signature}'
+
+    @property
+    def count_cache_timeout(self):
+        return getattr(settings, 'PAGINATION_COUNT_TTL', 30)
+
+    def get_count(self, queryset, request, view, compute):
+        """
+        Devuelve (total, exacto). Con ?with_count=true siempre cuenta. Sin
+        filtros usa estimatedDocumentCount; con filtros, el total cacheado
+        para la misma firma o, si no hay y `compute` es verdadero, cuenta y
+        lo guarda por PAGINATION_COUNT_TTL segundos.
+        """
+        exact_requested = request.query_params.get(
+            self.count_query_param, '').lower() in ('1', 'true')
+        if not exact_requested and not queryset.query.where:
+            count = get_collection(queryset.model._meta.db_table).estimated_document_count()
+            return count, False
+
+        key = self.count_cache_key(queryset, request, view)
+        if not exact_requested:
+            count = cache.get(key)
+            if count is not None or not compute:
+                return count, False
+
+        count = queryset.count()
+        cache.set(key, count, self.count_cache_timeout)
+        return count, True
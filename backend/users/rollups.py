@@ -0,0 +1,151 @@
+"""
+Rollup diario de actividad de usuarios.
+
+Cada lote de UserActivity que escribe el sink (y cada contador de
+UserActivityAggregate) aplica un $inc sobre UserActivityDailyRollup, así la
+analítica de la pantalla de actividad lee una fila por usuario, día y tipo
+de acción en lugar de recorrer la colección. `rebuild` lo recalcula desde la
+actividad guardada (comando rebuild_activity_rollups).
+"""
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo import UpdateOne  # type: ignore
+
+from backend.mongo import get_collection
+from backend.rollups import RollupWriter, day_expression, grouped_rows, rollup_day
+from .models import UserActivity, UserActivityAggregate, UserActivityDailyRollup
+
+logger = logging.getLogger(__name__)
+
+KEYS = ('day', 'user_id', 'action_type')
+
+
+class ActivityRollupDelta:
+    """Acumula conteos por (día, usuario, acción) y los escribe en un bulk_write."""
+
+    def __init__(self):
+        self.counts = {}
+
+    def add(self, user_id, moment, action_type, count=1, errors=0):
+        # Los documentos ya preparados traen la hora como UTC sin zona.
+        if timezone.is_naive(moment):
+            moment = moment.replace(tzinfo=dt_timezone.utc)
+        key = (rollup_day(moment), user_id, action_type)
+        totals = self.counts.setdefault(key, [0, 0])
+        totals[0] += count
+        totals[1] += errors
+
+    def add_documents(self, documents):
+        for document in documents:
+            self.add(document['user_id'], document['timestamp'], document['action_type'],
+                     errors=int(document.get('status_type') == 'error'))
+
+    def add_counters(self, counters):
+        for key, (count, errors) in counters.items():
+            key = dict(key)
+            self.add(key['user_id'], key['minute'], key['action_type'], count, errors)
+
+    def apply(self):
+        operations = [
+            UpdateOne(dict(zip(KEYS, key)),
+                      {'$inc': {'count': count, 'error_count': errors}}, upsert=True)
+            for key, (count, errors) in self.counts.items()
+        ]
+        if operations:
+            get_collection(UserActivityDailyRollup._meta.db_table).bulk_write(
+                operations, ordered=False)
+
+
+def record(delta):
+    """
+    Aplica el delta sin afectar el registro de actividad, que ya quedó
+    escrito. Si falla, el rollup se repara con rebuild_activity_rollups.
+    """
+    try:
+        delta.apply()
+    except Exception:
+        logger.exception("No se pudo actualizar el rollup de actividad")
+
+
+def default_start():
+    """
+    Primer día completo que conserva la actividad no archivada. archive_activity
+    corta a una hora, no a un día, así que el día del documento más antiguo
+    sólo cuenta si es posterior al corte de ACTIVITY_RETENTION_DAYS; si no,
+    se empieza al día siguiente. Sin actividad devuelve None.
+    """
+    oldest = []
+    for model, field in ((UserActivity, 'timestamp'), (UserActivityAggregate, 'minute')):
+        document = get_collection(model._meta.db_table).find_one(
+            {}, {field: 1}, sort=[(field, 1)])
+        if document is not None:
+            oldest.append(document[field].replace(tzinfo=dt_timezone.utc))
+    if not oldest:
+        return None
+    day = timezone.localdate(min(oldest))
+    cutoff = timezone.localdate(
+        timezone.now() - timedelta(days=settings.ACTIVITY_RETENTION_DAYS))
+    return day if day > cutoff else day + timedelta(days=1)
+
+
+def rebuild(start=None):
+    """
+    Recalcula el rollup desde el día `start` (fecha local). Sólo ve la
+    actividad no archivada, por lo que `start` debe ser posterior al último
+    archive_activity; sin él se usa default_start() y las filas de los días
+    archivados se conservan. Devuelve la cantidad de filas del rango.
+    """
+    if start is None:
+        start = default_start()
+        if start is None:
+            return 0
+    day_match = {'day': {'$gte': rollup_day(start)}}
+    bounds = {'$gte': timezone.make_aware(
+        datetime.combine(start, datetime.min.time()), timezone.get_current_timezone())}
+
+    def grouped(source, field, count, errors):
+        return get_collection(source).aggregate([
+            {'$match': {field: bounds}},
+            {'$group': {
+                '_id': {'day': day_expression(f'${field}'),
+                        'user_id': '$user_id', 'action_type': '$action_type'},
+                'count': {'$sum': count},
+                'error_count': {'$sum': errors},
+            }},
+        ])
+
+    writer = RollupWriter(
+        UserActivityDailyRollup._meta.db_table, KEYS, ('count', 'error_count'))
+    for row in grouped_rows(grouped(
+            UserActivity._meta.db_table, 'timestamp', 1,
+            {'$cond': [{'$eq': ['$status_type', 'error']}, 1, 0]})):
+        writer.replace(row)
+    # Las lecturas agregadas se suman ($inc) a lo que ya dejó UserActivity.
+    for row in grouped_rows(grouped(
+            UserActivityAggregate._meta.db_table, 'minute', '$count', '$error_count')):
+        writer.add(row)
+    return writer.delete_stale(day_match)
+
+
+def summarize(days, user_id=None):
+    """
+    Filas del rollup de los últimos `days` días (incluido hoy), con la tasa
+    de error, de la más reciente a la más antigua.
+    """
+    today = timezone.localdate()
+    match = {'day': {'$gte': rollup_day(today - timedelta(days=days - 1))}}
+    if user_id is not None:
+        match['user_id'] = user_id
+    rows = get_collection(UserActivityDailyRollup._meta.db_table).find(
+        match, {'_id': 0}, sort=[('day', -1), ('user_id', 1), ('action_type', 1)])
+    return [{
+        'user': row['user_id'],
+        'day': row['day'].date(),
+        'action_type': row['action_type'],
+        'count': row['count'],
+        'error_count': row['error_count'],
+        'error_rate': round(row['error_count'] / row['count'], 4) if row['count'] else 0,
+    } for row in rows]
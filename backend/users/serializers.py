@@ -6,6 +6,7 @@ from bson import ObjectId
 from .models import User, UserActivity
 import re
 from django.utils.crypto import get_random_string
+from django.utils import timezone
 
 class ObjectIdField(serializers.Field):
     """Campo personalizado para manejar ObjectId de MongoDB."""
@@ -143,6 +144,11 @@ class UserActivitySerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     id = ObjectIdField(read_only=True)
     object_id = ObjectIdField(read_only=True)
+    data = serializers.SerializerMethodField()
+    user_agent = serializers.CharField(read_only=True)
+    # date y time se derivan de timestamp, que es lo único que se guarda
+    date = serializers.SerializerMethodField()
+    time = serializers.SerializerMethodField()
 
     class Meta:
         model = UserActivity
@@ -150,6 +156,17 @@ class UserActivitySerializer(serializers.ModelSerializer):
                   'content_type', 'object_id', 'data', 
                   'ip_address', 'user_agent', 'date', 'time','timestamp'] 
 
+    def get_data(self, obj):
+        if obj.path_id is None:
+            return obj.data
+        return {'path': obj.path.value, **(obj.data or {})}
+
+    def get_date(self, obj):
+        return timezone.localtime(obj.timestamp).date()
+
+    def get_time(self, obj):
+        return timezone.localtime(obj.timestamp).time().replace(microsecond=0)
+
 class ChangePasswordSerializer(serializers.Serializer):
     password = serializers.CharField(write_only=True)
     confirmPassword = serializers.CharField(write_only=True)
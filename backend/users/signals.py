@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save
+
+from backend.cache import bump_version
+from . import rollups
+from .models import User, UserActivity
+
+
+# Invalida las respuestas cacheadas de métricas de usuarios
+def bump_users_version(sender, **kwargs):
+    bump_version('users')
+
+
+post_save.connect(bump_users_version, sender=User)
+post_delete.connect(bump_users_version, sender=User)
+
+
+# La actividad creada con el ORM (el sink escribe directo) también suma al rollup
+def add_activity_to_rollup(sender, instance, created, **kwargs):
+    if created:
+        delta = rollups.ActivityRollupDelta()
+        delta.add(instance.user_id, instance.timestamp, instance.action_type,
+                  errors=int(instance.status_type == 'error'))
+        rollups.record(delta)
+
+
+post_save.connect(add_activity_to_rollup, sender=UserActivity)
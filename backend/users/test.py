@@ -1,11 +1,21 @@
 from datetime import datetime, timedelta
+from io import StringIO
 from rest_framework.test import APITestCase
-from django.test import RequestFactory, TestCase
+from django.test import RequestFactory, TestCase, override_settings
 from rest_framework import status
 from django.urls import reverse
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth import get_user_model
-from users.models import UserActivity
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from backend.mongo import get_collection
+from users.activity import ActivitySink, record_activity
+from users.models import UserActivity, UserActivityAggregate, UserActivityDailyRollup
+from users.pagination import CustomPagination
+from users.rollups import rebuild
 User = get_user_model()
 
 def generar_rut_valido(base_numero):
@@ -120,6 +130,106 @@ class UserAPITest(APITestCase):
         self.assertEqual(len(response.data["results"]), 5)
         self.assertEqual(response.data["info"]["current_page"], 1)
 
+    def test_cursor_pagination_walks_all_pages(self):
+        for i in range(12):
+            User.objects.create_user(
+                username=f'user{i:02d}',
+                password='pass1234',
+                national_id=generar_rut_valido(20000000 + i),
+                email=f'user{i}@example.com',
+                position='Vendedor'
+            )
+        expected = sorted(User.objects.values_list('email', flat=True))
+
+        seen, pages = [], []
+        params = {'cursor': '', 'page_size': 5, 'ordering': 'email', 'with_count': 'true'}
+        while True:
+            response = self.client.get(self.create_url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['info']['count'], 13)
+            pages.append([user['email'] for user in response.data['results']])
+            seen.extend(pages[-1])
+            if not response.data['info']['next']:
+                break
+            params['cursor'] = response.data['info']['next']
+        self.assertEqual(seen, expected)
+
+        params['cursor'] = response.data['info']['previous']
+        response = self.client.get(self.create_url, params)
+        self.assertEqual([user['email'] for user in response.data['results']], pages[-2])
+
+    def test_cursor_pagination_with_nulls_and_several_keys(self):
+        for i in range(6):
+            user = User.objects.create_user(
+                username=f'user{i:02d}',
+                password='pass1234',
+                national_id=generar_rut_valido(20000000 + i),
+                email=f'user{i}@example.com',
+                position='Vendedor'
+            )
+            # La mitad sin last_login, y dos usuarios con el mismo valor
+            if i % 2:
+                user.last_login = timezone.make_aware(datetime(2024, 1, min(i, 3)))
+                user.save()
+        queryset = User.objects.order_by('-last_login', 'username')
+        expected = [user.pk for user in queryset]
+
+        paginator, seen, cursor = CustomPagination(), [], ''
+        while True:
+            request = Request(RequestFactory().get('/', {'cursor': cursor, 'page_size': 2}))
+            seen.extend(user.pk for user in paginator.paginate_queryset(queryset, request))
+            if not paginator.next_cursor:
+                break
+            cursor = paginator.next_cursor
+        self.assertEqual(seen, expected)
+
+        request = Request(RequestFactory().get('/', {'cursor': '', 'ordering': 'groups__name'}))
+        with self.assertRaises(ValidationError):
+            paginator.paginate_queryset(User.objects.order_by('groups__name'), request)
+
+    def test_cursor_pagination_rejects_invalid_token(self):
+        response = self.client.get(self.create_url, {'cursor': 'no-es-un-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_pagination_count_strategy(self):
+        cache.clear()
+        for i in range(3):
+            User.objects.create_user(
+                username=f'vendedor{i}',
+                password='pass1234',
+                national_id=generar_rut_valido(30000000 + i),
+                email=f'vendedor{i}@example.com',
+                position='Vendedor'
+            )
+
+        # Sin filtros: estimatedDocumentCount
+        response = self.client.get(self.create_url, {'page_size': 2})
+        self.assertFalse(response.data['info']['count_exact'])
+        self.assertEqual(response.data['info']['count'], 4)
+
+        # Con filtros: se cuenta la primera vez y luego se reutiliza
+        params = {'search': 'vendedor', 'page_size': 2}
+        response = self.client.get(self.create_url, params)
+        self.assertTrue(response.data['info']['count_exact'])
+        self.assertEqual(response.data['info']['count'], 3)
+        response = self.client.get(self.create_url, params)
+        self.assertFalse(response.data['info']['count_exact'])
+        self.assertEqual(len(response.data['results']), 2)
+
+        # La última página conoce el total exacto
+        response = self.client.get(self.create_url, {**params, 'page': 2})
+        self.assertTrue(response.data['info']['count_exact'])
+        self.assertEqual(response.data['info']['count'], 3)
+        self.assertEqual(len(response.data['results']), 1)
+
+        response = self.client.get(self.create_url, {**params, 'with_count': 'true'})
+        self.assertTrue(response.data['info']['count_exact'])
+
+        # El total cacheado de un usuario no se reutiliza para otro
+        self.client.force_authenticate(User.objects.get(username='vendedor0'))
+        response = self.client.get(self.create_url, params)
+        self.assertTrue(response.data['info']['count_exact'])
+
     def test_search_users_by_username(self):
         User.objects.create_user(
             username='johndoe',
@@ -237,6 +347,234 @@ class UserActivityModelTest(TestCase):
         self.assertEqual(activities[0].description, 'Third')
         self.assertEqual(activities[1].description, 'Second')
         self.assertEqual(activities[2].description, 'First')
+
+    @override_settings(ACTIVITY_REQUEST_DATA_MAX_BYTES=100)
+    def test_compact_storage(self):
+        """User agent y ruta se guardan una vez y request_data queda acotado"""
+        first = UserActivity.objects.create(
+            user=self.user, action_type='CREATE', description='Carga',
+            user_agent='Mozilla/5.0',
+            data={'path': '/api/inventory/products/', 'request_data': {'rows': 'x' * 500}})
+        second = UserActivity.objects.create(
+            user=self.user, action_type='VIEW', description='Ver',
+            user_agent='Mozilla/5.0', data={'path': '/api/inventory/products/'})
+
+        self.assertEqual(first.agent_id, second.agent_id)
+        self.assertEqual(first.path_id, second.path_id)
+        first = UserActivity.objects.get(pk=first.pk)
+        self.assertEqual(first.user_agent, 'Mozilla/5.0')
+        self.assertEqual(first.path.value, '/api/inventory/products/')
+        self.assertNotIn('path', first.data)
+        self.assertTrue(first.data['request_data']['truncated'])
+        self.assertLessEqual(len(first.data['request_data']['preview']), 100)
+
+
+    def test_cleanup_logins_on_legacy_and_compacted_documents(self):
+        """Los LOGIN espurios se cuentan por día desde timestamp, con o sin compactar"""
+        UserActivity.objects.create(
+            user=self.user, action_type='LOGIN', description='Ingreso',
+            data={'path': '/api/users/login/'})
+        compacted = [
+            UserActivity.objects.create(
+                user=self.user, action_type='LOGIN', description='Respuesta',
+                data={'path': '/api/sales/'})
+            for _ in range(2)
+        ]
+        get_collection(UserActivity._meta.db_table).insert_one({
+            'user_id': self.user.pk, 'action_type': 'LOGIN', 'description': 'Respuesta',
+            'timestamp': compacted[0].timestamp, 'data': {'path': '/api/sales/'},
+        })
+
+        call_command('cleanup_login_activity', '--collapse', stdout=StringIO())
+
+        logins = UserActivity.objects.filter(action_type='LOGIN')
+        self.assertEqual(logins.count(), 2)
+        self.assertEqual(
+            sorted(activity.data.get('collapsed', 0) for activity in logins), [0, 3])
+
+class ActivitySinkTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='admin',
+            password='adminpass123',
+            national_id='11111111-1',
+            email='admin@example.com',
+            position='Administrador'
+        )
+        self.sink = ActivitySink()
+        self.addCleanup(self.sink.close)
+
+    @override_settings(ACTIVITY_SINK={'ASYNC': True, 'BATCH_SIZE': 100, 'FLUSH_INTERVAL': 60})
+    def test_events_are_written_in_batches(self):
+        for i in range(3):
+            self.sink.record(user=self.user, action_type='VIEW', description=f'Ver {i}')
+        self.assertFalse(UserActivity.objects.exists())
+
+        self.sink.flush()
+        self.assertEqual(UserActivity.objects.filter(user=self.user).count(), 3)
+
+    @override_settings(ACTIVITY_SINK={
+        'ASYNC': True, 'MAX_QUEUE': 2, 'BATCH_SIZE': 100,
+        'FLUSH_INTERVAL': 60, 'OVERFLOW': 'drop_view'})
+    def test_drop_view_discards_views_before_other_events(self):
+        self.sink.record(user=self.user, action_type='VIEW', description='Ver')
+        self.sink.record(user=self.user, action_type='CREATE', description='Crear')
+        self.sink.record(user=self.user, action_type='DELETE', description='Eliminar')
+        self.sink.record(user=self.user, action_type='VIEW', description='Ver otra vez')
+        self.sink.flush()
+
+        self.assertEqual(self.sink.dropped, 2)
+        self.assertEqual(
+            sorted(UserActivity.objects.values_list('action_type', flat=True)),
+            ['CREATE', 'DELETE'])
+
+
+@override_settings(ACTIVITY_SINK={'ASYNC': False})
+class SessionActivityTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='admin',
+            password='adminpass123',
+            national_id='11111111-1',
+            email='admin@example.com',
+            position='Administrador'
+        )
+
+    def test_only_real_logins_and_logouts_are_recorded(self):
+        response = self.client.post(
+            reverse('knox_login'),
+            {'email': 'admin@example.com', 'password': 'adminpass123'},
+            format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {response.data['token']}")
+
+        self.client.get(reverse('user-list'))
+        self.client.get(reverse('user-list'))
+        self.assertEqual(UserActivity.objects.filter(action_type='LOGIN').count(), 1)
+
+        response = self.client.post(reverse('knox_logout'))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(UserActivity.objects.filter(action_type='LOGOUT').count(), 1)
+
+
+@override_settings(ACTIVITY_SINK={'ASYNC': False})
+class ActivityPolicyTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='admin',
+            password='adminpass123',
+            national_id='11111111-1',
+            email='admin@example.com',
+            position='Administrador',
+            is_staff=True
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_reads_are_kept_by_default(self):
+        self.client.get(reverse('user-list'))
+        self.assertEqual(UserActivity.objects.filter(action_type='VIEW').count(), 1)
+        self.assertFalse(UserActivityAggregate.objects.exists())
+
+    @override_settings(ACTIVITY_LOG_POLICIES=[
+        {'methods': ['GET', 'HEAD', 'OPTIONS'], 'policy': 'aggregate'},
+    ])
+    def test_reads_are_aggregated_per_minute_and_writes_kept(self):
+        self.client.get(reverse('user-list'))
+        self.client.get(reverse('user-list'))
+        self.client.post(reverse('user-list'), {
+            "username": "testuser",
+            "password": "securepass123",
+            "email": "test@example.com",
+            "national_id": generar_rut_valido(12345678),
+            "position": "Vendedor"
+        }, format='json')
+
+        self.assertFalse(UserActivity.objects.filter(action_type='VIEW').exists())
+        self.assertEqual(UserActivity.objects.filter(action_type='CREATE').count(), 1)
+        aggregate = UserActivityAggregate.objects.get(user=self.user)
+        self.assertEqual((aggregate.method, aggregate.count), ('GET', 2))
+
+    @override_settings(ACTIVITY_LOG_POLICIES=[
+        {'path': r'^/api/users/', 'methods': ['GET'], 'policy': 'sample', 'rate': 0},
+    ])
+    def test_sampled_and_unmatched_routes(self):
+        self.client.get(reverse('user-list'))
+        self.assertFalse(UserActivity.objects.exists())
+
+        self.client.get(reverse('product-list'))
+        self.assertEqual(UserActivity.objects.filter(action_type='VIEW').count(), 1)
+
+
+@override_settings(ACTIVITY_SINK={'ASYNC': False})
+class ActivityAnalyticsTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='admin',
+            password='adminpass123',
+            national_id='11111111-1',
+            email='admin@example.com',
+            position='Administrador',
+            is_staff=True
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_rollup_counts_actions_and_errors(self):
+        UserActivity.objects.create(
+            user=self.user, action_type='CREATE', description='Crear',
+            data={'status_type': 'success'})
+        record_activity(
+            user=self.user, action_type='CREATE', description='Crear',
+            data={'status_type': 'error'})
+        record_activity(
+            user=self.user, action_type='DELETE', description='Eliminar',
+            data={'status_type': 'success'})
+
+        response = self.client.get(reverse('useractivity-analytics'), {'days': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = {row['action_type']: row for row in response.data}
+        self.assertEqual(rows['CREATE']['count'], 2)
+        self.assertEqual(rows['CREATE']['error_rate'], 0.5)
+        self.assertEqual(rows['DELETE']['error_count'], 0)
+        self.assertEqual(rows['CREATE']['username'], 'admin')
+
+        response = self.client.get(reverse('useractivity-list'), {'data__status_type': 'error'})
+        self.assertEqual(
+            [activity['action_type'] for activity in response.data['results']], ['CREATE'])
+
+    def test_rebuild_replaces_rollup_from_activity(self):
+        UserActivity.objects.create(
+            user=self.user, action_type='CREATE', description='Crear',
+            data={'status_type': 'error'})
+        UserActivityAggregate.objects.create(
+            user=self.user, action_type='CREATE', method='POST', route='api/users/',
+            minute=timezone.now().replace(second=0, microsecond=0), count=3, error_count=1)
+        today = timezone.localdate()
+        rollup = UserActivityDailyRollup.objects.get(day=today, action_type='CREATE')
+        rollup.count = 50
+        rollup.save()
+        UserActivityDailyRollup.objects.create(
+            user=self.user, day=today, action_type='DELETE', count=4)
+
+        self.assertEqual(rebuild(today), 1)
+        rows = list(UserActivityDailyRollup.objects.values_list(
+            'action_type', 'count', 'error_count'))
+        self.assertEqual(rows, [('CREATE', 4, 2)])
+
+    def test_rebuild_without_start_keeps_archived_days(self):
+        UserActivity.objects.create(user=self.user, action_type='CREATE', description='Crear')
+        archived_day = timezone.localdate() - timedelta(days=400)
+        UserActivityDailyRollup.objects.create(
+            user=self.user, day=archived_day, action_type='LOGIN', count=7)
+
+        self.assertEqual(rebuild(), 1)
+        self.assertEqual(
+            UserActivityDailyRollup.objects.get(day=archived_day).count, 7)
+        self.assertTrue(UserActivityDailyRollup.objects.filter(
+            day=timezone.localdate(), action_type='CREATE', count=1).exists())
+
+    def test_invalid_days(self):
+        response = self.client.get(reverse('useractivity-analytics'), {'days': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
        
  
 """
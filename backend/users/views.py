@@ -1,3 +1,4 @@
+from bson import ObjectId
 from rest_framework import viewsets, permissions, filters
 from rest_framework.response import Response
 from rest_framework.decorators import action
@@ -6,9 +7,11 @@ from .filters import UserActivityFilter
 import django_filters.rest_framework
 from django_filters import UnknownFieldBehavior
 from .models import User, UserActivity
+from .rollups import summarize
 from .serializers import UserSerializer, UserActivitySerializer, ChangePasswordSerializer, AdministrationMetricsSerializer
 from .decorators import log_activity
 from .pagination import CustomPagination
+from backend.cache import cached_response
 from rest_framework import status
 
 
@@ -82,6 +85,7 @@ class UserViewSet(viewsets.ModelViewSet):
 
     @log_activity('VIEW', 'Ver metricas de la administración')
     @action(detail=False, methods=['get'])
+    @cached_response('users')
     def metrics(self, request):
 
         #Recoge el total de usuarios
@@ -123,7 +127,7 @@ class UserViewSet(viewsets.ModelViewSet):
 
 
 class UserActivityViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = UserActivity.objects.all()
+    queryset = UserActivity.objects.select_related('user', 'agent', 'path')
     serializer_class = UserActivitySerializer
     # cambiar a IsAdmin cuando se implemente autenticación
     permission_classes = (permissions.IsAdminUser,)
@@ -136,4 +140,34 @@ class UserActivityViewSet(viewsets.ReadOnlyModelViewSet):
     unknown_field_behavior = UnknownFieldBehavior.WARN
     ordering_fields = ['timestamp', 'user', 'action_type',]
     search_fields = ['description', 'user__first_name',
-                     'user__last_name', 'data__status_type']
+                     'user__last_name', 'status_type']
+
+    @action(detail=False, methods=['get'])
+    def analytics(self, request):
+        """
+        Acciones y tasa de error por usuario, día y tipo de acción, desde el
+        rollup diario. ?days=N (1-366, por defecto 30) y ?user=<id>.
+        """
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({"error": "days debe ser un número entero."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= days <= 366:
+            return Response({"error": "days debe estar entre 1 y 366."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        user_id = request.query_params.get('user')
+        if user_id is not None:
+            if not ObjectId.is_valid(user_id):
+                return Response({"error": "user no es un id válido."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            user_id = ObjectId(user_id)
+
+        rows = summarize(days, user_id)
+        usernames = dict(User.objects.filter(
+            pk__in={row['user'] for row in rows}).values_list('pk', 'username'))
+        for row in rows:
+            row['username'] = usernames.get(row['user'])
+            row['user'] = str(row['user'])
+        return Response(rows)